@@ -4,7 +4,7 @@ Address management with Google Maps integration.
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from api.fastjson import FastJsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
@@ -87,7 +87,7 @@ def geocode_address(request):
             country = data.get('country', 'LB')
             
             if not address:
-                return JsonResponse({'error': 'Address is required'}, status=400)
+                return FastJsonResponse({'error': 'Address is required'}, status=400)
             
             # OpenStreetMap Nominatim API
             base_url = getattr(settings, 'NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org')
@@ -131,7 +131,7 @@ def geocode_address(request):
                     'country': address_components.get('country', '')
                 }
                 
-                return JsonResponse({
+                return FastJsonResponse({
                     'success': True,
                     'latitude': location['lat'],
                     'longitude': location['lng'],
@@ -139,12 +139,12 @@ def geocode_address(request):
                     'address_components': parsed_components
                 })
             else:
-                return JsonResponse({'error': 'Address not found. Please try a more specific address.'}, status=400)
+                return FastJsonResponse({'error': 'Address not found. Please try a more specific address.'}, status=400)
                 
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            return FastJsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+    return FastJsonResponse({'error': 'Invalid request'}, status=400)
 
 
 @login_required
@@ -157,7 +157,7 @@ def reverse_geocode(request):
             longitude = data.get('longitude')
             
             if not latitude or not longitude:
-                return JsonResponse({'error': 'Latitude and longitude are required'}, status=400)
+                return FastJsonResponse({'error': 'Latitude and longitude are required'}, status=400)
             
             # OpenStreetMap Nominatim Reverse Geocoding API
             base_url = getattr(settings, 'NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org')
@@ -179,18 +179,18 @@ def reverse_geocode(request):
             data = response.json()
             
             if data and 'display_name' in data:
-                return JsonResponse({
+                return FastJsonResponse({
                     'success': True,
                     'formatted_address': data['display_name'],
                     'address_components': data.get('address', {})
                 })
             else:
-                return JsonResponse({'error': 'Location not found'}, status=400)
+                return FastJsonResponse({'error': 'Location not found'}, status=400)
                 
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            return FastJsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+    return FastJsonResponse({'error': 'Invalid request'}, status=400)
 
 
 @login_required
@@ -204,7 +204,7 @@ def find_nearby_stores(request):
             radius = data.get('radius', 10)  # Default 10km radius
             
             if not latitude or not longitude:
-                return JsonResponse({'error': 'Location is required'}, status=400)
+                return FastJsonResponse({'error': 'Location is required'}, status=400)
             
             # Get all store locations
             stores = StoreLocation.objects.filter(is_active=True)
@@ -236,15 +236,15 @@ def find_nearby_stores(request):
             # Sort by distance
             nearby_stores.sort(key=lambda x: x['distance'])
             
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': True,
                 'stores': nearby_stores
             })
             
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            return FastJsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+    return FastJsonResponse({'error': 'Invalid request'}, status=400)
 
 
 @login_required
@@ -314,7 +314,7 @@ def delivery_estimate(request):
             longitude = data.get('longitude')
             
             if not latitude or not longitude:
-                return JsonResponse({'error': 'Location is required'}, status=400)
+                return FastJsonResponse({'error': 'Location is required'}, status=400)
             
             # Find nearest store
             stores = StoreLocation.objects.filter(is_active=True)
@@ -341,7 +341,7 @@ def delivery_estimate(request):
                 else:
                     delivery_days = 3
                 
-                return JsonResponse({
+                return FastJsonResponse({
                     'success': True,
                     'delivery_days': delivery_days,
                     'nearest_store': {
@@ -350,9 +350,9 @@ def delivery_estimate(request):
                     }
                 })
             else:
-                return JsonResponse({'error': 'No stores available'}, status=400)
+                return FastJsonResponse({'error': 'No stores available'}, status=400)
                 
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            return FastJsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+    return FastJsonResponse({'error': 'Invalid request'}, status=400)
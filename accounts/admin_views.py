@@ -20,6 +20,7 @@ from .models import (
     Order, OrderItem, OrderFulfillment, Employee, CustomerSupport,
     ProductBundle, Analytics
 )
+from .rollups import daily_metric, REVENUE
 from products.models import Product, ProductReview, StockMovement, Category
 
 
@@ -51,16 +52,10 @@ def admin_dashboard(request):
     open_support_tickets = CustomerSupport.objects.filter(status='open').count()
     
     # Sales chart data (last 30 days)
-    sales_data = []
-    for i in range(30):
-        date = timezone.now().date() - timedelta(days=i)
-        daily_sales = Order.objects.filter(order_date__date=date).aggregate(
-            total=Sum('grand_total')
-        )['total'] or 0
-        sales_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'sales': float(daily_sales)
-        })
+    sales_data = [
+        {'date': day['date'].strftime('%Y-%m-%d'), 'sales': float(day['value'])}
+        for day in daily_metric(REVENUE, days=30)
+    ]
     
     context = {
         'total_customers': total_customers,
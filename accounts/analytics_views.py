@@ -11,10 +11,12 @@ from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 import json
-import csv
 from datetime import datetime, timedelta
 
 from .models import Order, OrderItem, CustomerLoyalty, Analytics, StoreLocation
+from .timeseries import daily_series
+from .exports import EXPORT_CHUNK_SIZE, export_response
+from .rollups import daily_metric, monthly_metric, NEW_CUSTOMERS, ORDER_COUNT, REVENUE
 from products.models import Product, ProductReview, StockMovement
 from django.contrib.auth.models import User
 
@@ -34,16 +36,10 @@ def analytics_dashboard(request):
     avg_order_value = total_sales / total_orders if total_orders > 0 else 0
     
     # Sales over time (last 30 days)
-    sales_over_time = []
-    for i in range(30):
-        date = timezone.now().date() - timedelta(days=i)
-        daily_sales = Order.objects.filter(
-            order_date__date=date
-        ).aggregate(total=Sum('grand_total'))['total'] or 0
-        sales_over_time.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'sales': float(daily_sales)
-        })
+    sales_over_time = [
+        {'date': day['date'].strftime('%Y-%m-%d'), 'sales': float(day['value'])}
+        for day in daily_metric(REVENUE, days=30)
+    ]
     
     # Top products
     top_products = OrderItem.objects.values(
@@ -66,18 +62,10 @@ def analytics_dashboard(request):
     ).order_by('-count')
     
     # Revenue by month
-    revenue_by_month = []
-    for i in range(12):
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        monthly_revenue = Order.objects.filter(
-            order_date__gte=month_start,
-            order_date__lt=month_end
-        ).aggregate(total=Sum('grand_total'))['total'] or 0
-        revenue_by_month.append({
-            'month': month_start.strftime('%Y-%m'),
-            'revenue': float(monthly_revenue)
-        })
+    revenue_by_month = [
+        {'month': month['date'].strftime('%Y-%m'), 'revenue': float(month['value'])}
+        for month in monthly_metric(REVENUE, months=12)
+    ]
     
     context = {
         'total_sales': total_sales,
@@ -119,18 +107,16 @@ def sales_analytics(request):
     avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
     
     # Sales by day
-    sales_by_day = []
-    for i in range(30):
-        date = timezone.now().date() - timedelta(days=i)
-        daily_sales = orders.filter(order_date__date=date).aggregate(
-            total=Sum('grand_total')
-        )['total'] or 0
-        daily_orders = orders.filter(order_date__date=date).count()
-        sales_by_day.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'revenue': float(daily_sales),
-            'orders': daily_orders
-        })
+    sales_by_day = [
+        {
+            'date': day['date'].strftime('%Y-%m-%d'),
+            'revenue': float(day['total']),
+            'orders': day['order_count'],
+        }
+        for day in daily_series(
+            orders, 'order_date', days=30, total=Sum('grand_total'), order_count=Count('uid')
+        )
+    ]
     
     # Top performing products
     top_products = OrderItem.objects.filter(
@@ -172,19 +158,10 @@ def sales_analytics(request):
 def customer_analytics(request):
     """Customer analytics and insights."""
     # Customer acquisition over time
-    customer_acquisition = []
-    for i in range(12):  # Last 12 months
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        new_customers = User.objects.filter(
-            date_joined__gte=month_start,
-            date_joined__lt=month_end,
-            is_staff=False
-        ).count()
-        customer_acquisition.append({
-            'month': month_start.strftime('%Y-%m'),
-            'customers': new_customers
-        })
+    customer_acquisition = [
+        {'month': month['date'].strftime('%Y-%m'), 'customers': int(month['value'])}
+        for month in monthly_metric(NEW_CUSTOMERS, months=12)
+    ]
     
     # Customer lifetime value
     customer_lifetime_value = CustomerLoyalty.objects.aggregate(
@@ -341,65 +318,44 @@ def inventory_analytics(request):
 @login_required
 @user_passes_test(is_staff_user)
 def export_analytics(request):
-    """Export analytics data to CSV."""
+    """Export analytics data as a streaming CSV or XLSX download."""
     report_type = request.GET.get('type', 'sales')
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{report_type}_report.csv"'
-    
-    writer = csv.writer(response)
-    
-    if report_type == 'sales':
-        writer.writerow(['Date', 'Orders', 'Revenue', 'Avg Order Value'])
-        
-        for i in range(30):
-            date = timezone.now().date() - timedelta(days=i)
-            orders = Order.objects.filter(order_date__date=date)
-            revenue = orders.aggregate(total=Sum('grand_total'))['total'] or 0
-            order_count = orders.count()
-            avg_order_value = revenue / order_count if order_count > 0 else 0
-            
-            writer.writerow([
-                date.strftime('%Y-%m-%d'),
-                order_count,
-                revenue,
-                avg_order_value
-            ])
-    
-    elif report_type == 'products':
-        writer.writerow(['Product', 'Category', 'Quantity Sold', 'Revenue'])
-        
-        products = OrderItem.objects.values(
+    if report_type == 'products':
+        header = ['Product', 'Category', 'Quantity Sold', 'Revenue']
+        rows = OrderItem.objects.values_list(
             'product__product_name',
-            'product__category__category_name'
+            'product__category__category_name',
         ).annotate(
             total_quantity=Sum('quantity'),
             total_revenue=Sum('product_price')
-        ).order_by('-total_quantity')
-        
-        for product in products:
-            writer.writerow([
-                product['product__product_name'],
-                product['product__category__category_name'],
-                product['total_quantity'],
-                product['total_revenue']
-            ])
+        ).order_by('-total_quantity').iterator(chunk_size=EXPORT_CHUNK_SIZE)
     
     elif report_type == 'customers':
-        writer.writerow(['Customer', 'Email', 'Total Spent', 'Orders', 'Tier'])
-        
-        customers = CustomerLoyalty.objects.select_related('user').order_by('-total_spent')
-        
-        for customer in customers:
-            writer.writerow([
-                customer.user.get_full_name(),
-                customer.user.email,
-                customer.total_spent,
-                customer.user.orders.count(),
-                customer.tier
-            ])
-    
-    return response
+        header = ['Customer', 'Email', 'Total Spent', 'Orders', 'Tier']
+        customers = CustomerLoyalty.objects.annotate(
+            order_count=Count('user__orders')
+        ).order_by('-total_spent').values_list(
+            'user__first_name', 'user__last_name', 'user__email', 'total_spent', 'order_count', 'tier'
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        rows = (
+            [f'{first_name} {last_name}'.strip(), email, total_spent, order_count, tier]
+            for first_name, last_name, email, total_spent, order_count, tier in customers
+        )
+    
+    else:
+        report_type = 'sales'
+        header = ['Date', 'Orders', 'Revenue', 'Avg Order Value']
+        rows = []
+        order_counts = daily_metric(ORDER_COUNT, days=30)
+        revenue_by_day = daily_metric(REVENUE, days=30, refresh_dirty=False)
+        for day, orders in zip(revenue_by_day, order_counts):
+            revenue = day['value']
+            order_count = int(orders['value'])
+            avg_order_value = revenue / order_count if order_count > 0 else 0
+            rows.append([day['date'].strftime('%Y-%m-%d'), order_count, revenue, avg_order_value])
+    
+    return export_response(f'{report_type}_report', header, rows, request.GET.get('format', 'csv'))
 
 
 @login_required
@@ -2,9 +2,15 @@
 Cart utility functions for handling both anonymous and authenticated users.
 """
 from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db.models import Sum
 from .models import Cart, CartItem
 from django.contrib.auth.models import User
 
+# Cart counts are cleared by accounts.signals whenever a cart or one of its
+# items changes, so they can be kept for a long time.
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
 
 def get_or_create_cart(request):
     """
@@ -84,15 +90,70 @@ def migrate_session_cart_to_user(request, user):
         return None
 
 
+def cart_count_cache_key(user_id=None, session_key=None):
+    if user_id:
+        return f'cart_count:user:{user_id}'
+    if session_key:
+        return f'cart_count:session:{session_key}'
+    return None
+
+
+def cached_cart_count(user_id=None, session_key=None):
+    """
+    Number of items in the unpaid cart of a user or session.
+
+    The count is summed in the database and cached until the cart changes;
+    nothing is created when there is no cart.
+    """
+    key = cart_count_cache_key(user_id, session_key)
+    if key is None:
+        return 0
+
+    count = cache.get(key)
+    if count is None:
+        items = CartItem.objects.filter(cart__is_paid=False)
+        if user_id:
+            items = items.filter(cart__user_id=user_id)
+        else:
+            items = items.filter(cart__session_key=session_key)
+        count = items.aggregate(total=Sum('quantity'))['total'] or 0
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+def invalidate_cart_count(cart):
+    """Forget the cached count of a cart's owner."""
+    keys = [
+        cart_count_cache_key(user_id=cart.user_id),
+        cart_count_cache_key(session_key=cart.session_key),
+    ]
+    cache.delete_many([key for key in keys if key])
+
+
+def get_cart_summary(request):
+    """
+    Cart summary for page chrome (badge counts), resolved once per request.
+
+    Unlike get_or_create_cart this never writes: visitors without a session
+    or without a cart simply have an empty summary.
+    """
+    summary = getattr(request, '_cart_summary', None)
+    if summary is None:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            count = cached_cart_count(user_id=user.pk)
+        else:
+            session = getattr(request, 'session', None)
+            count = cached_cart_count(session_key=session.session_key if session is not None else None)
+        summary = request._cart_summary = {'count': count}
+    return summary
+
+
 def get_cart_count(request):
     """
     Get the total number of items in the cart.
     """
-    try:
-        cart = get_or_create_cart(request)
-        return sum(item.quantity for item in cart.cart_items.all())
-    except:
-        return 0
+    return get_cart_summary(request)['count']
 
 
 def clear_session_cart(request):
@@ -6,6 +6,7 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.http import JsonResponse
 from django.core.paginator import Paginator
+from base.pagination import KeysetPaginator
 from django.db.models import Q, Sum, Count, Avg
 from django.utils import timezone
 from django.views.decorators.http import require_POST
@@ -15,6 +16,7 @@ import json
 from datetime import datetime, timedelta
 
 from .models import CustomerLoyalty, CustomerSupport, Order, Profile
+from .timeseries import monthly_series
 from products.models import Product, ProductReview
 from accounts.models import Wishlist, RecentlyViewed
 
@@ -99,10 +101,8 @@ def customer_list(request):
     if date_to:
         customers = customers.filter(date_joined__date__lte=date_to)
     
-    # Pagination
-    paginator = Paginator(customers, 25)
-    page_number = request.GET.get('page')
-    customers_page = paginator.get_page(page_number)
+    # Keyset pagination: deep pages cost the same as the first
+    customers_page = KeysetPaginator(customers, 25).get_page(request.GET.get('cursor'))
     
     context = {
         'customers': customers_page,
@@ -328,19 +328,12 @@ def my_support_tickets(request):
 def customer_analytics(request):
     """Customer analytics and insights."""
     # Customer acquisition over time
-    customer_acquisition = []
-    for i in range(12):  # Last 12 months
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        count = User.objects.filter(
-            date_joined__gte=month_start,
-            date_joined__lt=month_end,
-            is_staff=False
-        ).count()
-        customer_acquisition.append({
-            'month': month_start.strftime('%Y-%m'),
-            'count': count
-        })
+    customer_acquisition = [
+        {'month': month['date'].strftime('%Y-%m'), 'count': month['count']}
+        for month in monthly_series(
+            User.objects.filter(is_staff=False), 'date_joined', months=12, count=Count('id')
+        )
+    ]
     
     # Customer lifetime value analysis
     lifetime_values = CustomerLoyalty.objects.values('tier').annotate(
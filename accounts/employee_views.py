@@ -5,10 +5,12 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 from .models import Order, OrderItem
 from products.models import Product
+from products.stock import InsufficientStock, reserve_order_stock
 
 
 def is_employee(user):
@@ -78,36 +80,29 @@ def confirm_order(request, order_id):
         messages.warning(request, 'This order is already confirmed.')
         return redirect('employee_order_detail', order_id=order_id)
     
-    # Check stock availability before confirming
-    order_items = order.order_items.all()
-    stock_issues = []
-    
-    for order_item in order_items:
-        if not order_item.product.can_fulfill_order(order_item.quantity):
-            stock_issues.append(
-                f"{order_item.product.product_name}: Only {order_item.product.stock_quantity} available, "
-                f"but {order_item.quantity} requested."
-            )
-    
-    if stock_issues:
-        messages.error(request, 'Cannot confirm order due to stock issues:')
-        for issue in stock_issues:
-            messages.error(request, f'• {issue}')
-        return redirect('employee_order_detail', order_id=order_id)
-    
-    # Confirm the order and deduct stock
+    # Claim the order and deduct its stock in one transaction; a shortfall
+    # on any line rolls both back.
     try:
-        order.is_confirmed = True
-        order.status = 'confirmed'
-        order.confirmed_date = timezone.now()
-        order.save()
-        
-        # Deduct stock for each item
-        for order_item in order_items:
-            order_item.product.update_stock(-order_item.quantity)
-        
+        with transaction.atomic():
+            claimed = Order.objects.filter(pk=order.pk, is_confirmed=False).update(is_confirmed=True)
+            if not claimed:
+                messages.warning(request, 'This order is already confirmed.')
+                return redirect('employee_order_detail', order_id=order_id)
+
+            reserve_order_stock(order, user=request.user)
+
+            order.is_confirmed = True
+            order.status = 'confirmed'
+            order.confirmed_date = timezone.now()
+            order.save(update_fields=['is_confirmed', 'status', 'confirmed_date', 'updated_at'])
+
         messages.success(request, f'Order {order_id} confirmed and stock deducted.')
-        
+
+    except InsufficientStock as e:
+        messages.error(request, 'Cannot confirm order due to stock issues:')
+        for _, name, requested, available in e.shortages:
+            messages.error(request, f'• {name}: Only {available} available, but {requested} requested.')
+
     except Exception as e:
         messages.error(request, f'Error confirming order: {str(e)}')
     
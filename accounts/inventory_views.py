@@ -12,8 +12,13 @@ from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 import json
 
+from .exports import EXPORT_CHUNK_SIZE, export_response
 from .models import InventoryAlert, StoreLocation
 from products.models import Product, ProductVariant, StockMovement
+from products.stock import apply_stock_updates
+
+
+REPORT_PAGE_SIZE = 50
 
 
 def is_staff_user(user):
@@ -165,43 +170,13 @@ def bulk_stock_update(request):
             data = json.loads(request.body)
             updates = data.get('updates', [])
             
-            results = []
-            for update in updates:
-                product = get_object_or_404(Product, uid=update['product_id'])
-                movement_type = update.get('movement_type')
-                quantity = int(update.get('quantity', 0))
-                reason = update.get('reason', 'Bulk update')
-                
-                if movement_type == 'in':
-                    product.stock_quantity += quantity
-                elif movement_type == 'out':
-                    if product.stock_quantity < quantity:
-                        results.append({
-                            'product_id': str(product.uid),
-                            'error': 'Insufficient stock'
-                        })
-                        continue
-                    product.stock_quantity -= quantity
-                elif movement_type == 'adjustment':
-                    product.stock_quantity = quantity
-                
-                product.is_in_stock = product.stock_quantity > 0
-                product.save()
-                
-                # Create stock movement record
-                StockMovement.objects.create(
-                    product=product,
-                    movement_type=movement_type,
-                    quantity=quantity,
-                    reason=reason,
-                    user=request.user
-                )
-                
-                results.append({
-                    'product_id': str(product.uid),
-                    'success': True,
-                    'new_stock': product.stock_quantity
-                })
+            results = [
+                {
+                    key: value for key, value in result.items()
+                    if key in ('product_id', 'success', 'new_stock', 'error')
+                }
+                for result in apply_stock_updates(updates, user=request.user)
+            ]
             
             return JsonResponse({'results': results})
             
@@ -238,29 +213,44 @@ def stock_alerts(request):
 @login_required
 @user_passes_test(is_staff_user)
 def inventory_reports(request):
-    """Generate inventory reports."""
+    """Generate inventory reports; ?format=csv or xlsx downloads them."""
     report_type = request.GET.get('type', 'stock_levels')
+    file_format = request.GET.get('format')
     
-    if report_type == 'stock_levels':
-        products = Product.objects.all().order_by('stock_quantity')
+    if report_type in ('stock_levels', 'low_stock'):
+        products = Product.objects.select_related('category').order_by('stock_quantity')
+        if report_type == 'low_stock':
+            products = products.filter(stock_quantity__lte=F('low_stock_threshold'))
+        if file_format:
+            return export_response(
+                f'inventory_{report_type}',
+                ['Product', 'Category', 'Stock', 'Low Stock Threshold', 'In Stock'],
+                products.values_list(
+                    'product_name', 'category__category_name', 'stock_quantity',
+                    'low_stock_threshold', 'is_in_stock',
+                ).iterator(chunk_size=EXPORT_CHUNK_SIZE),
+                file_format,
+            )
         context = {
-            'products': products,
-            'report_type': 'stock_levels',
+            'products': Paginator(products, REPORT_PAGE_SIZE).get_page(request.GET.get('page')),
+            'report_type': report_type,
         }
     elif report_type == 'movements':
-        movements = StockMovement.objects.select_related('product').order_by('-created_at')
+        movements = StockMovement.objects.select_related('product', 'user').order_by('-created_at')
+        if file_format:
+            return export_response(
+                'inventory_movements',
+                ['Date', 'Product', 'Type', 'Quantity', 'Reason', 'Reference', 'User'],
+                movements.values_list(
+                    'created_at', 'product__product_name', 'movement_type', 'quantity',
+                    'reason', 'reference', 'user__username',
+                ).iterator(chunk_size=EXPORT_CHUNK_SIZE),
+                file_format,
+            )
         context = {
-            'movements': movements,
+            'movements': Paginator(movements, REPORT_PAGE_SIZE).get_page(request.GET.get('page')),
             'report_type': 'movements',
         }
-    elif report_type == 'low_stock':
-        products = Product.objects.filter(
-            stock_quantity__lte=F('low_stock_threshold')
-        ).order_by('stock_quantity')
-        context = {
-            'products': products,
-            'report_type': 'low_stock',
-        }
     else:
         context = {'report_type': 'overview'}
     
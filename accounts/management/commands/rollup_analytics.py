@@ -0,0 +1,47 @@
+"""
+Management command to materialize daily analytics rollups.
+
+Meant to run on a schedule (e.g. every few minutes from cron); only days
+whose orders or customers changed since their last rollup are recomputed.
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import Order
+from accounts.rollups import dirty_days, rollup_day
+
+
+class Command(BaseCommand):
+    help = 'Recompute dirty days of the Analytics rollup table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only check the last N days (default: the whole history)'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every day in range, dirty or not'
+        )
+
+    def handle(self, *args, **options):
+        end = timezone.localdate()
+        start = end - timedelta(days=options['days'] - 1) if options['days'] else None
+
+        if options['full']:
+            if start is None:
+                first_order = Order.objects.order_by('order_date').values_list('order_date', flat=True).first()
+                start = timezone.localtime(first_order).date() if first_order else end
+            days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        else:
+            days = dirty_days(start, end if start else None)
+
+        for day in days:
+            rollup_day(day)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rolled up {len(days)} day(s)')
+        )
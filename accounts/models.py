@@ -52,11 +52,8 @@ class Profile(BaseModel):
 
     def get_cart_count(self):
         """Get cart count for authenticated users"""
-        try:
-            cart = Cart.objects.get(user=self.user, is_paid=False)
-            return sum(item.quantity for item in cart.cart_items.all())
-        except Cart.DoesNotExist:
-            return 0
+        from .cart_utils import cached_cart_count
+        return cached_cart_count(user_id=self.user_id)
 
 
 class CustomerLoyalty(BaseModel):
@@ -153,22 +150,20 @@ class Cart(BaseModel):
             # Partial unique constraints are handled via database migration (0031)
         ]
 
-    def get_cart_total(self):
-        cart_items = self.cart_items.all()
-        total_price = 0
-
-        for cart_item in cart_items:
-            total_price += cart_item.get_product_price()
+    def get_pricing(self, fresh=False):
+        """Line totals, subtotal, discount and total, computed once per cart revision."""
+        from .pricing import cart_pricing
+        return cart_pricing(self, fresh=fresh)
 
-        return total_price
+    def get_cart_total(self):
+        return self.get_pricing()['subtotal']
 
     def get_cart_total_price_after_coupon(self):
-        total = self.get_cart_total()
+        return self.get_pricing()['total']
 
-        if self.coupon and total >= self.coupon.minimum_amount:
-            total -= self.coupon.discount_amount
-                    
-        return total
+    # Names used by the cart template.
+    get_total_price = get_cart_total
+    get_final_total = get_cart_total_price_after_coupon
 
 
 class CartItem(BaseModel):
@@ -179,16 +174,18 @@ class CartItem(BaseModel):
     quantity = models.IntegerField(default=1)
 
     def get_product_price(self):
-        price = self.product.price * self.quantity
+        price = self.product.price * self.quantity if self.product else 0
 
         if self.color_variant:
             price += self.color_variant.price
-            
-        if self.size_variant:
-            price += self.size_variant.price
-        
+
         return price
 
+    def get_total_price(self):
+        """Line total from the cart's pricing, falling back to this row."""
+        line_total = self.cart.get_pricing()['lines'].get(str(self.pk))
+        return self.get_product_price() if line_total is None else line_total
+
 
 class Employee(BaseModel):
     """Employee model for order management."""
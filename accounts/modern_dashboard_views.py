@@ -7,6 +7,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from django.db.models import Count, Sum, Q
 from accounts.models import Order
+from accounts.timeseries import daily_series
 from products.models import Product
 
 
@@ -59,14 +60,14 @@ def modern_order_dashboard(request):
     }
     
     # Revenue data for chart (last 7 days)
-    revenue_data = []
-    for i in range(7):
-        date = current_date - timedelta(days=6-i)
-        daily_revenue = Order.objects.filter(
-            order_date__date=date,
-            status__in=['confirmed', 'processing', 'shipped', 'delivered']
-        ).aggregate(total=Sum('grand_total'))['total'] or 0
-        revenue_data.append(int(daily_revenue))
+    revenue_data = [
+        int(day['total'])
+        for day in daily_series(
+            Order.objects.filter(status__in=['confirmed', 'processing', 'shipped', 'delivered']),
+            'order_date', days=7, end=current_date.date(), newest_first=False,
+            total=Sum('grand_total'),
+        )
+    ]
     
     # Delivery tracking orders
     delivery_orders = Order.objects.filter(
@@ -5,7 +5,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.http import JsonResponse
-from django.core.paginator import Paginator
+from base.pagination import KeysetPaginator
 from django.db.models import Q, Sum, Count, F
 from django.utils import timezone
 from django.views.decorators.http import require_POST
@@ -15,6 +15,7 @@ import json
 from datetime import datetime, timedelta
 
 from .models import Order, OrderItem, OrderFulfillment, CustomerSupport
+from .timeseries import daily_series
 from products.models import Product, StockMovement
 
 
@@ -102,10 +103,8 @@ def order_list(request):
             Q(user__last_name__icontains=search_query)
         )
     
-    # Pagination
-    paginator = Paginator(orders, 25)
-    page_number = request.GET.get('page')
-    orders_page = paginator.get_page(page_number)
+    # Keyset pagination: deep pages cost the same as the first
+    orders_page = KeysetPaginator(orders, 25).get_page(request.GET.get('cursor'))
     
     # Get employees for filter
     employees = User.objects.filter(is_staff=True)
@@ -288,18 +287,14 @@ def update_fulfillment_status(request, order_id):
 def order_analytics(request):
     """Order analytics and reporting."""
     # Order volume over time
-    order_volume = []
-    for i in range(30):  # Last 30 days
-        date = timezone.now().date() - timedelta(days=i)
-        count = Order.objects.filter(order_date__date=date).count()
-        order_volume.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'count': count
-        })
+    order_volume = [
+        {'date': day['date'].strftime('%Y-%m-%d'), 'count': day['count']}
+        for day in daily_series(Order.objects.all(), 'order_date', days=30, count=Count('uid'))
+    ]
     
     # Order status distribution
     status_distribution = Order.objects.values('status').annotate(
-        count=Count('id')
+        count=Count('uid')
     ).order_by('-count')
     
     # Average order value
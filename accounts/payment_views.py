@@ -31,7 +31,7 @@ def create_payment_intent(request):
     
     try:
         cart = get_object_or_404(Cart, user=request.user, is_paid=False)
-        total_amount = cart.get_cart_total_price_after_coupon()
+        total_amount = cart.get_pricing(fresh=True)['total']
         
         # Convert to cents (Stripe expects amount in cents)
         amount_cents = int(total_amount * 100)
@@ -0,0 +1,89 @@
+"""
+Cart pricing computed in one query and memoized per cart revision.
+
+A revision ends whenever the cart or one of its items is saved or deleted
+(see accounts.signals), which clears both the copy memoized on the Cart
+instance and the cached copy shared between requests. It also ends when a
+product in the cart changes: the cached copy carries the versions of its
+products' ``product:<pk>`` cache tags and is recomputed once one moved, so
+the cart shows the price checkout will charge.
+"""
+from django.core.cache import cache
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+from api.cache_utils import get_tag_versions
+
+CART_PRICING_TIMEOUT = 60 * 5
+
+
+def cart_pricing_cache_key(cart_pk):
+    return f'cart_pricing:{cart_pk}'
+
+
+def compute_cart_pricing(cart):
+    """
+    Line totals, subtotal, coupon discount and grand total of a cart.
+
+    Each line is the product price times the quantity plus the colour
+    surcharge, computed by the database for all lines at once.
+    """
+    from .models import CartItem
+
+    lines = CartItem.objects.filter(cart=cart).annotate(
+        line_total=Coalesce(F('product__price'), Value(0)) * F('quantity')
+        + Coalesce(F('color_variant__price'), Value(0)),
+    ).values_list('pk', 'product_id', 'quantity', 'line_total')
+
+    line_totals = {}
+    product_ids = set()
+    subtotal = 0
+    item_count = 0
+    for pk, product_id, quantity, line_total in lines:
+        line_totals[str(pk)] = line_total
+        product_ids.add(product_id)
+        subtotal += line_total
+        item_count += quantity
+
+    discount = 0
+    coupon = cart.coupon
+    if coupon and subtotal >= coupon.minimum_amount:
+        discount = coupon.discount_amount
+
+    return {
+        'lines': line_totals,
+        'line_count': len(line_totals),
+        'item_count': item_count,
+        'subtotal': subtotal,
+        'discount': discount,
+        'total': subtotal - discount,
+        'versions': get_tag_versions(f'product:{product_id}' for product_id in product_ids if product_id),
+    }
+
+
+def cart_pricing(cart, fresh=False):
+    """
+    Pricing of a cart, computed at most once per cart revision.
+
+    Pass fresh=True where the numbers are charged (order creation, payment)
+    to skip the shared cache.
+    """
+    if not fresh:
+        pricing = getattr(cart, '_pricing', None)
+        if pricing is not None:
+            return pricing
+        pricing = cache.get(cart_pricing_cache_key(cart.pk))
+        if pricing is not None and get_tag_versions(pricing['versions']) == pricing['versions']:
+            cart._pricing = pricing
+            return pricing
+
+    pricing = compute_cart_pricing(cart)
+    cache.set(cart_pricing_cache_key(cart.pk), pricing, CART_PRICING_TIMEOUT)
+    cart._pricing = pricing
+    return pricing
+
+
+def invalidate_cart_pricing(cart):
+    """End the current pricing revision of a cart."""
+    cart.__dict__.pop('_pricing', None)
+    cache.delete(cart_pricing_cache_key(cart.pk))
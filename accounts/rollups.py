@@ -0,0 +1,226 @@
+"""
+Daily analytics rollups materialized into the Analytics table.
+
+Each day gets one Analytics row per metric. Rows are rewritten whenever the
+day is dirty, i.e. an order or customer of that day changed after the row
+was written, so dashboards read a few hundred small rows instead of scanning
+the order history. Writes only mark days dirty; the rows are recomputed by
+the rollup_analytics command and by dashboard reads of the dirty window.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Analytics, Order, OrderItem
+from .timeseries import date_range_filter, month_starts
+
+REVENUE = 'revenue'
+ORDER_COUNT = 'order_count'
+AOV = 'aov'
+NEW_CUSTOMERS = 'new_customers'
+UNITS_BY_PRODUCT = 'units_by_product'
+CATEGORY_REVENUE = 'category_revenue'
+
+METRICS = [REVENUE, ORDER_COUNT, AOV, NEW_CUSTOMERS, UNITS_BY_PRODUCT, CATEGORY_REVENUE]
+
+CENTS = Decimal('0.01')
+
+
+def compute_day(day):
+    """Compute every metric of one day; returns {metric: (value, metadata)}."""
+    bounds = date_range_filter('order_date', day, day)
+
+    by_status = Order.objects.order_by().filter(**bounds).values('status').annotate(
+        count=Count('uid'), total=Sum('grand_total'),
+    )
+    revenue = Decimal(0)
+    order_count = 0
+    status_counts = {}
+    for row in by_status:
+        revenue += row['total'] or 0
+        order_count += row['count']
+        status_counts[row['status']] = row['count']
+
+    items = OrderItem.objects.order_by().filter(
+        **{f'order__{name}': value for name, value in bounds.items()}
+    ).values(
+        'product_id', 'product__product_name', 'product__category__category_name',
+    ).annotate(units=Sum('quantity'), revenue=Sum('product_price'))
+
+    units_by_product = {}
+    category_revenue = defaultdict(float)
+    total_units = 0
+    for row in items:
+        units = row['units'] or 0
+        line_revenue = float(row['revenue'] or 0)
+        key = str(row['product_id']) if row['product_id'] else 'deleted'
+        entry = units_by_product.setdefault(key, {
+            'name': row['product__product_name'] or 'Deleted product', 'units': 0, 'revenue': 0.0,
+        })
+        entry['units'] += units
+        entry['revenue'] += line_revenue
+        category_revenue[row['product__category__category_name'] or 'Uncategorized'] += line_revenue
+        total_units += units
+
+    new_customers = User.objects.filter(
+        is_staff=False, **date_range_filter('date_joined', day, day)
+    ).count()
+
+    aov = (revenue / order_count) if order_count else Decimal(0)
+    return {
+        REVENUE: (revenue, {}),
+        ORDER_COUNT: (order_count, {'by_status': status_counts}),
+        AOV: (aov, {}),
+        NEW_CUSTOMERS: (new_customers, {}),
+        UNITS_BY_PRODUCT: (total_units, {'products': units_by_product}),
+        CATEGORY_REVENUE: (sum(category_revenue.values()), {'categories': dict(category_revenue)}),
+    }
+
+
+def rollup_day(day):
+    """Recompute and store the Analytics rows of one day."""
+    rows = [
+        Analytics(
+            date=day,
+            metric_type=metric,
+            value=Decimal(str(value)).quantize(CENTS),
+            metadata=metadata,
+        )
+        for metric, (value, metadata) in compute_day(day).items()
+    ]
+    Analytics.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['date', 'metric_type'],
+        update_fields=['value', 'metadata', 'updated_at'],
+    )
+
+
+def dirty_days(start=None, end=None):
+    """
+    Days whose rollup rows are missing or older than the data they summarize.
+
+    Orders are compared on updated_at, customers on their daily count, and
+    days whose orders or customers disappeared are caught by having a
+    non-zero row with nothing left behind it. Restrict to start..end to keep
+    the check cheap on a dashboard request.
+    """
+    orders = Order.objects.order_by()
+    users = User.objects.filter(is_staff=False)
+    rolled = Analytics.objects.filter(metric_type__in=[ORDER_COUNT, NEW_CUSTOMERS])
+    if start and end:
+        orders = orders.filter(**date_range_filter('order_date', start, end))
+        users = users.filter(**date_range_filter('date_joined', start, end))
+        rolled = rolled.filter(date__gte=start, date__lte=end)
+
+    last_change = {
+        row['day']: row['last_change']
+        for row in orders.annotate(day=TruncDate('order_date')).values('day').annotate(
+            last_change=Max('updated_at')
+        )
+    }
+    joined = {
+        row['day']: row['count']
+        for row in users.order_by().annotate(day=TruncDate('date_joined')).values('day').annotate(
+            count=Count('id')
+        )
+    }
+    rolled_orders = {}
+    rolled_customers = {}
+    for row in rolled.values('date', 'metric_type', 'value', 'updated_at'):
+        target = rolled_orders if row['metric_type'] == ORDER_COUNT else rolled_customers
+        target[row['date']] = row
+
+    dirty = set()
+    for day, changed_at in last_change.items():
+        row = rolled_orders.get(day)
+        if row is None or changed_at > row['updated_at']:
+            dirty.add(day)
+    for day, count in joined.items():
+        row = rolled_customers.get(day)
+        if row is None or row['value'] != count:
+            dirty.add(day)
+    for day, row in rolled_orders.items():
+        if row['value'] and day not in last_change:
+            dirty.add(day)
+    for day, row in rolled_customers.items():
+        if row['value'] and day not in joined:
+            dirty.add(day)
+    return sorted(dirty)
+
+
+def refresh(start=None, end=None):
+    """Roll up every dirty day (within start..end if given); returns the days."""
+    days = dirty_days(start, end)
+    for day in days:
+        rollup_day(day)
+    return days
+
+
+def daily_metric(metric, days=30, end=None, newest_first=True, refresh_dirty=True):
+    """
+    Stored values of a metric for the ``days`` days ending on ``end`` (today),
+    zero-filled, after refreshing dirty days in that window unless the
+    caller just did (``refresh_dirty=False``).
+
+    Returns [{'date': date, 'value': Decimal, 'metadata': dict}, ...].
+    """
+    end = end or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    if refresh_dirty:
+        refresh(start, end)
+    stored = {
+        row['date']: row
+        for row in Analytics.objects.filter(
+            metric_type=metric, date__gte=start, date__lte=end
+        ).values('date', 'value', 'metadata')
+    }
+    buckets = [end - timedelta(days=i) for i in range(days)]
+    if not newest_first:
+        buckets.reverse()
+    return [
+        {'date': day, 'value': stored.get(day, {}).get('value', Decimal(0)),
+         'metadata': stored.get(day, {}).get('metadata', {})}
+        for day in buckets
+    ]
+
+
+def monthly_metric(metric, months=12, end=None, newest_first=True):
+    """Sum of an additive metric per calendar month, like daily_metric."""
+    end = end or timezone.localdate()
+    starts = month_starts(months, end)
+    refresh(starts[-1], end)
+    totals = defaultdict(Decimal)
+    for row in Analytics.objects.filter(
+        metric_type=metric, date__gte=starts[-1], date__lte=end
+    ).values('date', 'value'):
+        totals[row['date'].replace(day=1)] += row['value']
+    if not newest_first:
+        starts.reverse()
+    return [{'date': month, 'value': totals.get(month, Decimal(0))} for month in starts]
+
+
+# Written over the updated_at of a day's ORDER_COUNT row to mark the day
+# dirty; any order of the day is newer, and an emptied day has a non-zero
+# row with nothing behind it.
+DIRTY_SINCE = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def day_of(moment):
+    return timezone.localtime(moment).date()
+
+
+def mark_dirty(day):
+    """
+    Flag ``day`` for the next refresh (dashboard read or rollup_analytics).
+
+    For changes dirty_days cannot see on its own: order items, and orders
+    deleted from a day that still has others. One UPDATE; nothing is
+    recomputed in the writing request.
+    """
+    Analytics.objects.filter(date=day, metric_type=ORDER_COUNT).update(updated_at=DIRTY_SINCE)
@@ -1,9 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in
-from accounts.models import Profile
-from .cart_utils import migrate_session_cart_to_user
+from accounts.models import Profile, Order, OrderItem, Cart, CartItem
+from api.cache_utils import bump_tags, order_tags
+from .rollups import day_of, mark_dirty
+from .cart_utils import migrate_session_cart_to_user, invalidate_cart_count
+from .pricing import invalidate_cart_pricing
 
 
 @receiver(post_save, sender=User)
@@ -17,6 +20,66 @@ def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
 
 
+@receiver(post_save, sender=Order)
+def invalidate_order_cache(sender, instance, **kwargs):
+    """
+    Drop cached views of an order and of its customer's order history.
+    """
+    bump_tags(*order_tags(instance))
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def invalidate_order_item_cache(sender, instance, **kwargs):
+    """
+    Order items are rendered as part of their order.
+    """
+    try:
+        order = instance.order
+    except Order.DoesNotExist:
+        return
+    bump_tags(*order_tags(order))
+
+
+@receiver(post_delete, sender=Order)
+def mark_order_day_dirty(sender, instance, **kwargs):
+    """
+    A deleted order leaves no newer updated_at behind: flag its day for the
+    next analytics refresh. Saved orders and new customers are noticed by
+    rollups.dirty_days on their own.
+    """
+    if instance.order_date:
+        mark_dirty(day_of(instance.order_date))
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def mark_order_item_day_dirty(sender, instance, **kwargs):
+    try:
+        order_date = instance.order.order_date
+    except Order.DoesNotExist:
+        return
+    mark_dirty(day_of(order_date))
+
+
+@receiver([post_save, post_delete], sender=Cart)
+def invalidate_cart_on_change(sender, instance, **kwargs):
+    """
+    Paying for, deleting or handing over a cart changes whose count it is;
+    applying a coupon changes its pricing.
+    """
+    invalidate_cart_count(instance)
+    invalidate_cart_pricing(instance)
+
+
+@receiver([post_save, post_delete], sender=CartItem)
+def invalidate_cart_on_item_change(sender, instance, **kwargs):
+    try:
+        cart = instance.cart
+    except Cart.DoesNotExist:
+        return
+    invalidate_cart_count(cart)
+    invalidate_cart_pricing(cart)
+
+
 @receiver(user_logged_in)
 def migrate_cart_on_login(sender, request, user, **kwargs):
     """
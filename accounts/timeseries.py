@@ -0,0 +1,75 @@
+"""
+Time-series helpers for dashboards.
+
+Each series is one GROUP BY query over a date range; days or months with no
+rows are filled with zeros in Python so charts always get a full axis.
+"""
+from datetime import datetime, time, timedelta
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+
+def date_range_filter(date_field, start, end):
+    """Index-friendly datetime bounds covering the dates start..end."""
+    tz = timezone.get_current_timezone()
+    return {
+        f'{date_field}__gte': timezone.make_aware(datetime.combine(start, time.min), tz),
+        f'{date_field}__lt': timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    }
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _series(queryset, date_field, trunc, buckets, start, end, aggregates):
+    rows = (
+        queryset.order_by()
+        .filter(**date_range_filter(date_field, start, end))
+        .annotate(bucket=trunc(date_field))
+        .values('bucket')
+        .annotate(**aggregates)
+    )
+    found = {_as_date(row.pop('bucket')): row for row in rows}
+    zeros = {name: 0 for name in aggregates}
+    return [
+        {'date': bucket, **zeros, **{k: v or 0 for k, v in found.get(bucket, {}).items()}}
+        for bucket in buckets
+    ]
+
+
+def daily_series(queryset, date_field, days=30, end=None, newest_first=True, **aggregates):
+    """
+    Per-day aggregates for the ``days`` days ending on ``end`` (today).
+
+    Example:
+        daily_series(Order.objects.all(), 'order_date', revenue=Sum('grand_total'))
+        -> [{'date': date(...), 'revenue': Decimal(...)}, ...]
+    """
+    end = end or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    buckets = [end - timedelta(days=i) for i in range(days)]
+    if not newest_first:
+        buckets.reverse()
+    return _series(queryset, date_field, TruncDate, buckets, start, end, aggregates)
+
+
+def month_starts(months=12, end=None):
+    """First day of each of the last ``months`` calendar months, newest first."""
+    end = end or timezone.localdate()
+    year, month = end.year, end.month
+    starts = []
+    for _ in range(months):
+        starts.append(end.replace(year=year, month=month, day=1))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return starts
+
+
+def monthly_series(queryset, date_field, months=12, end=None, newest_first=True, **aggregates):
+    """Per-calendar-month aggregates for the last ``months`` months, like daily_series."""
+    end = end or timezone.localdate()
+    buckets = month_starts(months, end)
+    start = buckets[-1]
+    if not newest_first:
+        buckets.reverse()
+    return _series(queryset, date_field, TruncMonth, buckets, start, end, aggregates)
@@ -7,6 +7,8 @@ from django.utils import timezone
 from products.models import *
 from django.urls import reverse
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.contrib import messages
 from django.http import JsonResponse
 from home.models import ShippingAddress
@@ -299,6 +301,11 @@ def cart(request):
         messages.success(request, 'Order placed successfully! Pay on delivery.')
         return redirect('order_details', order_id=order.order_id)
 
+    prefetch_related_objects([cart_obj], Prefetch(
+        'cart_items',
+        CartItem.objects.select_related('product', 'size_variant', 'color_variant')
+        .prefetch_related('product__color_variant'),
+    ))
     context = {
         'cart': cart_obj,
         'quantity_range': range(1, 6),
@@ -449,26 +456,30 @@ def order_history(request):
 
 
 # Create an order view
+@transaction.atomic
 def create_order(cart):
     # Generate a unique order ID for COD orders
     import uuid
     order_id = f"COD_{uuid.uuid4().hex[:8].upper()}"
     
     # Check stock availability before creating order (but don't deduct yet)
-    cart_items = CartItem.objects.filter(cart=cart)
+    cart_items = CartItem.objects.filter(cart=cart).select_related(
+        'product', 'size_variant', 'color_variant',
+    )
     for cart_item in cart_items:
         if not cart_item.product.can_fulfill_order(cart_item.quantity):
             raise ValueError(f"Not enough stock for {cart_item.product.product_name}. Only {cart_item.product.stock_quantity} available.")
     
+    pricing = cart.get_pricing(fresh=True)
     order, created = Order.objects.get_or_create(
         user=cart.user,
         order_id=order_id,
         payment_status="Pending",
         shipping_address=cart.user.profile.shipping_address,
         payment_mode="Cash on Delivery",
-        order_total_price=cart.get_cart_total(),
+        order_total_price=pricing['subtotal'],
         coupon=cart.coupon,
-        grand_total=cart.get_cart_total_price_after_coupon(),
+        grand_total=pricing['total'],
         status='pending',  # Order starts as pending
         is_confirmed=False,  # Not confirmed yet
     )
@@ -481,7 +492,7 @@ def create_order(cart):
             size_variant=cart_item.size_variant,
             color_variant=cart_item.color_variant,
             quantity=cart_item.quantity,
-            product_price=cart_item.get_product_price()
+            product_price=pricing['lines'].get(str(cart_item.pk), cart_item.get_product_price())
         )
         
         # NOTE: Stock will be deducted only when employee confirms the order
@@ -0,0 +1,506 @@
+"""
+Cache backends for the shop.
+
+TieredCache keeps a bounded LRU of hot entries inside each worker process
+(L1) in front of a shared cache that every worker can see (L2).  The shared
+tier is any other configured cache alias: Redis in production, or the
+SQLiteCache below when no Redis server is available (development, tests and
+single-host deployments where all gunicorn workers share a disk).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+
+_MISSING = object()
+
+# L1 stores are shared by every thread of a process, keyed by LOCATION,
+# the same way Django's LocMemCache keeps its module level dictionaries.
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class _LocalTier:
+    """Bounded in-process LRU plus the counters and locks of one TieredCache."""
+
+    STRIPES = 64
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.flight_locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'l1_hits': 0,
+            'l2_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'deletes': 0,
+            'evictions': 0,
+            'computes': 0,
+            'stampede_waits': 0,
+            'stampede_timeouts': 0,
+        }
+
+    def count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires, payload = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key, value, ttl):
+        if ttl is not None and ttl <= 0:
+            self.delete(key)
+            return
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = time.monotonic() + ttl if ttl is not None else None
+        evicted = 0
+        with self.lock:
+            self.entries[key] = (expires, payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self.count('evictions', evicted)
+
+    def delete(self, key):
+        with self.lock:
+            return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def flight_lock(self, key):
+        return self.flight_locks[zlib.crc32(key.encode()) % self.STRIPES]
+
+
+class TieredCache(BaseCache):
+    """
+    Per-process LRU (L1) in front of a shared cache alias (L2).
+
+    OPTIONS:
+        SHARED              alias of the shared cache (required)
+        L1_MAX_ENTRIES      size bound of the in-process LRU (default 1000)
+        L1_TIMEOUT          longest time an entry may live in L1, in seconds.
+                            This bounds how stale a worker can be after
+                            another worker deletes a key (default 30)
+        L1_BYPASS_PREFIXES  keys starting with these never enter L1; used for
+                            counters, locks and invalidation versions that
+                            must always be read from the shared tier
+        LOCK_TIMEOUT        how long a recompute lock is held at most (30)
+        LOCK_WAIT           how long other workers wait for a recompute
+                            before computing themselves (5)
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._shared_alias = options.pop('SHARED', None)
+        if not self._shared_alias:
+            raise ValueError("TieredCache needs OPTIONS['SHARED'] naming the shared cache alias.")
+        l1_max_entries = int(options.pop('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.pop('L1_TIMEOUT', 30))
+        self.bypass_prefixes = tuple(options.pop('L1_BYPASS_PREFIXES', ()))
+        self.lock_timeout = int(options.pop('LOCK_TIMEOUT', 30))
+        self.lock_wait = float(options.pop('LOCK_WAIT', 5))
+        self.lock_poll = float(options.pop('LOCK_POLL', 0.05))
+        super().__init__({**params, 'OPTIONS': options})
+
+        name = location or 'default'
+        with _local_tiers_lock:
+            local = _local_tiers.get(name)
+            if local is None:
+                local = _local_tiers[name] = _LocalTier(l1_max_entries)
+        self._local = local
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _use_l1(self, key):
+        return not (self.bypass_prefixes and key.startswith(self.bypass_prefixes))
+
+    def _l1_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        use_l1 = self._use_l1(key)
+        if use_l1:
+            value = self._local.get(l1_key)
+            if value is not _MISSING:
+                self._local.count('l1_hits')
+                return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._local.count('misses')
+            return default
+        self._local.count('l2_hits')
+        if use_l1:
+            self._local.set(l1_key, value, self.l1_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, self._shared_timeout(timeout), version=version)
+        self._local.count('sets')
+        if self._use_l1(key):
+            self._local.set(l1_key, value, self._l1_ttl(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        added = self.shared.add(key, value, self._shared_timeout(timeout), version=version)
+        if added:
+            self._local.count('sets')
+            if self._use_l1(key):
+                self._local.set(l1_key, value, self._l1_ttl(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        touched = self.shared.touch(key, self._shared_timeout(timeout), version=version)
+        if not touched:
+            self._local.delete(l1_key)
+        return touched
+
+    def delete(self, key, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self._local.delete(l1_key)
+        self._local.count('deletes')
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        if self._use_l1(key) and self._local.get(l1_key) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters live in the shared tier only so every worker sees them.
+        self._local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            l1_key = self.make_and_validate_key(key, version=version)
+            value = self._local.get(l1_key) if self._use_l1(key) else _MISSING
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if found:
+            self._local.count('l1_hits', len(found))
+        if missing:
+            shared_found = self.shared.get_many(missing, version=version)
+            self._local.count('l2_hits', len(shared_found))
+            self._local.count('misses', len(missing) - len(shared_found))
+            for key, value in shared_found.items():
+                if self._use_l1(key):
+                    self._local.set(self.make_and_validate_key(key, version=version), value, self.l1_timeout)
+            found.update(shared_found)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, self._shared_timeout(timeout), version=version)
+        ttl = self._l1_ttl(timeout)
+        for key, value in data.items():
+            if key not in failed and self._use_l1(key):
+                self._local.set(self.make_and_validate_key(key, version=version), value, ttl)
+        self._local.count('sets', len(data) - len(failed))
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._local.delete(self.make_and_validate_key(key, version=version))
+        self._local.count('deletes', len(keys))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """Drop this process' L1 entries only."""
+        self._local.clear()
+
+    def _shared_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Single-flight get_or_set.
+
+        When ``default`` is callable only one caller recomputes a missing key:
+        threads of this process queue on a striped lock, other processes see
+        a lock entry in the shared tier and poll for the value instead of
+        hitting the database at the same time.
+        """
+        value = self.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        if not callable(default):
+            self.add(key, default, timeout=timeout, version=version)
+            return self.get(key, default, version=version)
+
+        l1_key = self.make_and_validate_key(key, version=version)
+        with self._local.flight_lock(l1_key):
+            value = self.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                return value
+
+            lock_key = 'lock:%s' % key
+            if self.shared.add(lock_key, os.getpid(), self.lock_timeout, version=version):
+                try:
+                    return self._compute(key, default, timeout, version)
+                finally:
+                    self.shared.delete(lock_key, version=version)
+
+            self._local.count('stampede_waits')
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(self.lock_poll)
+                value = self.shared.get(key, _MISSING, version=version)
+                if value is not _MISSING:
+                    if self._use_l1(key):
+                        self._local.set(l1_key, value, self._l1_ttl(timeout))
+                    return value
+                if not self.shared.has_key(lock_key, version=version):
+                    break
+            self._local.count('stampede_timeouts')
+            return self._compute(key, default, timeout, version)
+
+    def _compute(self, key, default, timeout, version):
+        value = default()
+        self._local.count('computes')
+        if value is not None:
+            self.set(key, value, timeout=timeout, version=version)
+        return value
+
+    def stats(self):
+        """Counters for this process plus the current L1 size."""
+        with self._local.stats_lock:
+            data = dict(self._local.stats)
+        data['l1_entries'] = len(self._local.entries)
+        data['l1_max_entries'] = self._local.max_entries
+        lookups = data['l1_hits'] + data['l2_hits'] + data['misses']
+        data['hit_rate'] = round((data['l1_hits'] + data['l2_hits']) / lookups, 4) if lookups else 0.0
+        return data
+
+    def reset_stats(self):
+        with self._local.stats_lock:
+            self._local.stats = self._local._empty_stats()
+
+
+class SQLiteCache(BaseCache):
+    """
+    Shared cache stored in a SQLite file.
+
+    All worker processes on a host open the same file, so values computed by
+    one worker are visible to the others.  ``add`` and ``incr`` are atomic,
+    which is what the TieredCache recompute locks and the rate limiter rely
+    on.  LOCATION is the path of the database file.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        # One connection per thread and process; sqlite3 connections must not
+        # cross threads and must not survive a fork.
+        self._local = threading.local()
+        self._sets_since_cull = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                ' cache_key TEXT PRIMARY KEY,'
+                ' value BLOB NOT NULL,'
+                ' expires REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _loads(payload):
+        return pickle.loads(payload)
+
+    def _live_row(self, key):
+        return self._connection().execute(
+            'SELECT value FROM cache_entries WHERE cache_key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._live_row(key)
+        return self._loads(row[0]) if row else default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache_entries (cache_key, value, expires) VALUES (?, ?, ?)',
+            (key, self._dumps(value), self.get_backend_timeout(timeout)),
+        )
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'INSERT INTO cache_entries (cache_key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (cache_key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entries.expires IS NOT NULL AND cache_entries.expires <= ?',
+            (key, self._dumps(value), self.get_backend_timeout(timeout), now),
+        )
+        if cursor.rowcount:
+            self._maybe_cull()
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET expires = ? WHERE cache_key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE cache_key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._live_row(key) is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM cache_entries WHERE cache_key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = self._loads(row[0]) + delta
+            conn.execute('UPDATE cache_entries SET value = ? WHERE cache_key = ?', (self._dumps(new_value), key))
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return new_value
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        found = {}
+        made_keys = list(key_map)
+        # Stay well below SQLite's bound parameter limit.
+        for start in range(0, len(made_keys), 500):
+            chunk = made_keys[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self._connection().execute(
+                'SELECT cache_key, value FROM cache_entries WHERE cache_key IN (%s) '
+                'AND (expires IS NULL OR expires > ?)' % placeholders,
+                (*chunk, time.time()),
+            )
+            for made_key, payload in rows:
+                found[key_map[made_key]] = self._loads(payload)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self.make_and_validate_key(key, version=version), self._dumps(value), expires)
+            for key, value in data.items()
+        ]
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache_entries (cache_key, value, expires) VALUES (?, ?, ?)', rows
+            )
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        self._maybe_cull()
+        return []
+
+    def delete_many(self, keys, version=None):
+        made_keys = [(self.make_and_validate_key(key, version=version),) for key in keys]
+        if made_keys:
+            self._connection().executemany('DELETE FROM cache_entries WHERE cache_key = ?', made_keys)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def close(self, **kwargs):
+        # Connections are reused across requests; they are cheap to keep open.
+        pass
+
+    def _maybe_cull(self):
+        # Counting rows on every write would be wasteful; check periodically.
+        self._sets_since_cull += 1
+        if self._sets_since_cull < 100:
+            return
+        self._sets_since_cull = 0
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entries WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count > self._max_entries:
+            excess = count - self._max_entries + count // self._cull_frequency
+            conn.execute(
+                'DELETE FROM cache_entries WHERE cache_key IN ('
+                ' SELECT cache_key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (excess,),
+            )
@@ -0,0 +1,161 @@
+"""
+Response cache for anonymous catalog pages.
+
+Unlike pickling the view's return value, this stores only the rendered body,
+status and headers, keyed on the URL, the Vary headers the view declared, the
+device template (mobile/desktop) and the versions of the entry's cache tags.
+Entries carry an ETag and Last-Modified so repeat visitors get a 304.
+"""
+import hashlib
+import re
+import time
+
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import _unmask_cipher_token, get_token
+from django.utils.cache import (
+    get_cache_key, get_conditional_response, learn_cache_key, patch_cache_control,
+)
+from django.utils.decorators import decorator_from_middleware_with_args
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date
+
+from .cache_utils import cache_ttl, tagged_key
+
+CSRF_PLACEHOLDER = b'__RESPONSE_CACHE_CSRF_TOKEN__'
+CSRF_TOKEN_RE = re.compile(rb'(?<![A-Za-z0-9])[A-Za-z0-9]{64}(?![A-Za-z0-9])')
+
+# Headers that belong to one client and must never be replayed to another.
+UNCACHED_HEADERS = {'set-cookie', 'etag', 'last-modified', 'content-length'}
+
+
+class ResponseCacheMiddleware(MiddlewareMixin):
+    """
+    Serve anonymous GET requests from a cache of rendered responses.
+
+    Meant to be applied per view through ``cache_response`` so each view can
+    declare its own tags; ``tags`` is a list or a callable receiving the
+    request and the view arguments.
+    """
+
+    def __init__(self, get_response, timeout=None, tags=None, key_prefix=''):
+        super().__init__(get_response)
+        self.timeout = cache_ttl() if timeout is None else timeout
+        self.tags = tags or []
+        self.key_prefix = key_prefix
+
+    def is_cacheable_request(self, request):
+        """Only anonymous requests without pending flash messages share pages."""
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if 'HTTP_AUTHORIZATION' in request.META:
+            return False
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return False
+        if CookieStorage.cookie_name in request.COOKIES:
+            return False
+        session = getattr(request, 'session', None)
+        if session is not None and SessionStorage.session_key in session:
+            return False
+        return True
+
+    def get_key_prefix(self, request, view_args, view_kwargs):
+        tags = self.tags(request, *view_args, **view_kwargs) if callable(self.tags) else self.tags
+        device = 'mobile' if getattr(request, 'is_mobile', False) else 'desktop'
+        return tagged_key(f"{self.key_prefix}.{device}", tags)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._response_cache_update = False
+        if not self.is_cacheable_request(request):
+            return None
+
+        request._response_cache_prefix = self.get_key_prefix(request, view_args, view_kwargs)
+        cache_key = get_cache_key(request, request._response_cache_prefix, 'GET', cache=cache)
+        entry = cache.get(cache_key) if cache_key else None
+        if entry is None:
+            request._response_cache_update = request.method == 'GET'
+            return None
+
+        response = self.build_response(request, entry)
+        return get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+        )
+
+    def process_response(self, request, response):
+        if not getattr(request, '_response_cache_update', False):
+            return response
+        request._response_cache_update = False
+        if response.streaming or response.status_code != 200 or response.cookies:
+            return response
+        cache_control = response.get('Cache-Control', '')
+        if 'private' in cache_control or 'no-store' in cache_control:
+            return response
+
+        entry = self.build_entry(request, response)
+        cache_key = learn_cache_key(
+            request, response, self.timeout, request._response_cache_prefix, cache=cache,
+        )
+        cache.set(cache_key, entry, self.timeout)
+
+        self.add_validators(response, entry)
+        return get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+        )
+
+    def build_entry(self, request, response):
+        """Reduce a rendered response to plain data that is safe to share."""
+        content = response.content
+        uses_csrf = bool(request.META.get('CSRF_COOKIE_NEEDS_UPDATE'))
+        secret = request.META.get('CSRF_COOKIE')
+        if uses_csrf and secret:
+            # Every client needs its own token: punch a hole where this
+            # request's token was rendered and fill it in on each hit.
+            content = CSRF_TOKEN_RE.sub(
+                lambda match: CSRF_PLACEHOLDER
+                if _unmask_cipher_token(match.group().decode()) == secret else match.group(),
+                content,
+            )
+        return {
+            'status': response.status_code,
+            'headers': [
+                (name, value) for name, value in response.items()
+                if name.lower() not in UNCACHED_HEADERS
+            ],
+            'content': content,
+            'csrf': uses_csrf,
+            # The body differs per client by its CSRF token only, hence weak.
+            'etag': 'W/"%s"' % hashlib.md5(content).hexdigest(),
+            'last_modified': int(time.time()),
+        }
+
+    def build_response(self, request, entry):
+        content = entry['content']
+        if entry['csrf']:
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+        response = HttpResponse(content, status=entry['status'])
+        for name, value in entry['headers']:
+            response[name] = value
+        self.add_validators(response, entry)
+        return response
+
+    def add_validators(self, response, entry):
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        # Let browsers keep the page but revalidate it, which the ETag makes cheap.
+        patch_cache_control(response, no_cache=True)
+
+
+def cache_response(timeout=None, tags=None, key_prefix=''):
+    """
+    View decorator caching rendered responses for anonymous visitors.
+
+    Example:
+        @cache_response(tags=['products'], key_prefix='home.index')
+        def index(request): ...
+    """
+    return decorator_from_middleware_with_args(ResponseCacheMiddleware)(
+        timeout=timeout, tags=tags, key_prefix=key_prefix,
+    )
@@ -1,33 +1,134 @@
 from django.core.cache import cache
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
+from django.utils.cache import patch_vary_headers
 from django.conf import settings
+from django.db import transaction
 import functools
 import hashlib
+import uuid
 
+# Tag versions are read from the shared tier on every lookup; the prefix is
+# listed in the tiered cache's L1_BYPASS_PREFIXES so workers never hold a
+# stale version in memory.
+TAG_VERSION_PREFIX = 'tagv:'
 
-def cache_result(timeout=None):
+
+def cache_ttl(name='default'):
+    """
+    Look up the configured timeout for a kind of cached data.
+
+    Timeouts live in settings.CACHE_TTLS so they can be tuned per deployment
+    through environment variables.
+    """
+    ttls = getattr(settings, 'CACHE_TTLS', {})
+    return ttls.get(name, ttls.get('default', getattr(settings, 'CACHE_TTL', 900)))
+
+
+def cache_stats():
+    """Hit/miss counters of the default cache, when the backend keeps them."""
+    stats = getattr(cache, 'stats', None)
+    return stats() if callable(stats) else {}
+
+
+def _new_tag_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_tag_versions(tags):
+    """
+    Current version of each tag, creating versions for unseen tags.
+
+    Versions never expire; if one is evicted it is simply recreated with a
+    new value, which invalidates everything tagged with it.
+    """
+    tags = sorted(set(tags))
+    if not tags:
+        return {}
+    keys = {tag: TAG_VERSION_PREFIX + tag for tag in tags}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _new_tag_version(), None)
+            version = cache.get(key)
+        versions[tag] = version
+    return versions
+
+
+def tagged_key(key, tags):
+    """Append a signature of the tag versions so bumping a tag orphans the key."""
+    versions = get_tag_versions(tags)
+    if not versions:
+        return key
+    signature = ';'.join(f'{tag}={version}' for tag, version in sorted(versions.items()))
+    return f"{key}:{hashlib.md5(signature.encode()).hexdigest()[:16]}"
+
+
+def bump_tags(*tags):
+    """
+    Invalidate every entry cached under any of the given tags.
+
+    Only the version keys are rewritten; the orphaned entries age out through
+    their own TTL instead of being scanned for.  When called inside a
+    transaction the versions are bumped again on commit, so a reader that
+    re-cached the old rows before the commit does not keep them.
+    """
+    tags = {tag for tag in tags if tag}
+    if not tags:
+        return
+    cache.set_many({TAG_VERSION_PREFIX + tag: _new_tag_version() for tag in tags}, None)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(
+            lambda: cache.set_many({TAG_VERSION_PREFIX + tag: _new_tag_version() for tag in tags}, None)
+        )
+
+
+def product_tags(product, listing=True):
+    """
+    Cache tags touched by a change to a product.
+
+    The catalog-wide 'products' tag is only included for ``listing``
+    changes: ones that can add a product to a list, drop it or move it
+    (see Product.LISTING_FIELDS). Other edits, stock counts above all, only
+    reach the product's own pages and its category's.
+    """
+    tags = [f'product:{product.pk}', f'category:{product.category_id}']
+    if listing:
+        tags.append('products')
+    if product.slug:
+        tags.append(f'product:{product.slug}')
+    if product.parent_id:
+        tags.append(f'product:{product.parent_id}')
+    return tags
+
+
+def order_tags(order):
+    """Cache tags touched by a change to an order."""
+    return ['orders', f'order:{order.pk}', f'user:{order.user_id}']
+
+
+def cache_result(timeout=None, tags=None):
     """
     Decorator to cache function results
+
+    Misses go through cache.get_or_set, so with the tiered backend only one
+    worker recomputes an expired entry while the others wait for its result.
+    ``tags`` is a list of cache tags, or a callable receiving the function's
+    arguments and returning one; bumping any of them invalidates the result.
     """
     if timeout is None:
-        timeout = getattr(settings, 'CACHE_TTL', 900)  # 15 minutes default
+        timeout = cache_ttl()
     
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # Create cache key from function name and arguments
             cache_key = f"{func.__name__}_{hashlib.md5(str(args).encode() + str(kwargs).encode()).hexdigest()}"
-            
-            # Try to get from cache
-            result = cache.get(cache_key)
-            if result is not None:
-                return result
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            return result
+            if tags:
+                cache_key = tagged_key(cache_key, tags(*args, **kwargs) if callable(tags) else tags)
+            return cache.get_or_set(cache_key, lambda: func(*args, **kwargs), timeout)
         
         return wrapper
     return decorator
@@ -35,80 +136,69 @@ def cache_result(timeout=None):
 
 def invalidate_cache_pattern(pattern):
     """
-    Invalidate cache keys matching a pattern
+    Invalidate cached entries for a tag (or list of tags).
+
+    Kept for existing callers: this used to clear the whole cache, which also
+    threw away rate-limit counters and every unrelated page.  It now bumps
+    the given tags only.
     """
-    # This is a simplified version - in production you might want to use Redis SCAN
-    # For now, we'll just clear the entire cache when needed
-    cache.clear()
+    if isinstance(pattern, str):
+        pattern = [pattern]
+    bump_tags(*pattern)
 
 
 class CacheMixin:
     """
     Mixin to add caching to ViewSets
+
+    Responses are rendered and stored through ResponseCacheMiddleware, so
+    only anonymous requests are cached and the key varies on Accept as well
+    as the URL.  Set ``cache_tags`` to tie entries to model changes.
     """
     cache_timeout = 900  # 15 minutes
-    
-    def get_cache_key(self, request):
-        """Generate cache key for request"""
-        key_parts = [
-            self.__class__.__name__,
-            request.method,
-            request.path,
-            str(request.GET.dict()),
-            str(request.user.id) if request.user.is_authenticated else 'anonymous'
-        ]
-        return hashlib.md5('_'.join(key_parts).encode()).hexdigest()
+    cache_tags = ()
     
     def dispatch(self, request, *args, **kwargs):
         """Override dispatch to add caching"""
-        if request.method == 'GET':
-            cache_key = self.get_cache_key(request)
-            cached_response = cache.get(cache_key)
-            if cached_response:
-                return cached_response
-        
+        from .cache_middleware import ResponseCacheMiddleware
+
+        page_cache = ResponseCacheMiddleware(
+            super().dispatch, timeout=self.cache_timeout, tags=list(self.cache_tags),
+            key_prefix=self.__class__.__name__,
+        )
+        response = page_cache.process_view(request, None, args, kwargs)
+        if response is not None:
+            return response
+
         response = super().dispatch(request, *args, **kwargs)
-        
-        if request.method == 'GET' and response.status_code == 200:
-            cache_key = self.get_cache_key(request)
-            cache.set(cache_key, response, self.cache_timeout)
-        
-        return response
+        if getattr(request, '_response_cache_update', False):
+            patch_vary_headers(response, ('Accept',))
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return page_cache.process_response(request, response)
 
 
-def cache_product_list(timeout=900):
+def cache_product_list(timeout=None):
     """
     Cache decorator for product list views
     """
-    def decorator(view_func):
-        @functools.wraps(view_func)
-        def wrapper(request, *args, **kwargs):
-            cache_key = f"product_list_{hashlib.md5(str(request.GET.dict()).encode()).hexdigest()}"
-            result = cache.get(cache_key)
-            
-            if result is None:
-                result = view_func(request, *args, **kwargs)
-                cache.set(cache_key, result, timeout)
-            
-            return result
-        return wrapper
-    return decorator
+    from .cache_middleware import cache_response
 
+    if timeout is None:
+        timeout = cache_ttl('product_list')
+    return cache_response(timeout=timeout, tags=['products'], key_prefix='product_list')
 
-def cache_product_detail(timeout=1800):
+
+def cache_product_detail(timeout=None):
     """
     Cache decorator for product detail views
     """
-    def decorator(view_func):
-        @functools.wraps(view_func)
-        def wrapper(request, product_id, *args, **kwargs):
-            cache_key = f"product_detail_{product_id}"
-            result = cache.get(cache_key)
-            
-            if result is None:
-                result = view_func(request, product_id, *args, **kwargs)
-                cache.set(cache_key, result, timeout)
-            
-            return result
-        return wrapper
-    return decorator
+    from .cache_middleware import cache_response
+
+    if timeout is None:
+        timeout = cache_ttl('product_detail')
+    return cache_response(
+        timeout=timeout,
+        tags=lambda request, product_id, *args, **kwargs: [f'product:{product_id}'],
+        key_prefix='product_detail',
+    )
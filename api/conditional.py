@@ -0,0 +1,107 @@
+"""
+Conditional GET for API viewsets.
+
+Before serializing, list and retrieve compute cheap validators for what
+they are about to render: the newest ``updated_at`` and the row count of
+the filtered queryset (one aggregate query), or the object's own
+``updated_at``, together with the versions of the resource's cache tags,
+which move when related rows (images, reviews, categories) change. A
+client sending back a matching If-None-Match, or an If-Modified-Since no
+older than the newest row, gets a 304 without the list being loaded or
+serialized.
+
+Last-Modified is only sent for resources without cache tags: a rating
+delta or a category rename changes what a product renders without
+touching its ``updated_at``, so for tagged resources only the ETag is a
+safe validator. A deletion likewise only shows in a collection's ETag
+(through the count).
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .cache_utils import get_tag_versions
+
+
+class ConditionalGetMixin:
+    """
+    Viewset mixin answering list and retrieve with ETag/Last-Modified and 304s.
+
+    ``get_validator_tags(obj)`` names the cache tags whose versions are
+    part of the ETag: of the collection when ``obj`` is None, else of the
+    object.
+    """
+    modified_field = 'updated_at'
+
+    def get_validator_tags(self, obj=None):
+        return []
+
+    def _validator_queryset(self):
+        # Only the aggregate or one row is read: skip the planned joins and prefetches.
+        return self.filter_queryset(self.get_queryset()).select_related(None).prefetch_related(None)
+
+    def _etag(self, *parts, tags=()):
+        request = self.request
+        versions = get_tag_versions(tags)
+        key = '|'.join([
+            request.get_full_path(),
+            getattr(request, 'accepted_media_type', None) or '',
+            str(request.user.pk or ''),
+            *(str(part) for part in parts),
+            *(f'{tag}={version}' for tag, version in sorted(versions.items())),
+        ])
+        return 'W/"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+    def _conditional(self, etag, last_modified, response=None):
+        """A 304/412 for the request's preconditions, else ``response`` with validators set."""
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        if response is None:
+            response = get_conditional_response(self.request, etag=etag, last_modified=timestamp)
+            if response is None:
+                return None
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        # Caches may keep the response but must check it is current first.
+        patch_cache_control(response, no_cache=True, private=self.request.user.is_authenticated)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def collection_validators(self):
+        tags = self.get_validator_tags()
+        state = self._validator_queryset().order_by().aggregate(
+            last_modified=Max(self.modified_field), count=Count('pk'),
+        )
+        etag = self._etag(
+            state['count'], state['last_modified'] and state['last_modified'].isoformat(), tags=tags,
+        )
+        return etag, None if tags else state['last_modified']
+
+    def object_validators(self):
+        """Validators of the requested object, or None when it is not found."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = self._validator_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).first()
+        if obj is None:
+            return None
+        self.check_object_permissions(self.request, obj)
+        last_modified = getattr(obj, self.modified_field)
+        tags = self.get_validator_tags(obj)
+        return self._etag(obj.pk, last_modified.isoformat(), tags=tags), None if tags else last_modified
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.collection_validators()
+        not_modified = self._conditional(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self._conditional(etag, last_modified, super().list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.object_validators()
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        not_modified = self._conditional(*validators)
+        if not_modified is not None:
+            return not_modified
+        return self._conditional(*validators, super().retrieve(request, *args, **kwargs))
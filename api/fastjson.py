@@ -0,0 +1,163 @@
+"""
+Fast JSON encoding for the API and the JSON views.
+
+dumps() and loads() go through orjson when it is installed and through the
+standard library otherwise. Both backends take the values our views and
+serializers hand them as they are: Decimal (as a string, like DRF and
+DjangoJSONEncoder), UUID, datetime/date/time (ISO 8601, UTC written as
+'Z'), timedelta, lazy translations and sets. settings.JSON_BACKEND
+('orjson' or 'stdlib') forces one; the default picks the fastest available.
+
+FastJSONRenderer and FastJSONParser plug the same functions into DRF, and
+FastJsonResponse is a drop-in replacement for JsonResponse.
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.duration import duration_iso_string
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _iso(value):
+    representation = value.isoformat()
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+def default(obj):
+    """Encode what neither backend knows natively."""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return duration_iso_string(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, Promise):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class JSONEncoder(json.JSONEncoder):
+    """The standard library encoder, writing what orjson writes natively the same way."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return _iso(o)
+        if isinstance(o, datetime.date):
+            return o.isoformat()
+        if isinstance(o, uuid.UUID):
+            return str(o)
+        return default(o)
+
+
+class StdlibBackend:
+    name = 'stdlib'
+
+    def dumps(self, obj, indent=None):
+        if indent:
+            return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, indent=indent).encode()
+        return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImproperlyConfigured('JSON_BACKEND is "orjson" but orjson is not installed')
+        self.options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, indent=None):
+        # orjson only indents by two spaces.
+        options = self.options | orjson.OPT_INDENT_2 if indent else self.options
+        return orjson.dumps(obj, default=default, option=options)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+JSON_BACKENDS = {
+    'orjson': OrjsonBackend,
+    'stdlib': StdlibBackend,
+}
+
+_backend = None
+
+
+def get_json_backend():
+    """The configured backend, created once per process."""
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'JSON_BACKEND', 'auto')
+        if name == 'auto':
+            name = 'stdlib' if orjson is None else 'orjson'
+        try:
+            _backend = JSON_BACKENDS[name]()
+        except KeyError:
+            raise ImproperlyConfigured(f'Unknown JSON_BACKEND {name!r}')
+    return _backend
+
+
+def reset_json_backend():
+    global _backend
+    _backend = None
+
+
+def dumps(obj, indent=None):
+    """``obj`` as UTF-8 encoded JSON bytes."""
+    return get_json_backend().dumps(obj, indent)
+
+
+def loads(data):
+    """Decode JSON from bytes or str."""
+    return get_json_backend().loads(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse, encoded by the fast backend."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                'In order to allow non-dict objects to be serialized set the safe parameter to False.'
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data, indent=self.get_indent(accepted_media_type, renderer_context or {}))
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return loads(data)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,85 @@
+"""
+Management command to compare JSON encoders on product payloads.
+
+Encodes a list of N product rows, built in memory with the types our views
+and serializers produce (UUIDs, Decimals, datetimes, nested categories and
+images), with Django's JsonResponse encoder, DRF's JSONRenderer and every
+api.fastjson backend available, and prints the time per payload.
+"""
+import datetime
+import decimal
+import json
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+from api.fastjson import JSON_BACKENDS, orjson
+
+
+def product_rows(count, seed=0):
+    rng = random.Random(seed)
+    now = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    categories = [
+        {'uid': uuid.UUID(int=rng.getrandbits(128)), 'category_name': f'Category {i}', 'slug': f'category-{i}'}
+        for i in range(20)
+    ]
+    rows = []
+    for i in range(count):
+        created_at = now + datetime.timedelta(seconds=rng.randint(0, 10 ** 7), microseconds=rng.randint(0, 999999))
+        rows.append({
+            'uid': uuid.UUID(int=rng.getrandbits(128)),
+            'product_name': f'Product {i}',
+            'slug': f'product-{i}',
+            'category': rng.choice(categories),
+            'price': rng.randint(1, 500),
+            'weight': decimal.Decimal(rng.randint(1, 10000)) / 100,
+            'stock_quantity': rng.randint(0, 200),
+            'is_in_stock': rng.random() > 0.1,
+            'is_featured': rng.random() > 0.8,
+            'image': f'/media/product/product-{i}.webp',
+            'average_rating': round(rng.uniform(1, 5), 2),
+            'review_count': rng.randint(0, 300),
+            'created_at': created_at,
+            'updated_at': created_at + datetime.timedelta(days=rng.randint(0, 30)),
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON encoders on product list payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Products per payload (default: 1000)')
+        parser.add_argument('--repeat', type=int, default=50, help='Encodes per encoder (default: 50)')
+
+    def handle(self, *args, **options):
+        payload = product_rows(options['products'])
+        encoders = [
+            ('JsonResponse (DjangoJSONEncoder)', lambda data: json.dumps(data, cls=DjangoJSONEncoder).encode()),
+            ('DRF JSONRenderer', JSONRenderer().render),
+        ]
+        for name, backend in JSON_BACKENDS.items():
+            if name == 'orjson' and orjson is None:
+                self.stdout.write('orjson is not installed; skipping it')
+                continue
+            encoders.append((f'api.fastjson ({name})', backend().dumps))
+
+        self.stdout.write(f"Encoding {options['products']} products, {options['repeat']} times each")
+        baseline = None
+        for name, encode in encoders:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                size = len(encode(payload))
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings) * 1000
+            baseline = baseline or median
+            self.stdout.write(
+                f'{name:<36} median {median:7.2f} ms  best {min(timings) * 1000:7.2f} ms  '
+                f'{size / 1024:6.0f} KiB  {baseline / median:5.1f}x'
+            )
@@ -0,0 +1,114 @@
+"""
+Query planning for DRF serializers.
+
+plan_queryset() reads the fields a serializer will actually render and adds
+the select_related()/prefetch_related() calls they need: nested serializers
+and dotted sources over foreign keys are joined, to-many relations are
+prefetched, and everything below a to-many relation is prefetched along
+with it. Method fields declare what they read in ``Meta.prefetch_hints``.
+
+The number of queries of a list then depends on the fields requested, not
+on the number of rows.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+def _relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _plan(serializer, model, path, inside_many, select, prefetch):
+    def add(lookup, many):
+        if many or inside_many:
+            prefetch.add(lookup)
+        else:
+            select.add(lookup)
+
+    hints = getattr(getattr(serializer, 'Meta', None), 'prefetch_hints', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        for lookup in hints.get(name, ()):
+            # Hinted lookups are relative to this serializer's model.
+            relation = _relation(model, lookup.split('__')[0])
+            many = relation is not None and (relation.many_to_many or relation.one_to_many)
+            add(f'{path}{lookup}', many)
+        if field.source == '*':
+            continue
+
+        current_model, current_path, many = model, path, inside_many
+        followed = False
+        for attribute in field.source_attrs:
+            relation = _relation(current_model, attribute)
+            if relation is None:
+                break
+            lookup = f'{current_path}{attribute}'
+            many = many or relation.many_to_many or relation.one_to_many
+            add(lookup, many)
+            current_model, current_path, followed = relation.related_model, f'{lookup}__', True
+        else:
+            child = field.child if isinstance(field, ListSerializer) else field
+            if followed and isinstance(child, BaseSerializer):
+                _plan(child, current_model, current_path, many, select, prefetch)
+
+
+def plan_queryset(queryset, serializer):
+    """``queryset`` with the joins and prefetches ``serializer`` needs."""
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    select, prefetch = set(), set()
+    _plan(serializer, queryset.model, '', False, select, prefetch)
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*sorted(prefetch))
+    return queryset
+
+
+class SerializerProfileMixin:
+    """
+    Viewset mixin: a lean serializer for lists, the full one for details,
+    ``?fields=a,b`` sparse fieldsets, and a queryset planned for the result.
+    """
+    list_serializer_class = None
+    list_actions = ('list',)
+    fields_query_param = 'fields'
+
+    def get_serializer_class(self):
+        if self.list_serializer_class is not None and self.action in self.list_actions:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def requested_fields(self):
+        request = getattr(self, 'request', None)
+        if request is None:
+            return None
+        value = request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def plan(self, queryset):
+        """``queryset`` planned for the serializer this request renders with."""
+        kwargs = {'context': self.get_serializer_context()}
+        fields = self.requested_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return plan_queryset(queryset, self.get_serializer_class()(**kwargs))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request is None or self.request.method not in ('GET', 'HEAD'):
+            return queryset
+        return self.plan(queryset)
@@ -3,7 +3,24 @@ from products.models import Product, Category, ProductReview, ProductImage
 from accounts.models import Order, OrderItem, Cart, CartItem, Profile, CustomerLoyalty
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Accepts ``fields=[...]`` to render only those fields (unknown names are ignored)."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class CategorySummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['uid', 'category_name', 'slug']
+
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['uid', 'category_name', 'category_image', 'slug']
@@ -15,7 +32,7 @@ class ProductImageSerializer(serializers.ModelSerializer):
         fields = ['uid', 'image', 'alt_text', 'is_primary', 'sort_order']
 
 
-class ProductReviewSerializer(serializers.ModelSerializer):
+class ProductReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
     
@@ -26,12 +43,35 @@ class ProductReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['uid', 'date_added', 'user_name', 'user_username']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """The lean profile used for product lists."""
+    category = CategorySummarySerializer(read_only=True)
+    image = serializers.SerializerMethodField()
+    average_rating = serializers.FloatField(source='rating_avg', read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['uid', 'product_name', 'slug', 'category', 'price', 'is_in_stock',
+                 'is_featured', 'is_bestseller', 'is_new_arrival', 'image',
+                 'average_rating', 'review_count']
+        prefetch_hints = {'image': ['product_images']}
+
+    def get_image(self, obj):
+        """The primary image, else the first one, from the prefetched images."""
+        images = list(obj.product_images.all())
+        if not images:
+            return None
+        image = next((image for image in images if image.is_primary), images[0])
+        return image.image.url if image.image else None
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     product_images = ProductImageSerializer(many=True, read_only=True)
     reviews = ProductReviewSerializer(many=True, read_only=True)
-    average_rating = serializers.SerializerMethodField()
-    review_count = serializers.SerializerMethodField()
+    average_rating = serializers.FloatField(source='rating_avg', read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
     
     class Meta:
         model = Product
@@ -39,12 +79,6 @@ class ProductSerializer(serializers.ModelSerializer):
                  'stock_quantity', 'is_in_stock', 'is_low_stock', 'weight', 'dimensions',
                  'is_featured', 'is_bestseller', 'is_new_arrival', 'product_images',
                  'reviews', 'average_rating', 'review_count', 'created_at', 'updated_at']
-    
-    def get_average_rating(self, obj):
-        return obj.get_rating()
-    
-    def get_review_count(self, obj):
-        return obj.reviews.count()
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -71,7 +105,7 @@ class CartSerializer(serializers.ModelSerializer):
         return obj.get_cart_total()
     
     def get_item_count(self, obj):
-        return obj.cart_items.count()
+        return obj.get_pricing()['line_count']
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -82,7 +116,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['uid', 'product', 'quantity', 'product_price', 'size_variant', 'color_variant']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True)
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     assigned_employee_name = serializers.CharField(source='assigned_employee.get_full_name', read_only=True)
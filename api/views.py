@@ -6,24 +6,36 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
 from django.contrib.auth.models import User
 
+from base.pagination import KeysetPagination
 from products.models import Product, Category, ProductReview
 from accounts.models import Order, Cart, Profile, CustomerLoyalty
+from .conditional import ConditionalGetMixin
+from .prefetch import SerializerProfileMixin
 from .serializers import (
-    ProductSerializer, CategorySerializer, ProductReviewSerializer,
+    ProductSerializer, ProductListSerializer, CategorySerializer, ProductReviewSerializer,
     OrderSerializer, CartSerializer, ProfileSerializer, CustomerLoyaltySerializer
 )
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, SerializerProfileMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    list_serializer_class = ProductListSerializer
+    list_actions = ('list', 'related_products', 'featured', 'bestsellers', 'new_arrivals')
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'is_featured', 'is_bestseller', 'is_new_arrival', 'is_in_stock']
     search_fields = ['product_name', 'product_desription', 'category__category_name']
     ordering_fields = ['price', 'created_at', 'product_name']
     ordering = ['-created_at']
 
+    def get_validator_tags(self, obj=None):
+        if obj is None:
+            return ['products']
+        # 'category:<pk>' also moves with every product of the category.
+        return [f'product:{obj.pk}', 'categories']
+
     @action(detail=True, methods=['post'])
     def add_to_cart(self, request, pk=None):
         """Add product to cart"""
@@ -64,39 +76,42 @@ class ProductViewSet(viewsets.ModelViewSet):
     def related_products(self, request, pk=None):
         """Get related products"""
         product = self.get_object()
-        related = product.get_related_products()
+        related = self.plan(product.get_related_products())
         serializer = self.get_serializer(related, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """Get featured products"""
-        featured_products = self.queryset.filter(is_featured=True)
+        featured_products = self.get_queryset().filter(is_featured=True)
         serializer = self.get_serializer(featured_products, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def bestsellers(self, request):
         """Get bestseller products"""
-        bestsellers = self.queryset.filter(is_bestseller=True)
+        bestsellers = self.get_queryset().filter(is_bestseller=True)
         serializer = self.get_serializer(bestsellers, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def new_arrivals(self, request):
         """Get new arrival products"""
-        new_arrivals = self.queryset.filter(is_new_arrival=True)
+        new_arrivals = self.get_queryset().filter(is_new_arrival=True)
         serializer = self.get_serializer(new_arrivals, many=True)
         return Response(serializer.data)
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, SerializerProfileMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get_validator_tags(self, obj=None):
+        return ['categories'] if obj is None else [f'category:{obj.pk}']
+
 
-class ProductReviewViewSet(viewsets.ModelViewSet):
+class ProductReviewViewSet(SerializerProfileMixin, viewsets.ModelViewSet):
     queryset = ProductReview.objects.all()
     serializer_class = ProductReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -125,9 +140,10 @@ class ProductReviewViewSet(viewsets.ModelViewSet):
         return Response({'dislike_count': review.dislike_count})
 
 
-class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderViewSet(ConditionalGetMixin, SerializerProfileMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status', 'payment_status']
     ordering_fields = ['order_date', 'order_total_price']
@@ -138,6 +154,19 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
             return Order.objects.all()
         return Order.objects.filter(user=self.request.user)
 
+    def get_validator_tags(self, obj=None):
+        # Orders render their items' products in full, stock levels included;
+        # stock and description edits only move each product's own tag.
+        if obj is not None:
+            product_ids = obj.order_items.exclude(product=None).values_list('product_id', flat=True)
+            tags = [f'order:{obj.pk}']
+        else:
+            product_ids = self._validator_queryset().order_by().exclude(order_items__product=None).values_list(
+                'order_items__product_id', flat=True,
+            ).distinct()
+            tags = ['orders' if self.request.user.is_staff else f'user:{self.request.user.pk}']
+        return [*tags, 'products', *(f'product:{product_id}' for product_id in product_ids)]
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel an order"""
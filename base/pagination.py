@@ -0,0 +1,332 @@
+"""
+Keyset (cursor) pagination.
+
+Paginator pages with COUNT(*) plus OFFSET, so page N reads and throws away
+every row before it. KeysetPaginator instead remembers where a page ended:
+the cursor holds the sort key values of the boundary row, and the next page
+is "rows after these values" in the queryset's own ordering, with the
+primary key appended as a tie-breaker. Any page costs what the first does.
+
+Ordering fields must be model fields (related lookups like
+'category__category_name' are fine). Nullable ones are ordered with their
+nulls after every value, on every database, so the cursor filter knows
+where they are. Annotations and expressions have no field to read a cursor
+from: KeysetPaginator raises ValueError for them. Cursors are opaque,
+URL-safe strings; a cursor that does not decode simply gives the first page.
+
+KeysetPagination wires the same paginator into DRF viewsets, paging by
+offset instead when the ordering cannot be followed by cursor.
+"""
+import base64
+import datetime
+import json
+from collections import OrderedDict
+from collections.abc import Sequence
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Counts are only exact up to this many rows; past it they are estimates.
+COUNT_CAP = 1000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder, but datetimes keep their microseconds: cursors must be exact."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def approximate_count(queryset, cap=COUNT_CAP):
+    """
+    Row count of ``queryset`` as (count, is_exact), without scanning it all.
+
+    PostgreSQL answers from the planner's estimate; elsewhere rows are
+    counted up to ``cap``.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+    count = queryset[:cap + 1].count()
+    return (cap, False) if count > cap else (count, True)
+
+
+class KeysetPage(Sequence):
+    """One page of a KeysetPaginator, with cursors to its neighbours."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self)} item(s)>'
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @cached_property
+    def next_cursor(self):
+        if not self.has_next_page:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], reverse=False)
+
+    @cached_property
+    def previous_cursor(self):
+        if not self.has_previous_page:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], reverse=True)
+
+
+class KeysetPaginator:
+    """
+    Pages through ``queryset`` in its ordering, ``per_page`` rows at a time.
+
+    ``get_page(cursor)`` returns a KeysetPage; ``count`` is an approximate
+    total (see approximate_count), computed only when asked for.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.per_page = int(per_page)
+        model = queryset.model
+        ordering = list(ordering or queryset.query.order_by or model._meta.ordering or [])
+        pk_name = model._meta.pk.name
+        if not any(name.lstrip('-') in (pk_name, 'pk') for name in ordering):
+            last_descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append(f'-{pk_name}' if last_descending else pk_name)
+
+        self.keys = []  # [(lookup path, descending, model field, attribute path, nullable), ...]
+        for name in ordering:
+            if not isinstance(name, str):
+                raise ValueError('KeysetPaginator only orders by field names')
+            descending = name.startswith('-')
+            path = name.lstrip('-')
+            if path == 'pk':
+                path = pk_name
+            self.keys.append((path, descending, *self._resolve(model, path)))
+        self.queryset = queryset.order_by(*self.ordering(reverse=False))
+
+    @staticmethod
+    def _resolve(model, path):
+        """
+        The model field behind an ordering path, the attributes leading to its
+        value, and whether the value can be null.
+        """
+        attributes = []
+        field = None
+        nullable = False
+        for part in path.split('__'):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                raise ValueError(f'Cannot paginate by {path!r}')
+            if field.one_to_many or field.many_to_many:
+                raise ValueError(f'Cannot paginate by {path!r}: it repeats rows')
+            attributes.append(part)
+            nullable = nullable or field.null
+            if field.is_relation:
+                model = field.related_model
+        if field.is_relation:
+            # Order by a foreign key means by its column; read it without a query.
+            attributes[-1] = field.attname
+            field = field.target_field
+        return field, attributes, nullable
+
+    def ordering(self, reverse):
+        ordering = []
+        for path, descending, _, _, nullable in self.keys:
+            descending = descending != reverse
+            if nullable:
+                # Nulls after every value, whatever the database's default.
+                ordering.append(F(path).desc(nulls_first=True) if descending else F(path).asc(nulls_last=True))
+            else:
+                ordering.append(f"{'-' if descending else ''}{path}")
+        return ordering
+
+    @cached_property
+    def count_info(self):
+        return approximate_count(self.queryset)
+
+    @property
+    def count(self):
+        return self.count_info[0]
+
+    @property
+    def count_is_exact(self):
+        return self.count_info[1]
+
+    def _key_values(self, obj):
+        values = []
+        for _, _, _, attributes, _ in self.keys:
+            value = obj
+            for attribute in attributes:
+                value = getattr(value, attribute)
+                if value is None:
+                    break
+            values.append(value)
+        return values
+
+    def encode_cursor(self, obj, reverse):
+        payload = json.dumps(
+            {'v': self._key_values(obj), 'r': int(reverse)}, cls=CursorEncoder, separators=(',', ':')
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values, reverse = payload['v'], bool(payload['r'])
+            if len(values) != len(self.keys):
+                raise InvalidCursor(cursor)
+            values = [field.to_python(value) for (_, _, field, _, _), value in zip(self.keys, values)]
+        except (ValueError, TypeError, KeyError, ValidationError) as exc:
+            raise InvalidCursor(cursor) from exc
+        return values, reverse
+
+    def _after(self, values, reverse):
+        """
+        Rows that come after ``values`` in the ordering (before them when reversed).
+
+        Nulls sort after every value, so they follow any value going up and
+        precede every value going down.
+        """
+        condition = Q()
+        equal = Q()
+        for (path, descending, _, _, nullable), value in zip(self.keys, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            if value is None:
+                if lookup == 'lt':
+                    condition |= equal & Q(**{f'{path}__isnull': False})
+                equal &= Q(**{f'{path}__isnull': True})
+                continue
+            after = Q(**{f'{path}__{lookup}': value})
+            if nullable and lookup == 'gt':
+                after |= Q(**{f'{path}__isnull': True})
+            condition |= equal & after
+            equal &= Q(**{path: value})
+        return condition
+
+    def get_page(self, cursor=None):
+        """The page a cursor points at; the first page for a missing or bad cursor."""
+        values, reverse = None, False
+        if cursor:
+            try:
+                values, reverse = self.decode_cursor(cursor)
+            except InvalidCursor:
+                pass
+
+        queryset = self.queryset
+        if reverse:
+            queryset = queryset.order_by(*self.ordering(reverse=True))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=values is not None)
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination on KeysetPaginator.
+
+    Follows the viewset's ordering (including OrderingFilter); clients page
+    with the ``next``/``previous`` links and may ask for ``?count=1`` to get
+    an approximate total. An ordering KeysetPaginator rejects (an annotation,
+    an expression) is paged with LimitOffsetPagination rather than failing.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.offset_pagination = None
+        try:
+            self.paginator = KeysetPaginator(queryset, self.get_page_size(request))
+        except ValueError:
+            self.offset_pagination = LimitOffsetPagination()
+            self.offset_pagination.default_limit = self.get_page_size(request)
+            self.offset_pagination.max_limit = self.max_page_size
+            return self.offset_pagination.paginate_queryset(queryset, request, view)
+        self.page = self.paginator.get_page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        # The count is asked for once, not recomputed on every page.
+        url = remove_query_param(self.request.build_absolute_uri(), self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        if self.offset_pagination is not None:
+            return self.offset_pagination.get_paginated_response(data)
+        body = OrderedDict([
+            ('next', self._link(self.page.next_cursor)),
+            ('previous', self._link(self.page.previous_cursor)),
+        ])
+        if self.request.query_params.get(self.count_query_param):
+            body['count'] = self.paginator.count
+            body['count_is_exact'] = self.paginator.count_is_exact
+        body['results'] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_is_exact': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
@@ -2,6 +2,7 @@
 Django settings for ecomm project - Full Django eCommerce Application
 """
 import os
+import sys
 from pathlib import Path
 from decouple import config
 import dj_database_url
@@ -156,6 +157,92 @@ if config('DATABASE_URL', default=None):
     # Connection pooling settings
     DATABASES['default']['CONN_MAX_AGE'] = 600
 
+# Cache configuration
+# Each gunicorn worker keeps a small LRU of hot entries in memory in front of
+# a shared tier all workers read, so a value computed by one worker is reused
+# by the others.  The shared tier is Redis when REDIS_URL is set, otherwise a
+# SQLite file on local disk.
+CACHE_TTL = config('CACHE_TTL', default=900, cast=int)  # 15 minutes
+CACHE_TTLS = {
+    'default': CACHE_TTL,
+    'product_list': config('CACHE_TTL_PRODUCT_LIST', default=900, cast=int),
+    'product_detail': config('CACHE_TTL_PRODUCT_DETAIL', default=1800, cast=int),
+}
+
+REDIS_URL = config('REDIS_URL', default=None)
+
+# `manage.py test` gets a shared tier of its own: tests clear the cache, and
+# must neither wipe the dev server's entries nor see them.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
+if TESTING:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'a2z-test-shared-{os.getpid()}',
+        'TIMEOUT': CACHE_TTL,
+    }
+elif REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+        'TIMEOUT': CACHE_TTL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'IGNORE_EXCEPTIONS': True,
+        },
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'api.cache_backend.SQLiteCache',
+        'LOCATION': config('CACHE_SQLITE_PATH', default=str(BASE_DIR / '.cache' / 'shared_cache.sqlite3')),
+        'TIMEOUT': CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_SHARED_MAX_ENTRIES', default=50000, cast=int),
+        },
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'api.cache_backend.TieredCache',
+        'LOCATION': 'a2z-default',
+        'TIMEOUT': CACHE_TTL,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'L1_MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', default=1000, cast=int),
+            'L1_TIMEOUT': config('CACHE_L1_TIMEOUT', default=30, cast=int),
+            'L1_BYPASS_PREFIXES': ('rate_limit_', 'lock:', 'tagv:', 'cart_count:', 'cart_pricing:'),
+        },
+    },
+    'shared': SHARED_CACHE,
+}
+
+# Product search: the built-in inverted index,
+# 'search.backends.fulltext_backend' for the database's full-text index
+# (PostgreSQL tsvector + pg_trgm, SQLite FTS5), or
+# 'search.backends.DatabaseSearchBackend' for plain substring matching.
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='search.backends.InvertedIndexBackend')
+
+# Where process_search_queue sends search documents:
+# 'search.indexing.ElasticsearchIndexer' (needs django-elasticsearch-dsl) or
+# the in-memory LocalIndexer.
+SEARCH_INDEXER = config('SEARCH_INDEXER', default='search.indexing.LocalIndexer')
+
+# JSON encoding for the API and JSON views (api.fastjson): 'orjson',
+# 'stdlib', or 'auto' for orjson when it is installed.
+JSON_BACKEND = config('JSON_BACKEND', default='auto')
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
 # Crispy Forms
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
@@ -3,6 +3,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from home.health import health_check, readiness_check, liveness_check
+from products.blob_views import serve_blob
+from products.storage import BLOB_DIR
 
 urlpatterns = [
     # Health check endpoints (for Railway) - direct imports
@@ -19,12 +21,20 @@ urlpatterns = [
     # Accounts app
     path('accounts/', include('accounts.urls')),
     
+    # Search JSON API
+    path('search/api/', include(('search.urls', 'search'), namespace='search')),
+    
     # Home app (must be last to catch root path)
     path('', include('home.urls')),
 ]
 
 # Serve static and media files
 if settings.DEBUG:
+    # Content-addressed media never changes under its URL: cache it for good.
+    # In production the front server does this (see products.blob_views).
+    urlpatterns += [
+        path(f"{settings.MEDIA_URL.lstrip('/')}{BLOB_DIR}/<path:path>", serve_blob, name='media_blob'),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 else:
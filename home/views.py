@@ -1,8 +1,12 @@
 from django.db.models import Q
 from django.shortcuts import render
 from products.models import Product, Category
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.core.paginator import Paginator
+from base.pagination import KeysetPaginator
 from django_user_agents.utils import get_user_agent
+from api.cache_middleware import cache_response
+from api.cache_utils import cache_ttl
+from search.backends import get_backend, products_for
 
 # Create your views here.
 
@@ -11,9 +15,10 @@ def redirect_homepage(request):
     return render(request, 'home/redirect_homepage.html')
 
 
+@cache_response(timeout=cache_ttl('product_list'), tags=['products'], key_prefix='home.index')
 def index(request):
     """A2Z Mart - Main e-commerce site with hero section"""
-    query = Product.objects.all().order_by('uid')  # Use 'uid' instead of 'id'
+    query = Product.objects.all().order_by('-created_at')
     categories = Category.objects.all()
     selected_sort = request.GET.get('sort')
     selected_category = request.GET.get('category')
@@ -28,23 +33,9 @@ def index(request):
             query = query.order_by('price')
         elif selected_sort == 'priceDesc':
             query = query.order_by('-price')
-    else:
-        # Ensure there's always an ordering
-        query = query.order_by('uid')
-
-    page = request.GET.get('page', 1)
-    paginator = Paginator(query, 20)
-
-    try:
-        products = paginator.page(page)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages)
-    except Exception as e:
-        print(e)
-        # Fallback to empty page if there's an error
-        products = paginator.page(1)
+
+    # Keyset pages: deep pages cost the same as the first
+    products = KeysetPaginator(query, 20).get_page(request.GET.get('cursor'))
 
     context = {
         'products': products,
@@ -61,9 +52,10 @@ def index(request):
     return render(request, 'home/index.html', context)
 
 
+@cache_response(timeout=cache_ttl('product_list'), tags=['products'], key_prefix='home.products_only')
 def products_only(request):
     """A2Z Mart - Products only view without hero section"""
-    query = Product.objects.all().order_by('uid')
+    query = Product.objects.all().order_by('-created_at')
     categories = Category.objects.all()
     selected_sort = request.GET.get('sort')
     selected_category = request.GET.get('category')
@@ -78,21 +70,8 @@ def products_only(request):
             query = query.order_by('price')
         elif selected_sort == 'priceDesc':
             query = query.order_by('-price')
-    else:
-        query = query.order_by('uid')
-
-    page = request.GET.get('page', 1)
-    paginator = Paginator(query, 20)
 
-    try:
-        products = paginator.page(page)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages)
-    except Exception as e:
-        print(e)
-        products = paginator.page(1)
+    products = KeysetPaginator(query, 20).get_page(request.GET.get('cursor'))
 
     context = {
         'products': products,
@@ -115,37 +94,16 @@ def product_search(request):
     sort_by = request.GET.get('sort', '')
 
     if query:
-        # Enhanced search - search in multiple fields
-        products = Product.objects.filter(
-            Q(product_name__icontains=query) |
-            Q(product_desription__icontains=query) |
-            Q(category__category_name__icontains=query) |
-            Q(keywords__icontains=query)
-        ).distinct()
-        
-        # Apply category filter if provided
-        if category_filter:
-            products = products.filter(category__category_name=category_filter)
-            
-        # Apply sorting
-        if sort_by == 'price_asc':
-            products = products.order_by('price')
-        elif sort_by == 'price_desc':
-            products = products.order_by('-price')
-        elif sort_by == 'name_asc':
-            products = products.order_by('product_name')
-        elif sort_by == 'name_desc':
-            products = products.order_by('-product_name')
-        elif sort_by == 'newest':
-            products = products.filter(newest_product=True).order_by('-created_at')
-        else:
-            # Default: relevance (products with query in name first)
-            products = products.extra(
-                select={
-                    'relevance': "CASE WHEN product_name ILIKE %s THEN 1 ELSE 2 END"
-                },
-                select_params=[f'%{query}%']
-            ).order_by('relevance', 'product_name')
+        result = get_backend().search(
+            query,
+            category=category_filter or None,
+            newest=True if sort_by == 'newest' else None,
+            sort=sort_by or 'relevance',
+        )
+        products = Paginator(result.pks, 20).get_page(request.GET.get('page'))
+        products.object_list = products_for(
+            products.object_list, Product.objects.prefetch_related('product_images')
+        )
     else:
         products = Product.objects.none()
 
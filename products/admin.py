@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Category, Product, ColorVariant, SizeVariant, ProductImage, ProductReview, ProductVariant, StockMovement, Barcode, ProductComparison, ProductRecommendation
+from .models import Category, Product, ColorVariant, SizeVariant, ProductImage, ProductReview, ProductVariant, StockMovement, Barcode, ProductComparison, ProductRecommendation, ImageProcessingJob
 
 # Register your models here.
 #test2
@@ -127,5 +127,13 @@ class ProductRecommendationAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'product__product_name', 'reason']
     readonly_fields = ['created_at', 'updated_at']
 
+@admin.register(ImageProcessingJob)
+class ImageProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'object_id', 'status', 'attempts', 'original_size', 'optimized_size', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['object_id', 'source', 'last_error']
+    readonly_fields = ['kind', 'object_id', 'source', 'result', 'original_size', 'optimized_size',
+                       'started_at', 'finished_at', 'last_error']
+
 admin.site.register(ProductImage)
 admin.site.register(ProductReview)
\ No newline at end of file
@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'products'#test
+    name = 'products'
+
+    def ready(self):
+        import products.signals
+
@@ -0,0 +1,28 @@
+"""
+Serve content-addressed media with far-future caching, in development.
+
+Like the rest of MEDIA_ROOT, blobs are only served by Django when DEBUG is
+on: django.views.static.serve is not meant for production. There the front
+server serves ``MEDIA_ROOT/blobs/`` at ``MEDIA_URL + 'blobs/'`` with the same
+header, e.g. for nginx:
+
+    location /media/blobs/ {
+        alias /app/mediafiles/blobs/;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+"""
+import os
+
+from django.conf import settings
+from django.views.static import serve
+
+from .storage import BLOB_DIR
+
+# A blob name always means the same bytes, so a copy never needs revalidating.
+BLOB_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def serve_blob(request, path):
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, BLOB_DIR))
+    response['Cache-Control'] = BLOB_CACHE_CONTROL
+    return response
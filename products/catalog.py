@@ -0,0 +1,48 @@
+"""
+Batched helpers for rendering catalog listings.
+"""
+from django.db.models import Prefetch
+from .models import Product
+
+
+DEFAULT_VARIANT_NAME = 'regular'
+
+
+def catalog_queryset():
+    """
+    Parent products with everything a product card needs prefetched.
+
+    Evaluating this costs a fixed number of queries: one for the parents,
+    one for all their size variants, one for the variants' own children (so
+    has_size_variants() is answered from memory) and one per set of images,
+    however many products the page holds.
+    """
+    return Product.objects.filter(parent=None).prefetch_related(
+        'product_images',
+        Prefetch(
+            'child_products',
+            queryset=Product.objects.order_by('uid').prefetch_related('product_images', 'child_products'),
+        ),
+    )
+
+
+def pick_display_variant(product):
+    """
+    The product to show on a card for a parent product.
+
+    Products with size variants are shown through their "Regular" variant,
+    falling back to the first variant; standalone products show themselves.
+    Works on the prefetched variants, so it never queries.
+    """
+    variants = list(product.child_products.all())
+    if not variants:
+        return product
+    for variant in variants:
+        if DEFAULT_VARIANT_NAME in variant.product_name.casefold():
+            return variant
+    return variants[0]
+
+
+def display_products(products):
+    """Resolve the display variant of every product in a list of parents."""
+    return [pick_display_variant(product) for product in products]
@@ -0,0 +1,68 @@
+"""
+Image codecs available to this process.
+
+Whether Pillow can write a format depends on the libraries it was built
+against (and, for AVIF, on the optional pillow-avif plugin). The registry
+asks Pillow once per process, from its plugin table and feature checks,
+without encoding anything or touching disk.
+"""
+import functools
+import importlib
+
+from PIL import Image, features
+
+
+class Codec:
+    """An output format with the options its encoder is called with."""
+
+    def __init__(self, name, mime_type, extension, feature=None, plugin=None, options=None):
+        self.name = name
+        self.mime_type = mime_type
+        self.extension = extension
+        self.feature = feature
+        self.plugin = plugin
+        self.options = options or {}
+
+    def __repr__(self):
+        return f'<Codec {self.name}>'
+
+    def is_supported(self):
+        if self.plugin:
+            try:
+                importlib.import_module(self.plugin)
+            except ImportError:
+                pass
+        Image.init()
+        if self.name not in Image.SAVE:
+            return False
+        if self.feature in features.modules:
+            return bool(features.check_module(self.feature))
+        if self.feature in features.codecs:
+            return bool(features.check_codec(self.feature))
+        return True
+
+
+# In order of preference for fallbacks: JPEG can always be served.
+CODECS = {
+    'JPEG': Codec('JPEG', 'image/jpeg', 'jpg', feature='jpg', options={'optimize': True, 'progressive': True}),
+    'WEBP': Codec('WEBP', 'image/webp', 'webp', feature='webp', options={'method': 4}),
+    'AVIF': Codec('AVIF', 'image/avif', 'avif', feature='avif', plugin='pillow_avif', options={'speed': 6}),
+}
+
+MIME_TYPES = {name: codec.mime_type for name, codec in CODECS.items()}
+EXTENSIONS = {name: codec.extension for name, codec in CODECS.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def available_codecs():
+    """The codecs this process can encode with, probed on first use."""
+    return tuple(codec for codec in CODECS.values() if codec.is_supported())
+
+
+def available_formats():
+    return [codec.name for codec in available_codecs()]
+
+
+def reset_codecs():
+    """Forget the probe, e.g. after installing a plugin in tests."""
+    available_codecs.cache_clear()
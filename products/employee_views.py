@@ -2,7 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
-from django.core.paginator import Paginator
+from base.pagination import KeysetPaginator
 from django.db.models import Q, F, Count, Sum, Avg
 from django.utils import timezone
 from datetime import timedelta
@@ -67,10 +67,8 @@ def employee_product_management(request):
     else:
         products = products.order_by('-created_at')
     
-    # Pagination
-    paginator = Paginator(products, 25)
-    page_number = request.GET.get('page')
-    products_page = paginator.get_page(page_number)
+    # Keyset pagination: deep pages cost the same as the first
+    products_page = KeysetPaginator(products, 25).get_page(request.GET.get('cursor'))
     
     # Get categories for filter dropdown
     categories = Category.objects.all()
@@ -0,0 +1,139 @@
+"""
+Database full-text index of products.
+
+On PostgreSQL each product stores a weighted tsvector in
+``Product.search_vector`` (name A, keywords B, category C, description D),
+covered by a GIN index, with a pg_trgm index on the name for typo matching.
+On SQLite the same fields go to the FTS5 table ``products_product_fts``,
+keyed by the product's uid in an unindexed column (rowids of
+products_product can change on VACUUM or a table rebuild). Other databases
+have no full-text index.
+
+Both are refreshed from Product.save and Category.save; the migration that
+adds them backfills the catalog, and rebuild() repairs drift. Deleted
+products leave the SQLite table through a pre_delete signal.
+"""
+import re
+
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'products_product_fts'
+
+# FTS5 bm25() column weights, in the table's column order (uid first).
+FTS_WEIGHTS = (0.0, 10.0, 5.0, 3.0, 1.0)
+
+WORD_RE = re.compile(r'\w+')
+
+_fts_ready = None
+
+
+def weighted_vector():
+    """The tsvector expression stored in Product.search_vector."""
+    from .models import Category
+
+    category_name = Subquery(
+        Category.objects.filter(pk=OuterRef('category_id')).values('category_name')[:1]
+    )
+    return (
+        SearchVector('product_name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('keywords', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(category_name, weight='C', config=SEARCH_CONFIG)
+        + SearchVector('product_desription', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def words(query):
+    return WORD_RE.findall(query.lower())
+
+
+def prefix_tsquery(query):
+    """Raw tsquery requiring every word, the last one as a prefix."""
+    terms = words(query)
+    return ' & '.join(
+        f"'{term}'" + (':*' if i == len(terms) - 1 else '') for i, term in enumerate(terms)
+    )
+
+
+def fts_match_query(query):
+    """FTS5 MATCH expression requiring every word, the last one as a prefix."""
+    terms = words(query)
+    return ' '.join(
+        f'"{term}"' + ('*' if i == len(terms) - 1 else '') for i, term in enumerate(terms)
+    )
+
+
+def fts_available():
+    """Whether the SQLite FTS5 table exists (checked once per process)."""
+    global _fts_ready
+    if connection.vendor != 'sqlite':
+        return False
+    if _fts_ready is None:
+        _fts_ready = FTS_TABLE in connection.introspection.table_names()
+    return _fts_ready
+
+
+def create_fts_table(cursor):
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+        "uid UNINDEXED, name, keywords, category, description, "
+        "tokenize = 'porter unicode61 remove_diacritics 2')"
+    )
+
+
+def _fts_insert_sql(where):
+    return (
+        f'INSERT INTO {FTS_TABLE} (uid, name, keywords, category, description) '
+        'SELECT p.uid, p.product_name, p.keywords, c.category_name, p.product_desription '
+        'FROM products_product p LEFT JOIN products_category c ON c.uid = p.category_id '
+        f'WHERE {where}'
+    )
+
+
+def _db_pks(products):
+    pk_field = products.model._meta.pk
+    return [pk_field.get_db_prep_value(pk, connection) for pk in products.values_list('pk', flat=True)]
+
+
+def _delete_fts_rows(cursor, pks):
+    placeholders = ', '.join(['%s'] * len(pks))
+    cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE uid IN ({placeholders})', pks)
+    return placeholders
+
+
+def refresh(products):
+    """Bring the full-text index up to date for a Product queryset."""
+    if connection.vendor == 'postgresql':
+        products.update(search_vector=weighted_vector())
+    elif fts_available():
+        pks = _db_pks(products)
+        if pks:
+            with connection.cursor() as cursor:
+                placeholders = _delete_fts_rows(cursor, pks)
+                cursor.execute(_fts_insert_sql(f'p.uid IN ({placeholders})'), pks)
+
+
+def remove(products):
+    """Drop products about to be deleted (SQLite; the tsvector goes with the row)."""
+    if fts_available():
+        pks = _db_pks(products)
+        if pks:
+            with connection.cursor() as cursor:
+                _delete_fts_rows(cursor, pks)
+
+
+def rebuild():
+    """Recreate the full-text index of the whole catalog."""
+    global _fts_ready
+    from .models import Product
+
+    if connection.vendor == 'postgresql':
+        refresh(Product.objects.all())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            create_fts_table(cursor)
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(_fts_insert_sql('1 = 1'))
+        _fts_ready = True
@@ -0,0 +1,239 @@
+"""
+Background optimization of uploaded images.
+
+ProductImage and Category saves validate an upload, store it as it came
+and queue an ImageProcessingJob in the same transaction, so a request
+never decodes or re-encodes anything. ``process_image_jobs`` works the
+queue: originals are decoded once in a process pool, resized and encoded
+to WebP along with their responsive renditions (products.renditions), the
+files are written to storage, and each image is swapped in by an
+UPDATE that only matches while the row still points at the original it was
+made from. If a newer upload landed meanwhile, it wins and its own job
+takes over.
+"""
+import functools
+import io
+import logging
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image
+
+from api.cache_utils import bump_tags, product_tags
+
+from .image_utils import ImageOptimizer
+from .models import Category, ImageProcessingJob, ProductImage
+from .renditions import delete_renditions, render_renditions, store_renditions
+
+logger = logging.getLogger(__name__)
+
+JOB_BATCH_SIZE = 20
+MAX_ATTEMPTS = 3
+
+# A job still 'processing' after this long belonged to a worker that died.
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+
+# kind -> (model, image field)
+TARGETS = {
+    'product_image': (ProductImage, 'image'),
+    'category': (Category, 'category_image'),
+}
+
+
+def image_type(kind, obj):
+    """The ImageOptimizer profile an object's image is optimized for."""
+    if kind == 'category':
+        return 'category'
+    return 'product_primary' if obj.is_primary else 'product_gallery'
+
+
+def changed_tags(kind, obj):
+    """Cache tags to bump once an object's image is swapped."""
+    if kind == 'category':
+        return ['categories', f'category:{obj.pk}', 'products']
+    return product_tags(obj.product)
+
+
+def image_in_use(name):
+    """Whether any product or category image still points at the file ``name``."""
+    return any(model.objects.filter(**{field_name: name}).exists() for model, field_name in TARGETS.values())
+
+
+def enqueue_image_job(kind, obj):
+    """Queue the optimization of the upload ``obj`` was just saved with."""
+    _, field_name = TARGETS[kind]
+    now = timezone.now()
+    ImageProcessingJob.objects.filter(kind=kind, object_id=obj.pk, status='pending').update(
+        status='superseded', finished_at=now,
+    )
+    return ImageProcessingJob.objects.create(kind=kind, object_id=obj.pk, source=getattr(obj, field_name).name)
+
+
+def start_image_job(kind, obj):
+    """
+    Record that the caller is optimizing the image ``obj`` was loaded with.
+
+    ``obj`` may be stale, so only pending jobs for that same file are
+    superseded; the job of an upload saved since stays queued, and the
+    caller's swap loses to it.
+    """
+    _, field_name = TARGETS[kind]
+    source = getattr(obj, field_name).name
+    now = timezone.now()
+    ImageProcessingJob.objects.filter(kind=kind, object_id=obj.pk, source=source, status='pending').update(
+        status='superseded', finished_at=now,
+    )
+    return ImageProcessingJob.objects.create(
+        kind=kind, object_id=obj.pk, source=source, status='processing', attempts=1, started_at=now,
+    )
+
+
+def optimize_source(data, profile):
+    """
+    The optimized bytes, file name and renditions for an original's bytes.
+
+    The original is decoded once for both. Runs in the worker pool, so it
+    takes and returns plain values.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    optimized = ImageOptimizer.optimize_image(image, profile, 'WEBP')
+    if not isinstance(optimized, ContentFile):
+        raise ValueError('The image could not be decoded')
+    return optimized.read(), optimized.name, render_renditions(image)
+
+
+def claim_jobs(batch_size=JOB_BATCH_SIZE):
+    """
+    Mark up to ``batch_size`` queued jobs as processing and return them.
+
+    Concurrent workers take different jobs where the database can skip
+    locked rows. Jobs of dead workers are taken again after PROCESSING_TIMEOUT.
+    """
+    now = timezone.now()
+    stale = Q(status='processing', started_at__lt=now - PROCESSING_TIMEOUT)
+    with transaction.atomic():
+        ImageProcessingJob.objects.filter(stale, attempts__gte=MAX_ATTEMPTS).update(
+            status='failed', finished_at=now, last_error='The worker processing the job did not finish',
+        )
+        jobs = ImageProcessingJob.objects.filter(
+            Q(status='pending') | stale, attempts__lt=MAX_ATTEMPTS,
+        ).order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        jobs = list(jobs[:batch_size])
+        ImageProcessingJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status='processing', started_at=now, attempts=F('attempts') + 1,
+        )
+    for job in jobs:
+        job.status, job.started_at, job.attempts = 'processing', now, job.attempts + 1
+    return jobs
+
+
+def _load_targets(jobs):
+    objects = {}
+    for kind, (model, _) in TARGETS.items():
+        ids = [job.object_id for job in jobs if job.kind == kind]
+        if not ids:
+            continue
+        queryset = model.objects.filter(pk__in=ids)
+        if model is ProductImage:
+            queryset = queryset.select_related('product')
+        objects.update({(kind, obj.pk): obj for obj in queryset})
+    return objects
+
+
+def _finish(job, status, **fields):
+    job.status = status
+    job.finished_at = timezone.now()
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=['status', 'finished_at', 'updated_at', *fields])
+
+
+def _fail(job, exc):
+    logger.warning('Image job %s failed: %s', job.pk, exc)
+    status = 'failed' if job.attempts >= MAX_ATTEMPTS else 'pending'
+    _finish(job, status, last_error=str(exc)[:2000])
+
+
+def _swap(job, obj, data, optimized, name, renditions):
+    """Store the optimized file and point the row at it, unless it moved on."""
+    model, field_name = TARGETS[job.kind]
+    field = model._meta.get_field(field_name)
+    stored = field.storage.save(field.generate_filename(obj, name), ContentFile(optimized))
+    with transaction.atomic():
+        swapped = model.objects.filter(pk=obj.pk, **{field_name: job.source}).update(
+            **{field_name: stored, 'updated_at': timezone.now()}
+        )
+        if not swapped:
+            transaction.on_commit(lambda: field.storage.delete(stored))
+            _finish(job, 'superseded')
+            return
+        store_renditions(stored, renditions, field.storage)
+        # Identical images share one blob; keep its renditions while any row shows it.
+        if not image_in_use(job.source):
+            delete_renditions([job.source], field.storage)
+        bump_tags(*changed_tags(job.kind, obj))
+        transaction.on_commit(lambda: field.storage.delete(job.source))
+        _finish(job, 'done', result=stored, original_size=len(data), optimized_size=len(optimized), last_error='')
+
+
+def complete_job(job, obj, data, result):
+    """
+    Swap in ``result``, a callable returning optimize_source's output.
+
+    Failures are recorded on the job; returns its final status.
+    """
+    try:
+        _swap(job, obj, data, *result())
+    except Exception as exc:
+        _fail(job, exc)
+    return job.status
+
+
+def process_batch(batch_size=JOB_BATCH_SIZE, executor=None):
+    """
+    Optimize one batch of queued uploads; returns how many jobs it took.
+
+    With a concurrent.futures ``executor`` the images are decoded and
+    encoded in parallel; without one, in this process.
+    """
+    jobs = claim_jobs(batch_size)
+    objects = _load_targets(jobs)
+    tasks = []
+    for job in jobs:
+        model, field_name = TARGETS[job.kind]
+        obj = objects.get((job.kind, job.object_id))
+        if obj is None or getattr(obj, field_name).name != job.source:
+            _finish(job, 'superseded')
+            continue
+        try:
+            with model._meta.get_field(field_name).storage.open(job.source) as source:
+                data = source.read()
+        except OSError as exc:
+            _fail(job, exc)
+            continue
+        profile = image_type(job.kind, obj)
+        if executor is None:
+            result = functools.partial(optimize_source, data, profile)
+        else:
+            result = executor.submit(optimize_source, data, profile).result
+        tasks.append((job, obj, data, result))
+
+    for job, obj, data, result in tasks:
+        complete_job(job, obj, data, result)
+    return len(jobs)
+
+
+def drain(batch_size=JOB_BATCH_SIZE, executor=None):
+    """Process batches until no job is waiting; returns how many jobs were taken."""
+    total = 0
+    while True:
+        taken = process_batch(batch_size, executor)
+        total += taken
+        if taken < batch_size:
+            return total
@@ -10,6 +10,8 @@ from django.core.files.storage import default_storage
 from django.conf import settings
 import io
 
+from .codecs import CODECS, EXTENSIONS, available_formats
+
 
 class ImageOptimizer:
     """Handles image optimization for product images"""
@@ -39,20 +41,13 @@ class ImageOptimizer:
     
     @classmethod
     def get_available_formats(cls):
-        """Get list of available image formats"""
-        available_formats = ['JPEG', 'WEBP']
-        
-        # Check if AVIF is available
-        try:
-            from PIL import Image
-            # Try to create a small AVIF image to test support
-            test_img = Image.new('RGB', (1, 1), (255, 255, 255))
-            test_img.save('/tmp/test.avif', format='AVIF')
-            available_formats.append('AVIF')
-        except:
-            pass  # AVIF not available
-        
-        return available_formats
+        """Get list of available image formats (probed once per process)"""
+        return available_formats()
+    
+    @classmethod
+    def save_options(cls, format):
+        """Keyword arguments for Image.save in ``format``"""
+        return {'quality': cls.QUALITY_SETTINGS.get(format, 85), **CODECS[format].options}
     
     @classmethod
     def optimize_image(cls, image_file, image_type='product_primary', target_format='WEBP'):
@@ -99,7 +94,6 @@ class ImageOptimizer:
             
             # Convert to target format with fallback
             output = io.BytesIO()
-            quality = cls.QUALITY_SETTINGS.get(target_format, 85)
             available_formats = cls.get_available_formats()
             
             # Try target format, fallback to available formats
@@ -109,12 +103,7 @@ class ImageOptimizer:
             for fmt in format_priority:
                 if fmt in available_formats:
                     try:
-                        if fmt == 'JPEG':
-                            image.save(output, format='JPEG', quality=quality, optimize=True)
-                        elif fmt == 'WEBP':
-                            image.save(output, format='WEBP', quality=quality, optimize=True)
-                        elif fmt == 'AVIF':
-                            image.save(output, format='AVIF', quality=quality, optimize=True)
+                        image.save(output, format=fmt, **cls.save_options(fmt))
                         successful_format = fmt
                         break
                     except Exception as e:
@@ -192,72 +181,49 @@ class ImageOptimizer:
     def _generate_filename(cls, format):
         """Generate unique filename with proper extension"""
         unique_id = str(uuid.uuid4())[:8]
-        extension = format.lower()
-        if extension == 'jpeg':
-            extension = 'jpg'
-        return f"optimized_{unique_id}.{extension}"
+        return f"optimized_{unique_id}.{EXTENSIONS.get(format, format.lower())}"
     
     @classmethod
     def create_multiple_sizes(cls, image_file, image_type='product_primary'):
         """
         Create multiple sizes of an image for responsive design
-        
+
+        The image is decoded once and each size is scaled down from the
+        next larger one, keeping its aspect ratio and never upscaling.
+
         Returns:
             Dictionary with different sizes
         """
         sizes = {
-            'thumbnail': (200, 200),
-            'medium': (400, 400),
-            'large': (800, 800),
-            'xlarge': (1200, 1200),
+            'thumbnail': 200,
+            'medium': 400,
+            'large': 800,
+            'xlarge': 1200,
         }
-        
+
+        try:
+            image = Image.open(image_file) if hasattr(image_file, 'read') else image_file
+            image = flatten_image(ImageOps.exif_transpose(image))
+        except Exception as e:
+            print(f"Error opening image: {e}")
+            return {}
+
+        target_format = 'WEBP' if 'WEBP' in cls.get_available_formats() else 'JPEG'
+        extension = EXTENSIONS[target_format]
+        names = {width: name for name, width in sizes.items()}
         optimized_images = {}
-        
-        for size_name, dimensions in sizes.items():
+
+        for width, resized in downscale_chain(image, names):
+            size_name = names[width]
             try:
-                # Open original image
-                if hasattr(image_file, 'read'):
-                    image = Image.open(image_file)
-                else:
-                    image = image_file
-                
-                # Resize to specific dimensions
-                image = image.resize(dimensions, Image.Resampling.LANCZOS)
-                
-                # Convert to RGB if necessary
-                if image.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', image.size, (255, 255, 255))
-                    if image.mode == 'P':
-                        image = image.convert('RGBA')
-                    background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                    image = background
-                
-                # Save with format fallback
                 output = io.BytesIO()
-                available_formats = cls.get_available_formats()
-                
-                # Try WebP first, fallback to JPEG
-                if 'WEBP' in available_formats:
-                    try:
-                        image.save(output, format='WEBP', quality=80, optimize=True)
-                        extension = 'webp'
-                    except:
-                        image.save(output, format='JPEG', quality=85, optimize=True)
-                        extension = 'jpg'
-                else:
-                    image.save(output, format='JPEG', quality=85, optimize=True)
-                    extension = 'jpg'
-                
-                output.seek(0)
-                
+                resized.save(output, format=target_format, **cls.save_options(target_format))
                 filename = f"{size_name}_{str(uuid.uuid4())[:8]}.{extension}"
                 optimized_images[size_name] = ContentFile(output.getvalue(), name=filename)
-                
             except Exception as e:
                 print(f"Error creating {size_name} size: {e}")
                 continue
-        
+
         return optimized_images
     
     @classmethod
@@ -300,6 +266,31 @@ class ImageOptimizer:
             return False, f"Invalid image file: {str(e)}"
 
 
+def flatten_image(image):
+    """``image`` as RGB, with transparent areas on white."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def downscale_chain(image, widths):
+    """
+    Yield (width, image) for each of ``widths``, widest first.
+
+    Each step is resized from the one before, so the full-size image is
+    resampled only once; widths wider than the image get it unscaled.
+    """
+    for width in sorted(set(widths), reverse=True):
+        if width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        yield width, image
+
+
 def optimize_product_image(image_file, is_primary=False):
     """
     Convenience function for optimizing product images
@@ -0,0 +1,32 @@
+"""
+Management command to rebuild denormalized product ratings from reviews.
+"""
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating_sum, rating_count and rating_avg for products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of products to recompute per batch (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pks = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+
+        updated = 0
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            updated += recompute_ratings(Product.objects.filter(pk__in=batch))
+            self.stdout.write(f'Recomputed {updated}/{len(pks)} products')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully recomputed ratings for {updated} products')
+        )
@@ -0,0 +1,65 @@
+"""
+Management command to compare image codecs on product-sized images.
+
+Encodes one image with every codec this process supports, using the
+options ImageOptimizer saves with (its QUALITY_SETTINGS), and prints the
+time per encode and the output size. Without --image a synthetic photo
+(gradients and noise, which compress like a real one) is used.
+"""
+import io
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageFilter, ImageOps
+
+from products.codecs import CODECS, available_formats
+from products.image_utils import ImageOptimizer, flatten_image
+
+
+def sample_image(width, height, seed=0):
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40 + seed).filter(ImageFilter.GaussianBlur(1))
+    return Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark encode speed and size of each image codec at the configured quality'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Image file to encode (default: a synthetic photo)')
+        parser.add_argument('--width', type=int, default=800, help='Width to encode at (default: 800)')
+        parser.add_argument('--repeat', type=int, default=10, help='Encodes per codec (default: 10)')
+
+    def handle(self, *args, **options):
+        width = options['width']
+        if options['image']:
+            try:
+                image = flatten_image(ImageOps.exif_transpose(Image.open(options['image'])))
+            except OSError as exc:
+                raise CommandError(f'Cannot read {options["image"]}: {exc}')
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS)
+        else:
+            image = sample_image(width, width)
+
+        supported = available_formats()
+        self.stdout.write(f'Encoding {image.width}x{image.height}, {options["repeat"]} times each')
+        baseline = None
+        for name in CODECS:
+            if name not in supported:
+                self.stdout.write(f'{name:<6} not supported by this Pillow build; skipping it')
+                continue
+            save_options = ImageOptimizer.save_options(name)
+            timings = []
+            for _ in range(options['repeat']):
+                output = io.BytesIO()
+                started = time.perf_counter()
+                image.save(output, format=name, **save_options)
+                timings.append(time.perf_counter() - started)
+            size = output.tell()
+            median = statistics.median(timings) * 1000
+            baseline = baseline or size
+            self.stdout.write(
+                f'{name:<6} quality {save_options["quality"]:>3}  median {median:7.2f} ms  '
+                f'best {min(timings) * 1000:7.2f} ms  {size / 1024:7.1f} KiB  {size / baseline:5.2f}x size'
+            )
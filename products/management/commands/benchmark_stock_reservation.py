@@ -0,0 +1,101 @@
+"""
+Management command to measure stock reservation throughput.
+
+Runs N worker threads that each confirm orders against a shared set of
+scratch products, then checks that no unit was sold twice. The scratch
+category and products are deleted afterwards.
+"""
+import random
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from products.models import Category, Product, StockMovement
+from products.stock import InsufficientStock, reserve_stock
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent stock reservations with N parallel confirmers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Parallel confirmers (default: 8)')
+        parser.add_argument('--orders', type=int, default=200, help='Orders per worker (default: 200)')
+        parser.add_argument('--products', type=int, default=20, help='Scratch products (default: 20)')
+        parser.add_argument('--lines', type=int, default=3, help='Lines per order (default: 3)')
+        parser.add_argument('--stock', type=int, default=500, help='Initial stock per product (default: 500)')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        category = Category.objects.create(category_name=f'Stock benchmark {tag}', category_image='')
+        try:
+            self.run(category, tag, options)
+        finally:
+            category.delete()
+
+    def run(self, category, tag, options):
+        product_ids = [
+            Product.objects.create(
+                product_name=f'Stock benchmark {tag} #{i}',
+                category=category,
+                price=1,
+                product_desription='Scratch product for benchmark_stock_reservation',
+                stock_quantity=options['stock'],
+            ).pk
+            for i in range(options['products'])
+        ]
+        counts = {'confirmed': 0, 'short': 0, 'retries': 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            local = {'confirmed': 0, 'short': 0, 'retries': 0}
+            try:
+                for n in range(options['orders']):
+                    lines = [
+                        (rng.choice(product_ids), rng.randint(1, 3))
+                        for _ in range(options['lines'])
+                    ]
+                    while True:
+                        try:
+                            reserve_stock(lines, reference=f'BENCH-{tag}-{seed}-{n}')
+                            local['confirmed'] += 1
+                        except InsufficientStock:
+                            local['short'] += 1
+                        except OperationalError:
+                            # SQLite allows one writer at a time.
+                            local['retries'] += 1
+                            continue
+                        break
+            finally:
+                connection.close()
+            with lock:
+                for key, value in local.items():
+                    counts[key] += value
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        remaining = Product.objects.filter(pk__in=product_ids).aggregate(total=Sum('stock_quantity'))['total']
+        moved = StockMovement.objects.filter(product_id__in=product_ids).aggregate(total=Sum('quantity'))['total'] or 0
+        attempted = options['workers'] * options['orders']
+
+        self.stdout.write(
+            f"{attempted} orders by {options['workers']} workers in {elapsed:.2f}s "
+            f"({attempted / elapsed:.0f} orders/s): {counts['confirmed']} confirmed, "
+            f"{counts['short']} short of stock, {counts['retries']} retries"
+        )
+        if remaining + moved == options['stock'] * len(product_ids):
+            self.stdout.write(self.style.SUCCESS('Stock is consistent: no unit was sold twice'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'Stock drifted: {remaining} left + {moved} moved != '
+                f"{options['stock'] * len(product_ids)} initial"
+            ))
@@ -1,11 +1,82 @@
 """
 Django management command to optimize existing images
+
+Walks product and category images that were not optimized yet and runs
+them through the same steps as the background image jobs
+(products.image_jobs): originals are decoded and encoded in a pool of
+--workers processes, and each result is swapped in with its renditions.
+Identical originals are encoded once. Progress is written to a checkpoint
+file, so an interrupted run picks up where it stopped.
 """
-from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
-from products.models import ProductImage, Category
-from products.image_utils import ImageOptimizer
+import hashlib
+import json
 import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from products.image_jobs import TARGETS, complete_job, image_type, optimize_source, start_image_job
+from products.models import ImageProcessingJob
+
+LABELS = {
+    'product_image': 'Product Images',
+    'category': 'Category Images',
+}
+
+# Encoded results kept for later duplicates of the same original.
+DEDUPE_CACHE_SIZE = 100
+
+# Completed images between checkpoint writes.
+CHECKPOINT_EVERY = 20
+
+
+def pending_images(kind, category=None, after=None, force=False):
+    """
+    Objects of ``kind`` with an image, by primary key after ``after``.
+
+    Unless ``force``, images an image job already optimized are left out.
+    """
+    model, field_name = TARGETS[kind]
+    queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).order_by('pk')
+    if not force:
+        optimized = ImageProcessingJob.objects.filter(kind=kind, status='done', result=OuterRef(field_name))
+        queryset = queryset.exclude(Exists(optimized))
+    if kind == 'product_image':
+        queryset = queryset.select_related('product')
+        if category:
+            queryset = queryset.filter(product__category__category_name__icontains=category)
+    if after:
+        queryset = queryset.filter(pk__gt=after)
+    return queryset
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path, state):
+    partial = f'{path}.tmp'
+    with open(partial, 'w') as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(partial, path)
+
+
+def run_inline(function, *args):
+    """A completed Future for ``function(*args)``, for runs without a pool."""
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
 
 
 class Command(BaseCommand):
@@ -20,167 +91,148 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Force re-optimization of already optimized images',
+            help='Also re-optimize images the image jobs already optimized',
         )
         parser.add_argument(
             '--category',
             type=str,
             help='Optimize only images for a specific category',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Encoding processes; 1 encodes in this process (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, '.optimize_images.checkpoint'),
+            help='File recording progress, removed once a run completes',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint of an interrupted run and start over',
+        )
 
     def handle(self, *args, **options):
-        dry_run = options['dry_run']
-        force = options['force']
-        category_filter = options.get('category')
+        self.options = options
+        self.checkpoint = {} if options['restart'] else load_checkpoint(options['checkpoint'])
+        if self.checkpoint:
+            self.stdout.write(f"Resuming from {options['checkpoint']}")
 
         self.stdout.write(
             self.style.SUCCESS('Starting image optimization process...')
         )
+        executor = None
+        if options['workers'] > 1 and not options['dry_run']:
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+        try:
+            for kind in TARGETS:
+                self.optimize(kind, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if not options['dry_run']:
+                save_checkpoint(options['checkpoint'], self.checkpoint)
 
-        # Optimize product images
-        self.optimize_product_images(dry_run, force, category_filter)
-        
-        # Optimize category images
-        self.optimize_category_images(dry_run, force)
-
+        if not options['dry_run']:
+            os.remove(options['checkpoint'])
         self.stdout.write(
             self.style.SUCCESS('Image optimization process completed!')
         )
 
-    def optimize_product_images(self, dry_run, force, category_filter):
-        """Optimize product images"""
-        self.stdout.write('\n--- Optimizing Product Images ---')
-        
-        # Build query
-        query = ProductImage.objects.all()
-        if category_filter:
-            query = query.filter(product__category__category_name__icontains=category_filter)
-        
-        if not force:
-            # Skip already optimized images
-            query = query.filter(optimized_size__isnull=True)
-        
-        total_images = query.count()
-        self.stdout.write(f'Found {total_images} product images to optimize')
-        
-        if total_images == 0:
-            self.stdout.write('No product images to optimize')
-            return
-        
-        optimized_count = 0
-        error_count = 0
-        
-        for i, product_image in enumerate(query, 1):
+    def optimize(self, kind, executor):
+        """Optimize every pending image of ``kind``, keeping up to two per worker in flight."""
+        model, field_name = TARGETS[kind]
+        storage = model._meta.get_field(field_name).storage
+        self.stdout.write(f'\n--- Optimizing {LABELS[kind]} ---')
+
+        queryset = pending_images(
+            kind, self.options['category'], self.checkpoint.get(kind), self.options['force'],
+        )
+
+        stats = dict(found=0, optimized=0, duplicates=0, skipped=0, errors=0, before=0, after=0)
+        results = OrderedDict()
+        in_flight = deque()
+        window = 2 * max(self.options['workers'], 1)
+        started = time.monotonic()
+
+        for obj in queryset.iterator(chunk_size=200):
+            name = getattr(obj, field_name).name
             try:
-                self.stdout.write(f'Processing {i}/{total_images}: {product_image.product.product_name}')
-                
-                if not dry_run:
-                    # Check if image file exists
-                    if not product_image.image or not os.path.exists(product_image.image.path):
-                        self.stdout.write(
-                            self.style.WARNING(f'  ⚠️  Image file not found: {product_image.image}')
-                        )
-                        error_count += 1
-                        continue
-                    
-                    # Optimize image
-                    with transaction.atomic():
-                        # Re-save to trigger optimization
-                        product_image.save()
-                    
-                    # Get optimization info
-                    info = product_image.get_optimization_info()
-                    if info:
-                        self.stdout.write(
-                            f'  ✅ Optimized: {info["original_size"]} → {info["optimized_size"]} bytes '
-                            f'({info["savings_percent"]}% savings)'
-                        )
-                    else:
-                        self.stdout.write('  ✅ Optimized (no size info available)')
-                    
-                    optimized_count += 1
-                else:
-                    self.stdout.write(f'  🔍 Would optimize: {product_image.image}')
-                    optimized_count += 1
-                    
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'  ❌ Error optimizing {product_image.product.product_name}: {e}')
-                )
-                error_count += 1
-        
-        self.stdout.write(f'\nProduct Images Summary:')
-        self.stdout.write(f'  Optimized: {optimized_count}')
-        self.stdout.write(f'  Errors: {error_count}')
-        self.stdout.write(f'  Total: {total_images}')
-
-    def optimize_category_images(self, dry_run, force):
-        """Optimize category images"""
-        self.stdout.write('\n--- Optimizing Category Images ---')
-        
-        # Build query
-        query = Category.objects.all()
-        if not force:
-            # Skip already optimized images
-            query = query.filter(optimized_size__isnull=True)
-        
-        total_categories = query.count()
-        self.stdout.write(f'Found {total_categories} category images to optimize')
-        
-        if total_categories == 0:
-            self.stdout.write('No category images to optimize')
+                with storage.open(name) as source:
+                    data = source.read()
+            except OSError:
+                self.stdout.write(self.style.WARNING(f'  Image file not found: {name}'))
+                stats['errors'] += 1
+                continue
+            stats['found'] += 1
+
+            profile = image_type(kind, obj)
+            key = (hashlib.sha256(data).hexdigest(), profile)
+            if key in results:
+                results.move_to_end(key)
+                stats['duplicates'] += 1
+            elif self.options['dry_run']:
+                results[key] = None
+            elif executor is None:
+                results[key] = run_inline(optimize_source, data, profile)
+            else:
+                results[key] = executor.submit(optimize_source, data, profile)
+            while len(results) > DEDUPE_CACHE_SIZE:
+                results.popitem(last=False)
+
+            if self.options['dry_run']:
+                self.stdout.write(f'  Would optimize: {name}')
+                stats['before'] += len(data)
+                continue
+            in_flight.append((obj, data, results[key]))
+            while len(in_flight) > window:
+                self.finish(kind, *in_flight.popleft(), stats)
+
+        while in_flight:
+            self.finish(kind, *in_flight.popleft(), stats)
+        self.report(LABELS[kind], stats, time.monotonic() - started)
+
+    def finish(self, kind, obj, data, future, stats):
+        """Swap in one finished encode and move the checkpoint past ``obj``."""
+        job = start_image_job(kind, obj)
+        status = complete_job(job, obj, data, future.result)
+        if status == 'done':
+            stats['optimized'] += 1
+            stats['before'] += job.original_size
+            stats['after'] += job.optimized_size
+        elif status == 'superseded':
+            stats['skipped'] += 1
+        else:
+            self.stdout.write(self.style.ERROR(f'  Error optimizing {job.source}: {job.last_error}'))
+            stats['errors'] += 1
+
+        self.checkpoint[kind] = str(obj.pk)
+        done = stats['optimized'] + stats['skipped'] + stats['errors']
+        if done % CHECKPOINT_EVERY == 0:
+            save_checkpoint(self.options['checkpoint'], self.checkpoint)
+
+    def report(self, label, stats, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        self.stdout.write(f'\n{label} Summary:')
+        if self.options['dry_run']:
+            self.stdout.write(
+                f"  Would optimize: {stats['found']} ({stats['duplicates']} duplicates, "
+                f"{stats['before'] / 1024:.0f} KiB of originals)"
+            )
             return
-        
-        optimized_count = 0
-        error_count = 0
-        
-        for i, category in enumerate(query, 1):
-            try:
-                self.stdout.write(f'Processing {i}/{total_categories}: {category.category_name}')
-                
-                if not dry_run:
-                    # Check if image file exists
-                    if not category.category_image or not os.path.exists(category.category_image.path):
-                        self.stdout.write(
-                            self.style.WARNING(f'  ⚠️  Image file not found: {category.category_image}')
-                        )
-                        error_count += 1
-                        continue
-                    
-                    # Optimize image
-                    with transaction.atomic():
-                        # Re-save to trigger optimization
-                        category.save()
-                    
-                    # Get optimization info
-                    info = category.get_optimization_info()
-                    if info:
-                        self.stdout.write(
-                            f'  ✅ Optimized: {info["original_size"]} → {info["optimized_size"]} bytes '
-                            f'({info["savings_percent"]}% savings)'
-                        )
-                    else:
-                        self.stdout.write('  ✅ Optimized (no size info available)')
-                    
-                    optimized_count += 1
-                else:
-                    self.stdout.write(f'  🔍 Would optimize: {category.category_image}')
-                    optimized_count += 1
-                    
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'  ❌ Error optimizing {category.category_name}: {e}')
-                )
-                error_count += 1
-        
-        self.stdout.write(f'\nCategory Images Summary:')
-        self.stdout.write(f'  Optimized: {optimized_count}')
-        self.stdout.write(f'  Errors: {error_count}')
-        self.stdout.write(f'  Total: {total_categories}')
-
-    def get_file_size(self, file_path):
-        """Get file size in bytes"""
-        try:
-            return os.path.getsize(file_path)
-        except OSError:
-            return 0
+        self.stdout.write(f"  Optimized: {stats['optimized']} ({stats['duplicates']} duplicate originals encoded once)")
+        self.stdout.write(f"  Skipped (replaced meanwhile): {stats['skipped']}")
+        self.stdout.write(f"  Errors: {stats['errors']}")
+        saved = stats['before'] - stats['after']
+        if stats['optimized']:
+            self.stdout.write(
+                f"  Size: {stats['before'] / 1024:.0f} KiB -> {stats['after'] / 1024:.0f} KiB, "
+                f"{saved / 1024:.0f} KiB saved ({100 * saved / stats['before']:.1f}%)"
+            )
+        self.stdout.write(
+            f"  Throughput: {stats['optimized'] / elapsed:.1f} images/s, "
+            f"{stats['before'] / elapsed / 1024 ** 2:.2f} MiB/s of originals in {elapsed:.1f}s"
+        )
@@ -0,0 +1,60 @@
+"""
+Management command to optimize queued image uploads.
+
+Run it from cron, or keep one running with --loop. Decoding and encoding
+happen in a pool of --workers processes.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from products.image_jobs import JOB_BATCH_SIZE, drain
+
+
+class Command(BaseCommand):
+    help = 'Optimize uploaded product and category images queued by their saves'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=JOB_BATCH_SIZE,
+            help=f'Jobs claimed at a time (default: {JOB_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Encoding processes; 1 encodes in this process (default: one per CPU)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting once it is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls with --loop (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        executor = None
+        if options['workers'] > 1:
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+        try:
+            while True:
+                taken = drain(options['batch_size'], executor)
+                if taken or not options['loop']:
+                    self.stdout.write(
+                        self.style.SUCCESS(f'Processed {taken} image job(s)')
+                    )
+                if not options['loop']:
+                    return
+                if not taken:
+                    time.sleep(options['interval'])
+        finally:
+            if executor is not None:
+                executor.shutdown()
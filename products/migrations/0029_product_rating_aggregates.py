@@ -0,0 +1,51 @@
+# Generated manually for denormalized product rating aggregates
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_ratings(apps, schema_editor):
+    """Fill the new columns from existing reviews"""
+    Product = apps.get_model('products', 'Product')
+    products = Product.objects.annotate(
+        review_sum=Coalesce(Sum('reviews__stars'), 0),
+        review_count=Count('reviews'),
+    ).filter(review_count__gt=0)
+
+    updated = [
+        Product(
+            pk=product.pk,
+            rating_sum=product.review_sum,
+            rating_count=product.review_count,
+            rating_avg=product.review_sum / product.review_count,
+        )
+        for product in products.only('pk').iterator()
+    ]
+    Product.objects.bulk_update(updated, ['rating_sum', 'rating_count', 'rating_avg'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0028_merge_20251022_1934'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated manually for database full-text product search
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+POSTGRES_BACKFILL = """
+UPDATE products_product p SET search_vector =
+    setweight(to_tsvector('english', coalesce(p.product_name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(p.keywords, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(c.category_name, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(p.product_desription, '')), 'D')
+FROM products_category c WHERE c.uid = p.category_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """GIN indexes on PostgreSQL, an FTS5 table on SQLite; both backfilled"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX products_product_search_vector_gin '
+            'ON products_product USING gin (search_vector)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX products_product_name_trgm '
+            'ON products_product USING gin (product_name gin_trgm_ops)'
+        )
+        schema_editor.execute(POSTGRES_BACKFILL)
+    elif vendor == 'sqlite':
+        from products import fulltext
+        fulltext.rebuild()
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS products_product_search_vector_gin')
+        schema_editor.execute('DROP INDEX IF EXISTS products_product_name_trgm')
+    elif vendor == 'sqlite':
+        from products import fulltext
+        schema_editor.execute(f'DROP TABLE IF EXISTS {fulltext.FTS_TABLE}')
+        fulltext._fts_ready = None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0029_product_rating_aggregates'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
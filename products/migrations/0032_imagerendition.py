@@ -0,0 +1,33 @@
+# Generated manually for responsive image renditions
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0031_imageprocessingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('source', models.CharField(db_index=True, help_text='Storage name of the image it was made from', max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(choices=[('AVIF', 'AVIF'), ('WEBP', 'WebP'), ('JPEG', 'JPEG')], max_length=4)),
+                ('file', models.FileField(max_length=255, upload_to='renditions')),
+                ('size', models.PositiveIntegerField(help_text='File size in bytes')),
+            ],
+            options={
+                'ordering': ['source', 'width'],
+                'constraints': [models.UniqueConstraint(fields=('source', 'width', 'format'), name='unique_image_rendition')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated manually for content-addressed image storage
+
+import uuid
+
+import products.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0032_imagerendition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveIntegerField(help_text='File size in bytes')),
+                ('refs', models.PositiveIntegerField(default=0, help_text='Saves not yet deleted')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='category_image',
+            field=models.ImageField(help_text='Upload any image format. Will be automatically optimized for web use.', storage=products.storage.get_content_storage, upload_to='catgories'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(help_text='Upload any image format. Will be automatically optimized for web use.', storage=products.storage.get_content_storage, upload_to='product'),
+        ),
+        migrations.AlterField(
+            model_name='imagerendition',
+            name='file',
+            field=models.FileField(max_length=255, storage=products.storage.get_content_storage, upload_to='renditions'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated manually for keying the SQLite full-text table by product uid
+
+from django.db import migrations
+
+
+def recreate_fts_table(apps, schema_editor):
+    """Rebuild the FTS5 table with its uid column (rowids are not stable)"""
+    if schema_editor.connection.vendor == 'sqlite':
+        from products import fulltext
+        schema_editor.execute(f'DROP TABLE IF EXISTS {fulltext.FTS_TABLE}')
+        fulltext.rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0033_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_fts_table, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.utils.text import slugify
 import uuid
 import random
 import string
 
+from .storage import get_content_storage
+
 
 class BaseModel(models.Model):
     uid = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
@@ -18,6 +21,7 @@ class Category(BaseModel):
     category_name = models.CharField(max_length=100)
     category_image = models.ImageField(
         upload_to="catgories",
+        storage=get_content_storage,
         help_text="Upload any image format. Will be automatically optimized for web use."
     )
     slug = models.SlugField(unique=True, null=True, blank=True)
@@ -29,35 +33,34 @@ class Category(BaseModel):
 
     def save(self, *args, **kwargs):
         # Import here to avoid circular imports
-        from .image_utils import optimize_category_image, ImageOptimizer
-        
-        # If this is a new image or image is being updated
-        if self.category_image and hasattr(self.category_image, 'file'):
-            # Validate image
+        from .image_utils import ImageOptimizer
+        from .image_jobs import enqueue_image_job
+
+        # A new upload is validated now, stored as it came and optimized in
+        # the background by process_image_jobs.
+        uploaded = bool(self.category_image) and not self.category_image._committed
+        if uploaded:
             is_valid, error_message = ImageOptimizer.validate_image(self.category_image)
             if not is_valid:
                 raise ValueError(f"Image validation failed: {error_message}")
-            
-            # Optimize image
-            try:
-                optimized_image = optimize_category_image(self.category_image)
-                # Replace with optimized version
-                self.category_image = optimized_image
-                print(f"Category image optimized successfully")
-            except Exception as e:
-                print(f"Warning: Category image optimization failed: {e}")
-                # Continue with original image if optimization fails
-        
+
         self.slug = slugify(self.category_name)
-        super(Category, self).save(*args, **kwargs)
+        with transaction.atomic():
+            super(Category, self).save(*args, **kwargs)
+            if uploaded:
+                enqueue_image_job('category', self)
+
+        # The category name is part of every product's search text
+        from .fulltext import refresh
+        refresh(self.products.all())
 
     def __str__(self):
         return self.category_name
     
     def get_optimization_info(self):
         """Get information about image optimization"""
-        # Temporarily return None since optimization fields are not available
-        return None
+        job = ImageProcessingJob.latest_for('category', self.pk)
+        return job.as_info() if job else None
 
 
 class ColorVariant(BaseModel):
@@ -148,6 +151,23 @@ class Product(BaseModel):
     ]
     section = models.CharField(max_length=10, choices=SECTION_CHOICES, default='mart', help_text="Which section this product belongs to")
     
+    # Review aggregates, kept in sync by products.signals
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)
+    
+    # Weighted full-text document, maintained by products.fulltext (PostgreSQL only)
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+    SEARCH_FIELDS = ('product_name', 'keywords', 'category', 'product_desription')
+    # Maintained by products.ratings with F() deltas; a save of a loaded
+    # instance never writes them back.
+    RATING_FIELDS = ('rating_sum', 'rating_count', 'rating_avg')
+    # Fields that decide which product lists show a product, and in what order.
+    LISTING_FIELDS = (
+        'product_name', 'slug', 'category', 'parent', 'price', 'is_in_stock', 'section',
+        'is_featured', 'is_bestseller', 'is_new_arrival', 'newest_product',
+    )
+    
     # Product relationships (non-symmetrical for ecommerce)
     related_products = models.ManyToManyField('self', blank=True, symmetrical=False, related_name="related_to")
     bundle_products = models.ManyToManyField('self', blank=True, symmetrical=False, related_name="bundled_with")
@@ -166,9 +186,20 @@ class Product(BaseModel):
         # Update has_size_variants based on child products
         if self.pk:
             self.has_size_variants = self.child_products.exists()
+
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name not in self.RATING_FIELDS]
         
         super(Product, self).save(*args, **kwargs)
 
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(self.SEARCH_FIELDS):
+            from .fulltext import refresh
+            refresh(Product.objects.filter(pk=self.pk))
+
     def __str__(self) -> str:
         return self.product_name
 
@@ -200,6 +231,8 @@ class Product(BaseModel):
     
     def has_size_variants(self):
         """Check if this product has size variants (child products)"""
+        if 'child_products' in getattr(self, '_prefetched_objects_cache', {}):
+            return bool(self.child_products.all())
         return self.child_products.exists()
     
     def get_display_price(self):
@@ -209,12 +242,7 @@ class Product(BaseModel):
         return self.price  # Show price for standalone products
 
     def get_rating(self):
-        total = sum(int(review['stars']) for review in self.reviews.values())
-
-        if self.reviews.count() > 0:
-            return total / self.reviews.count()
-        else:
-            return 0
+        return self.rating_avg
     
     def update_stock(self, quantity):
         """Update stock quantity and check if product is in stock."""
@@ -264,6 +292,7 @@ class ProductImage(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="product_images")
     image = models.ImageField(
         upload_to="product",
+        storage=get_content_storage,
         help_text="Upload any image format. Will be automatically optimized for web use."
     )
     alt_text = models.CharField(max_length=200, blank=True)
@@ -280,34 +309,29 @@ class ProductImage(BaseModel):
     
     def save(self, *args, **kwargs):
         # Import here to avoid circular imports
-        from .image_utils import optimize_product_image, ImageOptimizer
-        
-        # If this is a new image or image is being updated
-        if self.image and hasattr(self.image, 'file'):
-            # Validate image
+        from .image_utils import ImageOptimizer
+        from .image_jobs import enqueue_image_job
+
+        # A new upload is validated now, stored as it came and optimized in
+        # the background by process_image_jobs.
+        uploaded = bool(self.image) and not self.image._committed
+        if uploaded:
             is_valid, error_message = ImageOptimizer.validate_image(self.image)
             if not is_valid:
                 raise ValueError(f"Image validation failed: {error_message}")
-            
-            # Optimize image
-            try:
-                optimized_image = optimize_product_image(self.image, self.is_primary)
-                # Replace with optimized version
-                self.image = optimized_image
-                print(f"Product image optimized successfully")
-            except Exception as e:
-                print(f"Warning: Image optimization failed: {e}")
-                # Continue with original image if optimization fails
-        
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if uploaded:
+                enqueue_image_job('product_image', self)
     
     def __str__(self):
         return f"{self.product.product_name} - Image {self.sort_order}"
     
     def get_optimization_info(self):
         """Get information about image optimization"""
-        # Temporarily return None since optimization fields are not available
-        return None
+        job = ImageProcessingJob.latest_for('product_image', self.pk)
+        return job.as_info() if job else None
 
 
 class ProductReview(BaseModel):
@@ -416,4 +440,103 @@ class Barcode(BaseModel):
             
             # Check if barcode already exists
             if not Barcode.objects.filter(barcode_value=barcode).exists():
-                return barcode
\ No newline at end of file
+                return barcode
+
+
+class ImageProcessingJob(BaseModel):
+    """
+    An uploaded image waiting to be optimized.
+
+    Saving a ProductImage or Category with a new upload stores the file as
+    it came and queues a job in the same transaction; products.image_jobs
+    works the queue in the background. The table is the queue: no broker.
+    """
+    KIND_CHOICES = [
+        ('product_image', 'Product image'),
+        ('category', 'Category image'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('superseded', 'Superseded'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.UUIDField(db_index=True)
+    source = models.CharField(max_length=255, help_text="Storage name of the uploaded original")
+    result = models.CharField(max_length=255, blank=True, help_text="Storage name of the optimized image")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    original_size = models.PositiveIntegerField(null=True, blank=True)
+    optimized_size = models.PositiveIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='image_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id} ({self.status})"
+
+    @classmethod
+    def latest_for(cls, kind, object_id):
+        return cls.objects.filter(kind=kind, object_id=object_id).order_by('-created_at').first()
+
+    def as_info(self):
+        return {
+            'status': self.status,
+            'original_size': self.original_size,
+            'optimized_size': self.optimized_size,
+            'error': self.last_error,
+            'finished_at': self.finished_at,
+        }
+
+
+class ImageRendition(BaseModel):
+    """
+    One width and format of a stored product or category image.
+
+    Keyed by the storage name of the image it was made from; see
+    products.renditions.
+    """
+    FORMAT_CHOICES = [
+        ('AVIF', 'AVIF'),
+        ('WEBP', 'WebP'),
+        ('JPEG', 'JPEG'),
+    ]
+
+    source = models.CharField(max_length=255, db_index=True, help_text="Storage name of the image it was made from")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    file = models.FileField(upload_to='renditions', max_length=255, storage=get_content_storage)
+    size = models.PositiveIntegerField(help_text="File size in bytes")
+
+    class Meta:
+        ordering = ['source', 'width']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'width', 'format'], name='unique_image_rendition'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.width}w {self.format}"
+
+
+class StoredBlob(BaseModel):
+    """
+    A file in content-addressed storage and how many names point at it.
+
+    Maintained by products.storage.ContentAddressedStorage.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveIntegerField(help_text="File size in bytes")
+    refs = models.PositiveIntegerField(default=0, help_text="Saves not yet deleted")
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
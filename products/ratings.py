@@ -0,0 +1,71 @@
+"""
+Denormalized review aggregates stored on Product.
+
+rating_sum and rating_count are adjusted with F() deltas as reviews are
+written, so concurrent reviews never overwrite each other's totals, and
+rating_avg is derived from them in the same transaction. Product.save()
+leaves the three columns out of its UPDATE, so an edit made on an older
+copy of a product cannot write old totals back. The ratings are part of
+the search documents, so each delta also queues the product for
+reindexing.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from search.indexing import enqueue
+
+
+def _average_expression():
+    return Case(
+        When(rating_count__gt=0, then=Cast(F('rating_sum'), FloatField()) / F('rating_count')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating_delta(product_id, stars_delta, count_delta):
+    """Shift a product's rating totals by the given amounts."""
+    from .models import Product
+
+    if not stars_delta and not count_delta:
+        return
+    products = Product.objects.filter(pk=product_id)
+    with transaction.atomic():
+        # Clamped at zero: after drift a removal could otherwise break the
+        # unsigned columns. backfill_ratings repairs the totals.
+        products.update(
+            rating_sum=Greatest(F('rating_sum') + stars_delta, 0),
+            rating_count=Greatest(F('rating_count') + count_delta, 0),
+        )
+        products.update(rating_avg=_average_expression())
+        enqueue('product', [product_id])
+
+
+def recompute_ratings(products):
+    """
+    Rebuild the aggregates of a Product queryset from its reviews.
+
+    Used by the backfill command to repair drift, e.g. after reviews were
+    changed with queryset.update(), which does not send signals.
+    Returns the number of products updated.
+    """
+    from .models import Product
+
+    totals = products.annotate(
+        review_sum=Coalesce(Sum('reviews__stars'), 0),
+        review_count=Count('reviews'),
+    ).values_list('pk', 'review_sum', 'review_count')
+
+    updated = []
+    for pk, review_sum, review_count in totals.iterator():
+        updated.append(Product(
+            pk=pk,
+            rating_sum=review_sum,
+            rating_count=review_count,
+            rating_avg=review_sum / review_count if review_count else 0,
+        ))
+    with transaction.atomic():
+        Product.objects.bulk_update(updated, ['rating_sum', 'rating_count', 'rating_avg'], batch_size=500)
+        enqueue('product', [product.pk for product in updated])
+    return len(updated)
@@ -0,0 +1,136 @@
+"""
+Responsive renditions of product and category images.
+
+Each stored image gets a set of ImageRendition rows, one per (width,
+format), generated from a single decode: the image is scaled down width by
+width along one downscale_chain, and every step is encoded once per format.
+The background image jobs create them alongside the optimized image; the
+``picture`` template tag turns them into ``<picture>``/``srcset`` markup.
+
+Renditions belong to an image's storage name, which changes whenever the
+image is replaced, so a set never goes stale; lookups are cached per name.
+"""
+import hashlib
+import io
+import os
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .codecs import EXTENSIONS, MIME_TYPES
+from .image_utils import ImageOptimizer, downscale_chain, flatten_image
+from .models import ImageRendition
+
+# The sizes ImageOptimizer.create_multiple_sizes has always produced.
+RENDITION_WIDTHS = (200, 400, 800, 1200)
+
+# Most preferred first: <picture> offers them in this order.
+RENDITION_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+
+CACHE_PREFIX = 'renditions:'
+
+
+def encode(image, format):
+    output = io.BytesIO()
+    image.save(output, format=format, **ImageOptimizer.save_options(format))
+    return output.getvalue()
+
+
+def render_renditions(image, widths=RENDITION_WIDTHS, formats=None):
+    """
+    Encode ``image`` (a PIL image, or bytes) at every width and format.
+
+    Returns [(width, height, format, bytes), ...]. Formats the encoder
+    cannot write are skipped.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    image = flatten_image(ImageOps.exif_transpose(image))
+    if formats is None:
+        formats = [fmt for fmt in RENDITION_FORMATS if fmt in ImageOptimizer.get_available_formats()]
+    renditions = []
+    # Widths past the image's own collapse into one unscaled rendition.
+    for _, step in downscale_chain(image, {min(width, image.width) for width in widths}):
+        for format in formats:
+            try:
+                renditions.append((step.width, step.height, format, encode(step, format)))
+            except (OSError, KeyError, ValueError):
+                continue
+    return renditions
+
+
+def rendition_name(source, width, format):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    digest = hashlib.md5(source.encode()).hexdigest()[:8]
+    return f'renditions/{stem}-{digest}-{width}w.{EXTENSIONS[format]}'
+
+
+def _cache_key(source):
+    return CACHE_PREFIX + hashlib.md5(source.encode()).hexdigest()
+
+
+def store_renditions(source, renditions, storage):
+    """
+    Save rendered files and their rows for the image stored as ``source``.
+
+    Replaces any previous set; call inside the transaction that makes
+    ``source`` visible. Returns the new ImageRendition rows.
+    """
+    rows = [
+        ImageRendition(
+            source=source, width=width, height=height, format=format,
+            file=storage.save(rendition_name(source, width, format), ContentFile(data)),
+            size=len(data),
+        )
+        for width, height, format, data in renditions
+    ]
+    delete_renditions([source], storage)
+    created = ImageRendition.objects.bulk_create(rows)
+    transaction.on_commit(lambda: cache.delete(_cache_key(source)))
+    return created
+
+
+def delete_renditions(sources, storage):
+    """Drop the renditions of ``sources``; their files go once the transaction commits."""
+    stale = ImageRendition.objects.filter(source__in=sources)
+    files = list(stale.values_list('file', flat=True))
+    if not files:
+        return
+    stale.delete()
+
+    def remove():
+        for name in files:
+            storage.delete(name)
+        cache.delete_many([_cache_key(source) for source in sources])
+
+    transaction.on_commit(remove)
+
+
+def renditions_of(field_file):
+    """
+    The renditions of a stored image, as dicts grouped by format.
+
+    {'WEBP': [{'url', 'width', 'height'}, ...], ...}, narrowest first;
+    empty until the image's job has run.
+    """
+    if not field_file:
+        return {}
+    key = _cache_key(field_file.name)
+    grouped = cache.get(key)
+    if grouped is None:
+        grouped = {}
+        rows = ImageRendition.objects.filter(source=field_file.name).order_by('width')
+        for rendition in rows:
+            grouped.setdefault(rendition.format, []).append({
+                'url': rendition.file.url,
+                'width': rendition.width,
+                'height': rendition.height,
+            })
+        cache.set(key, grouped, None)
+    return grouped
+
+
+def srcset(renditions):
+    return ', '.join(f"{rendition['url']} {rendition['width']}w" for rendition in renditions)
@@ -0,0 +1,141 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from api.cache_utils import bump_tags, product_tags
+from .models import Product, Category, ProductImage, ProductReview, Barcode
+from . import fulltext
+from .ratings import apply_rating_delta
+from .image_jobs import image_in_use
+from .renditions import delete_renditions
+
+
+# Rating aggregates are registered before the cache receivers below so pages
+# are invalidated only once the new totals are written.
+
+@receiver(pre_save, sender=ProductReview)
+def remember_previous_rating(sender, instance, **kwargs):
+    """
+    Keep the stored stars and product of an edited review so post_save can
+    apply the difference.
+    """
+    instance._previous_rating = None
+    if not instance._state.adding:
+        instance._previous_rating = ProductReview.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'stars'
+        ).first()
+
+
+@receiver(post_save, sender=ProductReview)
+def add_review_to_rating(sender, instance, created, **kwargs):
+    stars = int(instance.stars)
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        apply_rating_delta(instance.product_id, stars, 1)
+    elif previous[0] == instance.product_id:
+        apply_rating_delta(instance.product_id, stars - int(previous[1]), 0)
+    else:
+        apply_rating_delta(previous[0], -int(previous[1]), -1)
+        apply_rating_delta(instance.product_id, stars, 1)
+    _refresh_loaded_product(instance)
+
+
+@receiver(post_delete, sender=ProductReview)
+def remove_review_from_rating(sender, instance, **kwargs):
+    apply_rating_delta(instance.product_id, -int(instance.stars), -1)
+    _refresh_loaded_product(instance)
+
+
+def _refresh_loaded_product(review):
+    """Reload the totals on a product instance the caller already holds."""
+    if not ProductReview.product.is_cached(review):
+        return
+    try:
+        review.product.refresh_from_db(fields=['rating_sum', 'rating_count', 'rating_avg'])
+    except Product.DoesNotExist:
+        pass
+
+
+@receiver(pre_save, sender=Product)
+def remember_listing_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Note whether a save of an existing product changes how it is listed,
+    so stock edits leave the catalog lists cached, and whether it changes
+    its searchable text, which other processes' search indexes watch for.
+    """
+    instance._listing_changed = instance._search_changed = True
+    if instance._state.adding:
+        return
+    fields = list(dict.fromkeys(Product.LISTING_FIELDS + Product.SEARCH_FIELDS))
+    if update_fields is not None:
+        fields = [name for name in fields if name in update_fields]
+    attnames = [Product._meta.get_field(name).attname for name in fields]
+    stored = Product.objects.filter(pk=instance.pk).values(*attnames).first() if fields else {}
+    if stored is None:
+        return
+    changed = {
+        name for name, attname in zip(fields, attnames)
+        if stored[attname] != getattr(instance, attname)
+    }
+    instance._listing_changed = bool(changed & set(Product.LISTING_FIELDS))
+    instance._search_changed = bool(changed & set(Product.SEARCH_FIELDS))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    """
+    Bump the cache tags of a product when it changes.
+    """
+    tags = product_tags(instance, listing=getattr(instance, '_listing_changed', True))
+    if getattr(instance, '_search_changed', True):
+        tags.append('search')
+    bump_tags(*tags)
+    instance._listing_changed = instance._search_changed = True
+
+
+@receiver(pre_delete, sender=Product)
+def remove_product_from_fulltext(sender, instance, **kwargs):
+    """
+    The SQLite full-text table is keyed by the row it is about to lose.
+    """
+    fulltext.remove(Product.objects.filter(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    """
+    Category names and images show up on every product listing.
+    """
+    bump_tags('categories', f'category:{instance.pk}', 'products')
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductReview)
+@receiver([post_save, post_delete], sender=Barcode)
+def invalidate_related_product_cache(sender, instance, **kwargs):
+    """
+    Images, reviews and barcodes are rendered as part of their product.
+    """
+    try:
+        product = instance.product
+    except Product.DoesNotExist:
+        return
+    bump_tags(*product_tags(product))
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=Category)
+def release_deleted_image(sender, instance, **kwargs):
+    """
+    Drop the deleted row's reference to its image blob, and the renditions
+    once no other image uses the same file.
+    """
+    field = sender._meta.get_field('image' if sender is ProductImage else 'category_image')
+    image = field.value_from_object(instance)
+    if not image:
+        return
+    name = image.name
+    if not image_in_use(name):
+        delete_renditions([name], field.storage)
+    # Files saved before content-addressed storage are not counted; leave them.
+    if field.storage.is_blob(name):
+        transaction.on_commit(lambda: field.storage.delete(name))
@@ -0,0 +1,249 @@
+"""
+Stock reservation without read-modify-write.
+
+Each line is deducted with a conditional UPDATE
+(``stock_quantity = stock_quantity - n WHERE stock_quantity >= n``), so two
+workers confirming orders for the same product can never both take the last
+units, and no row is read or locked before it is written. All lines of a
+reservation run in one transaction, in primary-key order so concurrent
+reservations lock rows in the same order, and any shortfall rolls the whole
+reservation back.
+
+These writes bypass the model signals, so the changed products are put on
+the search indexing queue here, in the same transaction.
+"""
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import BooleanField, Case, F, Value, When
+from django.utils import timezone
+
+from api.cache_utils import bump_tags, product_tags
+from search.indexing import enqueue
+from .models import Product, StockMovement
+
+
+class InsufficientStock(Exception):
+    """Raised when a reservation cannot be met; nothing was deducted."""
+
+    def __init__(self, shortages):
+        # [(product_id, product_name, requested, available), ...]
+        self.shortages = shortages
+        super().__init__(', '.join(
+            f'{name}: only {available} available, but {requested} requested'
+            for _, name, requested, available in shortages
+        ))
+
+
+def _merge_lines(lines):
+    """Sum quantities per product and sort by primary key."""
+    to_pk = Product._meta.pk.to_python
+    merged = {}
+    for product_id, quantity in lines:
+        if product_id is None or quantity <= 0:
+            continue
+        product_id = to_pk(product_id)
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return OrderedDict(sorted(merged.items(), key=lambda line: str(line[0])))
+
+
+def reserve_stock(lines, reference='', reason='', user=None):
+    """
+    Deduct stock for ``lines``, an iterable of (product_id, quantity).
+
+    Either every line is deducted, a StockMovement is recorded for each and
+    the product caches are invalidated on commit, or InsufficientStock is
+    raised and nothing changes. Returns {product_id: quantity} as deducted.
+    """
+    lines = _merge_lines(lines)
+    if not lines:
+        return {}
+
+    now = timezone.now()
+    with transaction.atomic():
+        short = []
+        for product_id, quantity in lines.items():
+            deducted = Product.objects.filter(
+                pk=product_id, stock_quantity__gte=quantity,
+            ).update(
+                # Evaluated against the row before the update.
+                is_in_stock=Case(
+                    When(stock_quantity__gt=quantity, then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField(),
+                ),
+                stock_quantity=F('stock_quantity') - quantity,
+                updated_at=now,
+            )
+            if not deducted:
+                short.append(product_id)
+
+        products = Product.objects.only(
+            'uid', 'product_name', 'slug', 'category', 'parent', 'stock_quantity',
+        ).in_bulk(lines.keys())
+
+        if short:
+            raise InsufficientStock([
+                (
+                    product_id,
+                    products[product_id].product_name if product_id in products else str(product_id),
+                    lines[product_id],
+                    products[product_id].stock_quantity if product_id in products else 0,
+                )
+                for product_id in short
+            ])
+
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                product_id=product_id,
+                movement_type='out',
+                quantity=quantity,
+                reason=reason,
+                reference=reference,
+                user=user,
+            )
+            for product_id, quantity in lines.items()
+        ])
+        enqueue('product', lines.keys())
+        # Only a product that just sold out changes the catalog lists.
+        bump_tags(*{
+            tag for product in products.values()
+            for tag in product_tags(product, listing=product.stock_quantity == 0)
+        })
+    return dict(lines)
+
+
+def reserve_order_stock(order, user=None):
+    """Deduct the stock of every item of an order in one reservation."""
+    return reserve_stock(
+        order.order_items.values_list('product_id', 'quantity'),
+        reference=order.order_id,
+        reason=f'Order {order.order_id} confirmed',
+        user=user,
+    )
+
+
+# Bulk stock updates (stocktakes, deliveries). The accounts inventory API
+# speaks in movement types, the products stock API in actions; both map
+# onto the same three operations.
+STOCK_ACTIONS = {
+    'set': 'set', 'adjustment': 'set',
+    'add': 'add', 'in': 'add',
+    'subtract': 'subtract', 'out': 'subtract',
+}
+MOVEMENT_TYPES = {'set': 'adjustment', 'add': 'in', 'subtract': 'out'}
+
+BULK_BATCH_SIZE = 500
+
+
+def _parse_update(update, default_action=None):
+    """Validate one payload line; returns (product_id, action, quantity)."""
+    if not isinstance(update, dict):
+        raise ValueError('Expected an object')
+    name = update.get('action') or update.get('movement_type') or default_action
+    if name is None:
+        raise ValueError('Missing action')
+    action = STOCK_ACTIONS.get(name)
+    if action is None:
+        raise ValueError('Unknown action')
+    try:
+        product_id = Product._meta.pk.to_python(update.get('product_id'))
+    except Exception:
+        raise ValueError('Invalid product id')
+    if product_id is None:
+        raise ValueError('Missing product id')
+    if action == 'set' and update.get('quantity') is None:
+        raise ValueError('Missing quantity')
+    try:
+        quantity = int(update.get('quantity', 0))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid quantity')
+    if quantity < 0:
+        raise ValueError('Quantity must not be negative')
+    return product_id, action, quantity
+
+
+def apply_stock_updates(updates, user=None, reason='Bulk update', clamp=False, default_action=None):
+    """
+    Apply a batch of set/add/subtract lines to product stock.
+
+    All products are fetched in one query and changed in memory, then
+    written back with bulk_update and logged with one bulk_create of
+    StockMovement rows. A bad line (unknown product, bad quantity, or a
+    subtraction below zero unless ``clamp``, no action when there is no
+    ``default_action``, no quantity to set) is reported and skipped
+    without aborting the rest. Returns one result dict per line, in order.
+    """
+    parsed = []
+    for update in updates:
+        try:
+            parsed.append(_parse_update(update, default_action))
+        except ValueError as e:
+            parsed.append(e)
+
+    results = []
+    movements = []
+    changed = {}
+    relisted = set()
+    with transaction.atomic():
+        products = Product.objects.select_for_update().only(
+            'uid', 'product_name', 'slug', 'category', 'parent', 'stock_quantity', 'is_in_stock',
+        ).in_bulk({line[0] for line in parsed if not isinstance(line, ValueError)})
+
+        for index, line in enumerate(parsed):
+            update = updates[index]
+            raw_id = str(update.get('product_id')) if isinstance(update, dict) else None
+            if isinstance(line, ValueError):
+                results.append({'index': index, 'product_id': raw_id, 'error': str(line)})
+                continue
+            product_id, action, quantity = line
+            product = products.get(product_id)
+            if product is None:
+                results.append({'index': index, 'product_id': raw_id, 'error': 'Product not found'})
+                continue
+
+            if action == 'set':
+                product.stock_quantity = quantity
+            elif action == 'add':
+                product.stock_quantity += quantity
+            elif product.stock_quantity >= quantity or clamp:
+                product.stock_quantity = max(0, product.stock_quantity - quantity)
+            else:
+                results.append({'index': index, 'product_id': str(product_id), 'error': 'Insufficient stock'})
+                continue
+            if product.is_in_stock != (product.stock_quantity > 0):
+                relisted.add(product_id)
+            product.is_in_stock = product.stock_quantity > 0
+            changed[product_id] = product
+
+            movements.append(StockMovement(
+                product_id=product_id,
+                movement_type=MOVEMENT_TYPES[action],
+                quantity=quantity,
+                reason=(update.get('reason') or reason)[:200],
+                reference=(update.get('reference') or '')[:100],
+                user=user,
+            ))
+            results.append({
+                'index': index,
+                'product_id': str(product_id),
+                'success': True,
+                'name': product.product_name,
+                'new_stock': product.stock_quantity,
+                'is_in_stock': product.is_in_stock,
+            })
+
+        if changed:
+            Product.objects.bulk_update(
+                changed.values(), ['stock_quantity', 'is_in_stock'], batch_size=BULK_BATCH_SIZE,
+            )
+            # One timestamp for the whole batch, instead of another CASE column.
+            Product.objects.filter(pk__in=changed.keys()).update(updated_at=timezone.now())
+            StockMovement.objects.bulk_create(movements, batch_size=BULK_BATCH_SIZE)
+            enqueue('product', changed.keys())
+            bump_tags(*{
+                tag for product_id, product in changed.items()
+                for tag in product_tags(product, listing=product_id in relisted)
+            })
+
+    return results
@@ -4,11 +4,12 @@ Stock and inventory management views.
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from api.fastjson import FastJsonResponse
 from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator
 from django.db import models
 from .models import Product
+from .stock import apply_stock_updates
 import json
 
 
@@ -70,7 +71,7 @@ def update_stock(request, product_id):
             product.is_in_stock = product.stock_quantity > 0
             product.save()
             
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': True,
                 'new_quantity': product.stock_quantity,
                 'is_in_stock': product.is_in_stock,
@@ -78,9 +79,9 @@ def update_stock(request, product_id):
             })
             
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            return FastJsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+    return FastJsonResponse({'error': 'Invalid request'}, status=400)
 
 
 @login_required
@@ -91,39 +92,29 @@ def bulk_stock_update(request):
         try:
             data = json.loads(request.body)
             updates = data.get('updates', [])
+            results = apply_stock_updates(updates, user=request.user, clamp=True, default_action='set')
+
+            updated_products = [
+                {
+                    'id': result['product_id'],
+                    'name': result['name'],
+                    'quantity': result['new_stock'],
+                    'is_in_stock': result['is_in_stock'],
+                }
+                for result in results if result.get('success')
+            ]
+            errors = [result for result in results if 'error' in result]
             
-            updated_products = []
-            for update in updates:
-                product = get_object_or_404(Product, id=update['product_id'])
-                quantity = int(update['quantity'])
-                action = update.get('action', 'set')
-                
-                if action == 'set':
-                    product.stock_quantity = quantity
-                elif action == 'add':
-                    product.stock_quantity += quantity
-                elif action == 'subtract':
-                    product.stock_quantity = max(0, product.stock_quantity - quantity)
-                
-                product.is_in_stock = product.stock_quantity > 0
-                product.save()
-                
-                updated_products.append({
-                    'id': product.id,
-                    'name': product.product_name,
-                    'quantity': product.stock_quantity,
-                    'is_in_stock': product.is_in_stock
-                })
-            
-            return JsonResponse({
+            return FastJsonResponse({
                 'success': True,
-                'updated_products': updated_products
+                'updated_products': updated_products,
+                'errors': errors,
             })
             
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            return FastJsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'error': 'Invalid request'}, status=400)
+    return FastJsonResponse({'error': 'Invalid request'}, status=400)
 
 
 @login_required
@@ -153,7 +144,7 @@ def check_stock_availability(request, product_id):
         
         available = product.can_fulfill_order(requested_quantity)
         
-        return JsonResponse({
+        return FastJsonResponse({
             'available': available,
             'stock_quantity': product.stock_quantity,
             'is_in_stock': product.is_in_stock,
@@ -161,4 +152,4 @@ def check_stock_availability(request, product_id):
         })
         
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=400)
+        return FastJsonResponse({'error': str(e)}, status=400)
@@ -0,0 +1,83 @@
+"""
+Content-addressed storage for product and category images.
+
+A file is stored under the SHA-256 of its bytes, ``blobs/ab/cdef….webp``,
+whatever name it was saved with, so identical images (the same photo on
+several size variants, an unchanged re-upload) are kept once. Every save
+of a blob takes a reference on its StoredBlob row and every delete drops
+one; the file goes when the last reference does. As a name always means
+the same bytes, the URLs can be cached forever (see products.blob_views).
+
+Names saved before this storage existed are left where they are and
+behave as in FileSystemStorage.
+"""
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+BLOB_DIR = 'blobs'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by their content and counts references."""
+
+    def blob_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f'{BLOB_DIR}/{digest[:2]}/{digest[2:]}{extension}'
+
+    def is_blob(self, name):
+        return bool(name) and name.startswith(f'{BLOB_DIR}/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        size = 0
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        blob = self.blob_name(digest.hexdigest(), name)
+
+        StoredBlob = apps.get_model('products', 'StoredBlob')
+        with transaction.atomic():
+            row, _ = StoredBlob.objects.select_for_update().get_or_create(name=blob, defaults={'size': size})
+            StoredBlob.objects.filter(pk=row.pk).update(refs=F('refs') + 1)
+            if not super().exists(blob):
+                content.seek(0)
+                written = self._save(blob, content)
+                if written != blob:
+                    # Another process wrote the same blob first; keep theirs.
+                    super().delete(written)
+        return blob
+
+    def delete(self, name):
+        """Drop one reference to a blob, removing it with the last; other names are deleted."""
+        if not self.is_blob(name):
+            return super().delete(name)
+        StoredBlob = apps.get_model('products', 'StoredBlob')
+        with transaction.atomic():
+            row = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if row is None:
+                # Not counted (written by hand?): keep it.
+                return
+            if row.refs > 1:
+                StoredBlob.objects.filter(pk=row.pk).update(refs=F('refs') - 1)
+                return
+            row.delete()
+            super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    """The storage of image fields; a callable keeps it out of migrations."""
+    return content_storage
@@ -0,0 +1,47 @@
+"""
+Template tags for responsive product and category images.
+"""
+from django import template
+
+from ..renditions import MIME_TYPES, renditions_of, srcset as build_srcset
+
+register = template.Library()
+
+
+@register.inclusion_tag('base/picture.html')
+def picture(image, alt='', sizes='100vw', css_class='', loading='lazy', aspect_ratio=None):
+    """
+    Render a stored image as <picture> with AVIF/WebP sources and a JPEG fallback.
+
+    Until the image's renditions exist, the image itself is the only source.
+    """
+    renditions = renditions_of(image) if image else {}
+    sources = [
+        {'type': MIME_TYPES[format], 'srcset': build_srcset(renditions[format])}
+        for format in ('AVIF', 'WEBP')
+        if format in renditions
+    ]
+    fallback = renditions.get('JPEG') or next(iter(renditions.values()), [])
+    # The widest rendition gives the intrinsic size, so the layout does not shift.
+    largest = fallback[-1] if fallback else None
+    return {
+        'image': image,
+        'alt': alt,
+        'sizes': sizes,
+        'css_class': css_class,
+        'loading': loading,
+        'aspect_ratio': aspect_ratio,
+        'sources': sources,
+        'src': largest['url'] if largest else (image.url if image else ''),
+        'srcset': build_srcset(fallback),
+        'width': largest['width'] if largest else None,
+        'height': largest['height'] if largest else None,
+    }
+
+
+@register.simple_tag
+def srcset(image, format='JPEG'):
+    """The srcset of one format of an image's renditions, or an empty string."""
+    if not image:
+        return ''
+    return build_srcset(renditions_of(image).get(format, []))
@@ -6,39 +6,52 @@ from accounts.models import Cart, CartItem
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from products.models import Product, SizeVariant, ProductReview
+from products.catalog import catalog_queryset, display_products
 from accounts.models import Wishlist
+from api.cache_middleware import cache_response
+from api.cache_utils import cache_result, cache_ttl
 
 # Create your views here.
 
+PRODUCTS_PER_PAGE = 24
+
+
 def product_list(request):
     """Display all products"""
-    products = Product.objects.filter(parent=None).order_by('-created_at')
-    
+    products = catalog_queryset().order_by('-created_at', 'uid')
+    paginator = Paginator(products, PRODUCTS_PER_PAGE)
+
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
     # For products with size variants, show "Regular" size as default
-    processed_products = []
-    for product in products:
-        if product.child_products.exists():
-            # Look for "Regular" size variant
-            regular_variant = product.child_products.filter(
-                product_name__icontains='regular'
-            ).first()
-            
-            if regular_variant:
-                # Use the regular variant as the display product
-                processed_products.append(regular_variant)
-            else:
-                # If no regular variant, use the first variant
-                processed_products.append(product.child_products.first())
-        else:
-            # Standalone product
-            processed_products.append(product)
-    
+    page.object_list = display_products(page.object_list)
+
     context = {
-        'products': processed_products,
+        'products': page,
     }
     return render(request, 'products/product_list.html', context)
 
+@cache_result(timeout=cache_ttl('product_detail'), tags=lambda slug: [f'product:{slug}'])
+def _product_category_id(slug):
+    return Product.objects.filter(slug=slug).values_list('category_id', flat=True).first()
+
+
+def product_page_tags(request, slug):
+    """
+    A product page also lists its size variants and related products, all
+    of which live in the product's category.
+    """
+    return [f'product:{slug}', f'category:{_product_category_id(slug)}']
+
+
+@cache_response(timeout=cache_ttl('product_detail'), tags=product_page_tags, key_prefix='products.get_product')
 def get_product(request, slug):
     product = get_object_or_404(Product, slug=slug)
     
@@ -57,9 +70,7 @@ def get_product(request, slug):
             print("No reviews found for this product", str(e))
             messages.warning(request, "No reviews found for this product")
 
-    rating_percentage = 0
-    if product.reviews.exists():
-        rating_percentage = (product.get_rating() / 5) * 100
+    rating_percentage = (product.rating_avg / 5) * 100
 
     if request.method == 'POST' and request.user.is_authenticated:
         if review:
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import SearchIndexQueue
+
+
+@admin.register(SearchIndexQueue)
+class SearchIndexQueueAdmin(admin.ModelAdmin):
+    list_display = ['model_name', 'object_id', 'enqueued_at', 'attempts']
+    list_filter = ['model_name', 'attempts']
+    search_fields = ['object_id', 'last_error']
+    readonly_fields = ['model_name', 'object_id', 'enqueued_at', 'last_error']
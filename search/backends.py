@@ -0,0 +1,350 @@
+"""
+Pluggable product search backends.
+
+settings.SEARCH_BACKEND names the backend class, or a callable returning a
+backend such as fulltext_backend (default: the built-in inverted index). Every backend answers ``search(...)`` with a SearchResult of
+ranked product primary keys and facet counts; views turn the keys back into
+products with products_for().
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Case, CharField, Count, F, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.cache_utils import get_tag_versions
+from products import fulltext
+from products.models import Product
+from .engine import PRICE_BUCKETS, Document, InvertedIndex, SearchResult, price_bucket
+from .models import DeletedProduct
+
+DEFAULT_SEARCH_BACKEND = 'search.backends.InvertedIndexBackend'
+
+DOCUMENT_FIELDS = (
+    'uid', 'product_name', 'product_desription', 'keywords', 'category_id',
+    'category__category_name', 'price', 'is_in_stock', 'newest_product', 'created_at',
+)
+
+# Rows changed this long before the last sync are fetched again, to cover
+# clock skew between workers and transactions committing late.
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# Cache tags other processes' writes move: 'products' with listing changes,
+# 'search' with edits to the searchable text (Product.SEARCH_FIELDS).
+SYNC_TAGS = ['products', 'search']
+
+# How long deletions are remembered; an index that has not synced for longer
+# is rebuilt instead.
+DELETION_RETENTION = timedelta(days=1)
+
+
+def record_deletions(pks):
+    """Remember deleted products for other processes' indexes, forgetting old deletions."""
+    now = timezone.now()
+    DeletedProduct.objects.filter(deleted_at__lt=now - DELETION_RETENTION).delete()
+    DeletedProduct.objects.bulk_create([DeletedProduct(product_id=pk, deleted_at=now) for pk in pks])
+
+
+def deleted_since(since):
+    """Products deleted since ``since``."""
+    return DeletedProduct.objects.filter(deleted_at__gte=since).values_list('product_id', flat=True)
+
+
+def product_document(row):
+    """Build an index Document from a Product.objects.values(*DOCUMENT_FIELDS) row."""
+    return Document(
+        row['uid'],
+        name=row['product_name'],
+        description=row['product_desription'],
+        keywords=row['keywords'],
+        category_id=row['category_id'],
+        category_name=row['category__category_name'],
+        price=row['price'],
+        in_stock=row['is_in_stock'],
+        newest=row['newest_product'],
+        created_at=row['created_at'],
+    )
+
+
+def category_filter(category):
+    """Match a category by name, or by uid when given one."""
+    condition = Q(category__category_name=category)
+    try:
+        condition |= Q(category_id=Product._meta.get_field('category').target_field.to_python(category))
+    except ValidationError:
+        pass
+    return condition
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements."""
+
+    def search(self, query='', category=None, min_price=None, max_price=None, in_stock=None,
+               newest=None, sort='relevance'):
+        raise NotImplementedError
+
+    def index_products(self, pks):
+        """Bring the given products up to date in the index."""
+
+    def remove_products(self, pks):
+        """Drop deleted products from the index."""
+
+    def rebuild(self):
+        """Reindex the whole catalog."""
+
+
+def database_facets(products):
+    """Category, price and stock counts of a Product queryset, as the index computes them."""
+    price_bucket_case = Case(
+        *[When(price__lt=upper, then=Value(price_bucket(upper - 1))) for upper in PRICE_BUCKETS],
+        default=Value(price_bucket(PRICE_BUCKETS[-1])),
+        output_field=CharField(),
+    )
+    products = products.order_by()
+    return {
+        'category': dict(products.values_list('category__category_name').annotate(count=Count('pk'))),
+        'price': dict(products.annotate(bucket=price_bucket_case).values_list('bucket').annotate(count=Count('pk'))),
+        'in_stock': dict(products.values_list('is_in_stock').annotate(count=Count('pk'))),
+    }
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Substring matching in the database, as product_search used to do.
+
+    Needs no index and works everywhere, at the cost of a table scan per
+    query; facets are not computed.
+
+    Subclasses change how products are matched by overriding match(); the
+    filtering, ordering and faceting around it stay the same.
+    """
+
+    with_facets = False
+
+    def match(self, products, query):
+        """Products matching ``query``, annotated with ``relevance`` (higher is better)."""
+        return products.filter(
+            Q(product_name__icontains=query) |
+            Q(product_desription__icontains=query) |
+            Q(category__category_name__icontains=query) |
+            Q(keywords__icontains=query)
+        ).annotate(relevance=Case(
+            # Products with the query in their name first.
+            When(product_name__icontains=query, then=Value(2.0)),
+            default=Value(1.0),
+            output_field=FloatField(),
+        ))
+
+    def search(self, query='', category=None, min_price=None, max_price=None, in_stock=None,
+               newest=None, sort='relevance'):
+        products = Product.objects.all()
+        if query.strip():
+            products = self.match(products, query.strip())
+        else:
+            products = products.annotate(relevance=Value(0.0, output_field=FloatField()))
+        facets = database_facets(products) if self.with_facets else {}
+
+        if category:
+            products = products.filter(category_filter(category))
+        if min_price is not None:
+            products = products.filter(price__gte=min_price)
+        if max_price is not None:
+            products = products.filter(price__lte=max_price)
+        if in_stock is not None:
+            products = products.filter(is_in_stock=in_stock)
+        if newest is not None:
+            products = products.filter(newest_product=newest)
+
+        ordering = {
+            'price_asc': ['price', 'product_name'],
+            'price_desc': ['-price', 'product_name'],
+            'name_asc': ['product_name'],
+            'name_desc': ['-product_name'],
+            'newest': ['-created_at'],
+        }.get(sort, ['-relevance', 'product_name'])
+
+        hits = list(products.order_by(*ordering).values_list('pk', 'relevance'))
+        return SearchResult(hits, facets)
+
+
+class PostgresSearchBackend(DatabaseSearchBackend):
+    """
+    PostgreSQL full-text search over Product.search_vector.
+
+    Every word has to match (the last one as a prefix) and results are
+    ordered by SearchRank, so name hits beat keyword, category and
+    description hits. When nothing matches, typos are caught by pg_trgm word
+    similarity against the product name. Both lookups use GIN indexes.
+    """
+
+    with_facets = True
+    trigram_threshold = 0.3
+
+    def match(self, products, query):
+        tsquery = fulltext.prefix_tsquery(query)
+        if not tsquery:
+            return products.annotate(relevance=Value(0.0, output_field=FloatField()))
+        search_query = SearchQuery(tsquery, search_type='raw', config=fulltext.SEARCH_CONFIG)
+        matched = products.filter(search_vector=search_query).annotate(
+            relevance=SearchRank(F('search_vector'), search_query)
+        )
+        if matched.exists():
+            return matched
+        return products.annotate(
+            relevance=TrigramWordSimilarity(query, 'product_name')
+        ).filter(relevance__gte=self.trigram_threshold)
+
+    def rebuild(self):
+        fulltext.rebuild()
+
+
+class SQLiteFTSBackend(DatabaseSearchBackend):
+    """
+    SQLite FTS5 search over the products_product_fts table.
+
+    Porter-stemmed, accent-insensitive, every word required and the last
+    one matched as a prefix; ranked by bm25 with the same field weights as
+    PostgreSQL. There is no typo tolerance.
+    """
+
+    with_facets = True
+
+    def match(self, products, query):
+        expression = fulltext.fts_match_query(query)
+        if not expression:
+            return products.annotate(relevance=Value(0.0, output_field=FloatField()))
+        table = fulltext.FTS_TABLE
+        weights = ', '.join(str(weight) for weight in fulltext.FTS_WEIGHTS)
+        return products.filter(pk__in=RawSQL(
+            f'SELECT uid FROM {table} WHERE {table} MATCH %s',
+            (expression,),
+        )).annotate(relevance=RawSQL(
+            f'SELECT -bm25({table}, {weights}) FROM {table} '
+            f'WHERE {table} MATCH %s AND {table}.uid = products_product.uid',
+            (expression,),
+            output_field=FloatField(),
+        ))
+
+    def rebuild(self):
+        fulltext.rebuild()
+
+
+def fulltext_backend():
+    """The full-text backend for the default database, or substring matching without one."""
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    The in-process engine of search.engine.
+
+    The index is built from one snapshot query of the catalog the first time
+    it is used, then kept current by the product signals. Other processes
+    notice changes through the SYNC_TAGS cache tags, which every write to
+    an indexed field bumps; when one moves they fetch just the rows changed
+    since their last sync and drop the products deleted since (see
+    DeletedProduct).
+    """
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._version = None
+
+    def _documents(self, products):
+        return [product_document(row) for row in products.values(*DOCUMENT_FIELDS)]
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        version = get_tag_versions(SYNC_TAGS)
+        started = timezone.now()
+        docs = self._documents(Product.objects.all())
+        self.index.clear()
+        for doc in docs:
+            self.index.add(doc)
+        self._synced_at, self._version = started, version
+
+    def sync(self):
+        """Catch up with writes made by other processes, if there were any."""
+        if self._synced_at is None:
+            with self._lock:
+                if self._synced_at is None:
+                    self._rebuild()
+            return
+        version = get_tag_versions(SYNC_TAGS)
+        if version == self._version:
+            return
+        with self._lock:
+            started = timezone.now()
+            since = self._synced_at - SYNC_OVERLAP
+            if since < started - DELETION_RETENTION:
+                self._rebuild()
+                return
+            for doc in self._documents(Product.objects.filter(
+                Q(updated_at__gte=since) | Q(category__updated_at__gte=since)
+            )):
+                self.index.add(doc)
+            for pk in deleted_since(since):
+                self.index.remove(pk)
+            self._synced_at, self._version = started, version
+
+    def index_products(self, pks):
+        if self._synced_at is None:
+            return  # built from scratch on first use
+        for doc in self._documents(Product.objects.filter(pk__in=list(pks))):
+            self.index.add(doc)
+
+    def remove_products(self, pks):
+        for pk in pks:
+            self.index.remove(pk)
+
+    def search(self, query='', category=None, min_price=None, max_price=None, in_stock=None,
+               newest=None, sort='relevance'):
+        self.sync()
+        return self.index.search(
+            query, category=category, min_price=min_price, max_price=max_price,
+            in_stock=in_stock, newest=newest, sort=sort,
+        )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured search backend, created once per process."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+                _backend = import_string(path)()
+    return _backend
+
+
+def reset_backend():
+    """Forget the current backend, e.g. after changing SEARCH_BACKEND in tests."""
+    global _backend
+    _backend = None
+
+
+def products_for(pks, queryset=None):
+    """Products for ranked primary keys, in rank order, in one query."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    found = queryset.in_bulk(pks)
+    return [found[pk] for pk in pks if pk in found]
+
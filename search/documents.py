@@ -1,6 +1,13 @@
+"""
+Elasticsearch documents.
+
+Automatic signal-driven syncing is switched off: saves only queue their
+objects, and search.indexing sends them in batches (ElasticsearchIndexer).
+"""
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 from products.models import Product, Category
+from .indexing import indexable_categories, indexable_products
 
 
 @registry.register_document
@@ -47,12 +54,19 @@ class ProductDocument(Document):
             'is_featured',
             'is_bestseller',
             'is_new_arrival',
+            'rating_avg',
+            'rating_count',
             'weight',
             'dimensions',
             'created_at',
             'updated_at',
         ]
-        related_models = [Category]
+        ignore_signals = True
+        auto_refresh = False
+        queryset_pagination = 1000
+
+    def get_queryset(self):
+        return indexable_products()
 
     def prepare_category(self, instance):
         if instance.category:
@@ -94,6 +108,12 @@ class CategoryDocument(Document):
             'created_at',
             'updated_at',
         ]
+        ignore_signals = True
+        auto_refresh = False
+
+    def get_queryset(self):
+        return indexable_categories()
 
     def prepare_product_count(self, instance):
-        return instance.products.count()
+        # Annotated by indexable_categories()
+        return instance.product_count
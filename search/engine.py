@@ -0,0 +1,308 @@
+"""
+In-process inverted index over the product catalog.
+
+Documents are tokenized per field, and field weights scale term frequencies
+(a name hit counts three times a description hit). Matching documents are
+scored with BM25. Every query token has to match, either exactly, as a
+prefix (the last token, so partially typed words match) or within a small
+edit distance (typos). Results carry category, price and stock facets.
+
+The index knows nothing about Django; search.backends feeds it documents.
+"""
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r'\w+')
+
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with',
+})
+
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'keywords': 2.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended.
+PRICE_BUCKETS = (10, 25, 50, 100)
+
+# Score multipliers for terms that only approximate a query token.
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.6
+MAX_EXPANSIONS = 50
+
+
+def normalize(text):
+    """Lowercase and strip accents."""
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def stem(token):
+    """Very light English plural stemming, enough to match 'apples' to 'apple'."""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith(('ches', 'shes', 'sses', 'xes', 'zes')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_RE.findall(normalize(text)) if token not in STOP_WORDS]
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance of a and b, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def typo_allowance(token):
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+class Document:
+    """What the index keeps about one product."""
+
+    __slots__ = (
+        'pk', 'name', 'category_id', 'category_name', 'price', 'in_stock',
+        'newest', 'created_at', 'terms', 'length',
+    )
+
+    def __init__(self, pk, name='', description='', keywords='', category_id=None,
+                 category_name='', price=0, in_stock=True, newest=False, created_at=None):
+        self.pk = pk
+        self.name = name or ''
+        self.category_id = category_id
+        self.category_name = category_name or ''
+        self.price = price or 0
+        self.in_stock = bool(in_stock)
+        self.newest = bool(newest)
+        self.created_at = created_at
+
+        terms = Counter()
+        for field, text in (('name', name), ('keywords', keywords),
+                            ('category', category_name), ('description', description)):
+            for token in tokenize(text):
+                terms[token] += FIELD_WEIGHTS[field]
+        self.terms = terms
+        self.length = sum(terms.values())
+
+
+class SearchResult:
+    """Ranked product primary keys plus facet counts."""
+
+    def __init__(self, hits, facets):
+        self.hits = hits  # [(pk, score), ...] best first
+        self.facets = facets
+
+    @property
+    def pks(self):
+        return [pk for pk, _ in self.hits]
+
+    def __len__(self):
+        return len(self.hits)
+
+
+def price_bucket(price):
+    lower = 0
+    for upper in PRICE_BUCKETS:
+        if price < upper:
+            return f'{lower}-{upper}'
+        lower = upper
+    return f'{lower}+'
+
+
+class InvertedIndex:
+    """
+    Thread-safe BM25 index of Documents.
+
+    Writers replace or drop one document at a time; readers take the same
+    lock, so a search never sees a half-applied update.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.docs = {}
+        self.postings = defaultdict(dict)  # term -> {pk: weighted tf}
+        self.total_length = 0.0
+        self._vocabulary = None  # sorted terms, rebuilt lazily after writes
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __contains__(self, pk):
+        return pk in self.docs
+
+    def clear(self):
+        with self._lock:
+            self.docs = {}
+            self.postings = defaultdict(dict)
+            self.total_length = 0.0
+            self._vocabulary = None
+
+    def add(self, doc):
+        """Index a document, replacing any previous version of it."""
+        with self._lock:
+            self._remove(doc.pk)
+            self.docs[doc.pk] = doc
+            for term, frequency in doc.terms.items():
+                if term not in self.postings:
+                    self._vocabulary = None
+                self.postings[term][doc.pk] = frequency
+            self.total_length += doc.length
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        doc = self.docs.pop(pk, None)
+        if doc is None:
+            return
+        for term in doc.terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(pk, None)
+            if not posting:
+                del self.postings[term]
+                self._vocabulary = None
+        self.total_length -= doc.length
+
+    @property
+    def vocabulary(self):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+
+    def expand(self, token, prefix=False, fuzzy=True):
+        """Index terms a query token stands for, as {term: score factor}."""
+        expansions = {}
+        if token in self.postings:
+            expansions[token] = 1.0
+        if prefix:
+            vocabulary = self.vocabulary
+            start = bisect.bisect_left(vocabulary, token)
+            for term in vocabulary[start:start + MAX_EXPANSIONS]:
+                if not term.startswith(token):
+                    break
+                expansions.setdefault(term, PREFIX_FACTOR)
+        limit = typo_allowance(token)
+        if fuzzy and not expansions and limit:
+            for term in self.vocabulary:
+                if edit_distance(token, term, limit) <= limit:
+                    expansions[term] = FUZZY_FACTOR
+                    if len(expansions) >= MAX_EXPANSIONS:
+                        break
+        return expansions
+
+    def _idf(self, term):
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - n + 0.5) / (n + 0.5))
+
+    def score(self, query, prefix=True, fuzzy=True):
+        """
+        BM25 scores of the documents matching every token of ``query``.
+
+        An empty query matches every document with a score of 0.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return dict.fromkeys(self.docs, 0.0)
+
+        average_length = self.total_length / len(self.docs) if self.docs else 1.0
+        scores = None
+        for position, token in enumerate(tokens):
+            is_last = position == len(tokens) - 1
+            token_scores = {}
+            for term, factor in self.expand(token, prefix=prefix and is_last, fuzzy=fuzzy).items():
+                idf = self._idf(term)
+                for pk, frequency in self.postings[term].items():
+                    norm = 1 - self.b + self.b * self.docs[pk].length / average_length
+                    value = factor * idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+                    if value > token_scores.get(pk, 0.0):
+                        token_scores[pk] = value
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pk: scores[pk] + value for pk, value in token_scores.items() if pk in scores}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, query='', category=None, min_price=None, max_price=None, in_stock=None,
+               newest=None, sort='relevance', prefix=True, fuzzy=True):
+        """
+        Match, filter, facet and sort.
+
+        Facets count the query's matches before the filters are applied, so
+        the options shown next to a result list do not vanish once one of
+        them is picked. ``category`` matches a category id or name.
+        """
+        with self._lock:
+            scores = self.score(query, prefix=prefix, fuzzy=fuzzy)
+            matches = [self.docs[pk] for pk in scores]
+
+        facets = {'category': Counter(), 'price': Counter(), 'in_stock': Counter()}
+        for doc in matches:
+            facets['category'][doc.category_name] += 1
+            facets['price'][price_bucket(doc.price)] += 1
+            facets['in_stock'][doc.in_stock] += 1
+
+        if category:
+            category = str(category)
+            matches = [doc for doc in matches
+                       if doc.category_name == category or str(doc.category_id) == category]
+        if min_price is not None:
+            matches = [doc for doc in matches if doc.price >= min_price]
+        if max_price is not None:
+            matches = [doc for doc in matches if doc.price <= max_price]
+        if in_stock is not None:
+            matches = [doc for doc in matches if doc.in_stock == in_stock]
+        if newest is not None:
+            matches = [doc for doc in matches if doc.newest == newest]
+
+        if sort == 'price_asc':
+            matches.sort(key=lambda doc: (doc.price, doc.name.lower()))
+        elif sort == 'price_desc':
+            matches.sort(key=lambda doc: (-doc.price, doc.name.lower()))
+        elif sort == 'name_asc':
+            matches.sort(key=lambda doc: doc.name.lower())
+        elif sort == 'name_desc':
+            matches.sort(key=lambda doc: doc.name.lower(), reverse=True)
+        elif sort == 'newest':
+            matches.sort(key=lambda doc: (doc.created_at is not None, doc.created_at), reverse=True)
+        else:
+            matches.sort(key=lambda doc: (-scores[doc.pk], doc.name.lower()))
+
+        return SearchResult(
+            [(doc.pk, scores[doc.pk]) for doc in matches],
+            {name: dict(counts) for name, counts in facets.items()},
+        )
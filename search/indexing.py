@@ -0,0 +1,252 @@
+"""
+Deferred indexing of search documents.
+
+Saves never talk to the search server. The signals in search.signals put
+the changed objects on the SearchIndexQueue table, in the saving
+transaction; ``process_search_queue`` drains it in batches, loading each
+batch with one query per model and sending it with one bulk call. An object
+that no longer exists is deleted from the index instead.
+
+settings.SEARCH_INDEXER picks where documents go: ElasticsearchIndexer for
+the documents of search.documents, or the default LocalIndexer, which keeps
+them in memory for development and tests.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from products.models import Category, Product
+from .models import SearchIndexQueue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_INDEXER = 'search.indexing.LocalIndexer'
+
+QUEUE_BATCH_SIZE = 500
+REINDEX_CHUNK_SIZE = 1000
+
+# Entries failing this many times stay in the queue for inspection.
+MAX_ATTEMPTS = 5
+
+
+def indexable_products():
+    return Product.objects.select_related('category')
+
+
+def indexable_categories():
+    """Categories with their product counts, from one annotated query."""
+    return Category.objects.annotate(product_count=Count('products'))
+
+
+INDEXABLE = {
+    'product': indexable_products,
+    'category': indexable_categories,
+}
+
+
+def product_body(product):
+    return {
+        'uid': str(product.uid),
+        'product_name': product.product_name,
+        'product_description': product.product_desription,
+        'slug': product.slug,
+        'price': product.price,
+        'stock_quantity': product.stock_quantity,
+        'is_in_stock': product.is_in_stock,
+        'is_featured': product.is_featured,
+        'is_bestseller': product.is_bestseller,
+        'is_new_arrival': product.is_new_arrival,
+        'rating_avg': product.rating_avg,
+        'rating_count': product.rating_count,
+        'category': {
+            'category_name': product.category.category_name,
+            'slug': product.category.slug,
+        },
+        'category_name': product.category.category_name,
+    }
+
+
+def category_body(category):
+    return {
+        'uid': str(category.uid),
+        'category_name': category.category_name,
+        'slug': category.slug,
+        'product_count': category.product_count,
+    }
+
+
+class BaseIndexer:
+    """Where search documents are sent."""
+
+    def index(self, model_name, objects):
+        """Add or replace the documents of ``objects``, in one bulk request."""
+        raise NotImplementedError
+
+    def delete(self, model_name, pks):
+        """Drop documents, ignoring ones that are not indexed."""
+        raise NotImplementedError
+
+
+class LocalIndexer(BaseIndexer):
+    """Keeps documents in memory: an offline stand-in for the search server."""
+
+    body_builders = {
+        'product': product_body,
+        'category': category_body,
+    }
+
+    def __init__(self):
+        self.documents = {model_name: {} for model_name in INDEXABLE}
+        self.bulk_calls = 0
+
+    def index(self, model_name, objects):
+        self.bulk_calls += 1
+        build = self.body_builders[model_name]
+        for obj in objects:
+            self.documents[model_name][str(obj.pk)] = build(obj)
+
+    def delete(self, model_name, pks):
+        self.bulk_calls += 1
+        for pk in pks:
+            self.documents[model_name].pop(str(pk), None)
+
+
+class ElasticsearchIndexer(BaseIndexer):
+    """Sends batches to Elasticsearch through the documents of search.documents."""
+
+    def document(self, model_name):
+        from .documents import CategoryDocument, ProductDocument
+
+        return {'product': ProductDocument, 'category': CategoryDocument}[model_name]
+
+    def index(self, model_name, objects):
+        self.document(model_name)().update(objects)
+
+    def delete(self, model_name, pks):
+        from elasticsearch.helpers import bulk
+
+        document = self.document(model_name)
+        actions = [
+            {'_op_type': 'delete', '_index': document._index._name, '_id': str(pk)}
+            for pk in pks
+        ]
+        # Missing documents come back as 404s, which are fine here.
+        bulk(document._get_connection(), actions, raise_on_error=False)
+
+
+_indexer = None
+
+
+def get_indexer():
+    """The configured indexer, created once per process."""
+    global _indexer
+    if _indexer is None:
+        _indexer = import_string(getattr(settings, 'SEARCH_INDEXER', DEFAULT_SEARCH_INDEXER))()
+    return _indexer
+
+
+def reset_indexer():
+    global _indexer
+    _indexer = None
+
+
+def enqueue(model_name, pks):
+    """Queue objects for reindexing; objects already queued are just touched."""
+    now = timezone.now()
+    SearchIndexQueue.objects.bulk_create(
+        [SearchIndexQueue(model_name=model_name, object_id=str(pk), enqueued_at=now) for pk in pks],
+        update_conflicts=True,
+        unique_fields=['model_name', 'object_id'],
+        update_fields=['enqueued_at', 'attempts', 'last_error'],
+    )
+
+
+def _index_entries(indexer, model_name, entries):
+    ids = [entry.object_id for entry in entries]
+    found = list(INDEXABLE[model_name]().filter(pk__in=ids))
+    if found:
+        indexer.index(model_name, found)
+    missing = set(ids) - {str(obj.pk) for obj in found}
+    if missing:
+        indexer.delete(model_name, sorted(missing))
+
+
+def process_batch(batch_size=QUEUE_BATCH_SIZE, indexer=None):
+    """
+    Index one batch of the queue; returns how many entries it took.
+
+    Entries are locked while they are indexed, so concurrent workers take
+    different batches where the database can skip locked rows. An entry
+    queued again while its batch was indexed stays for the next batch.
+    """
+    indexer = indexer or get_indexer()
+    with transaction.atomic():
+        entries = SearchIndexQueue.objects.filter(attempts__lt=MAX_ATTEMPTS).order_by('enqueued_at')
+        if connection.features.has_select_for_update_skip_locked:
+            entries = entries.select_for_update(skip_locked=True)
+        entries = list(entries[:batch_size])
+        if not entries:
+            return 0
+
+        by_model = {}
+        for entry in entries:
+            by_model.setdefault(entry.model_name, []).append(entry)
+
+        for model_name, model_entries in by_model.items():
+            taken = SearchIndexQueue.objects.filter(
+                pk__in=[entry.pk for entry in model_entries],
+                enqueued_at__lte=max(entry.enqueued_at for entry in model_entries),
+            )
+            try:
+                with transaction.atomic():
+                    _index_entries(indexer, model_name, model_entries)
+            except Exception as exc:
+                logger.exception('Indexing %d %s entries failed', len(model_entries), model_name)
+                taken.update(attempts=F('attempts') + 1, last_error=str(exc)[:2000])
+            else:
+                taken.delete()
+    return len(entries)
+
+
+def drain(batch_size=QUEUE_BATCH_SIZE, indexer=None):
+    """Process batches until the queue is empty; returns how many entries were taken."""
+    total = 0
+    while True:
+        taken = process_batch(batch_size, indexer)
+        if not taken:
+            return total
+        total += taken
+        if taken < batch_size:
+            return total
+
+
+def reindex_all(chunk_size=REINDEX_CHUNK_SIZE, indexer=None, stdout=None):
+    """
+    Index the whole catalog, streaming it in chunks.
+
+    Queue entries older than the start are covered by the reindex and
+    dropped; anything queued meanwhile is left for the worker.
+    """
+    indexer = indexer or get_indexer()
+    started = timezone.now()
+    counts = {}
+    for model_name, queryset in INDEXABLE.items():
+        chunk = []
+        counts[model_name] = 0
+        for obj in queryset().order_by('pk').iterator(chunk_size=chunk_size):
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                indexer.index(model_name, chunk)
+                counts[model_name] += len(chunk)
+                chunk = []
+        if chunk:
+            indexer.index(model_name, chunk)
+            counts[model_name] += len(chunk)
+        if stdout:
+            stdout.write(f'Indexed {counts[model_name]} {model_name} document(s)')
+    SearchIndexQueue.objects.filter(enqueued_at__lte=started).delete()
+    return counts
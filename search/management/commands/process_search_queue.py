@@ -0,0 +1,43 @@
+"""
+Management command to drain the search indexing queue.
+
+Run it from cron, or keep one running with --loop.
+"""
+import time
+from django.core.management.base import BaseCommand
+from search.indexing import QUEUE_BATCH_SIZE, drain
+
+
+class Command(BaseCommand):
+    help = 'Send queued product and category changes to the search index in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=QUEUE_BATCH_SIZE,
+            help=f'Queue entries per bulk request (default: {QUEUE_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting once it is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls with --loop (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            taken = drain(options['batch_size'])
+            if taken or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Indexed {taken} queued change(s)')
+                )
+            if not options['loop']:
+                return
+            if not taken:
+                time.sleep(options['interval'])
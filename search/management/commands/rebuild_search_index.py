@@ -0,0 +1,26 @@
+"""
+Management command to reindex the whole catalog.
+
+Streams products and categories from the database in chunks and sends each
+chunk as one bulk request, so memory stays flat however large the catalog.
+"""
+from django.core.management.base import BaseCommand
+from search.indexing import REINDEX_CHUNK_SIZE, reindex_all
+
+
+class Command(BaseCommand):
+    help = 'Send every product and category to the search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=REINDEX_CHUNK_SIZE,
+            help=f'Objects per database chunk and bulk request (default: {REINDEX_CHUNK_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        counts = reindex_all(options['chunk_size'], stdout=self.stdout)
+        self.stdout.write(
+            self.style.SUCCESS(f'Reindexed {sum(counts.values())} document(s)')
+        )
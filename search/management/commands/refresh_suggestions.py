@@ -0,0 +1,21 @@
+"""
+Management command to refresh the popularity behind search suggestions.
+
+Counts units sold and customers who viewed, per product and per category,
+in two grouped queries and publishes the result in the cache. Every process
+serving suggestions reweights its index from it on its next lookup, so no
+request ever recomputes popularity. Run it periodically, e.g. from cron
+every 15 minutes.
+"""
+from django.core.management.base import BaseCommand
+from search.suggest import publish_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recompute suggestion popularity and publish it to every process'
+
+    def handle(self, *args, **options):
+        counts = publish_popularity()
+        self.stdout.write(
+            self.style.SUCCESS(f"Published popularity of {len(counts['product'])} product(s)")
+        )
@@ -0,0 +1,45 @@
+from django.db import models
+from django.utils import timezone
+
+
+class SearchIndexQueue(models.Model):
+    """
+    Objects whose search documents are out of date.
+
+    Written in the same transaction as the change itself, so nothing is lost
+    if the process dies before indexing; one row per object, however many
+    times it changed before a worker got to it. search.indexing drains it.
+    """
+    MODEL_CHOICES = [
+        ('product', 'Product'),
+        ('category', 'Category'),
+    ]
+
+    model_name = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.CharField(max_length=64)
+    enqueued_at = models.DateTimeField(default=timezone.now, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model_name', 'object_id'], name='unique_search_index_queue_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name} {self.object_id}"
+
+
+class DeletedProduct(models.Model):
+    """
+    A product deleted recently, recorded in the deleting transaction.
+
+    In-process indexes syncing from the database drop these instead of
+    listing the whole catalog to find what disappeared; rows older than
+    search.backends.DELETION_RETENTION are pruned.
+    """
+    product_id = models.UUIDField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.product_id} deleted at {self.deleted_at}"
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from products.models import Product, Category
+from .backends import get_backend, record_deletions
+from .indexing import enqueue
+from .suggest import get_suggester
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """
+    Reindex a product once its transaction commits, and queue it for the
+    search server in the same transaction.
+    """
+    pk = instance.pk
+    enqueue('product', [pk])
+
+    def reindex():
+        get_backend().index_products([pk])
+        get_suggester().index_products([pk])
+    transaction.on_commit(reindex)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    pk = instance.pk
+    enqueue('product', [pk])
+    record_deletions([pk])
+
+    def unindex():
+        get_backend().remove_products([pk])
+        get_suggester().remove_products([pk])
+    transaction.on_commit(unindex)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, **kwargs):
+    """
+    Category names are indexed with their products.
+    """
+    category_id = instance.pk
+    enqueue('category', [category_id])
+    enqueue('product', Product.objects.filter(category_id=category_id).values_list('pk', flat=True))
+
+    def reindex():
+        pks = list(Product.objects.filter(category_id=category_id).values_list('pk', flat=True))
+        get_backend().index_products(pks)
+        get_suggester().index_products(pks)
+        get_suggester().index_category(category_id)
+    transaction.on_commit(reindex)
+
+
+@receiver(post_delete, sender=Category)
+def unindex_category(sender, instance, **kwargs):
+    category_id = instance.pk
+    enqueue('category', [category_id])
+    transaction.on_commit(lambda: get_suggester().remove_category(category_id))
@@ -0,0 +1,385 @@
+"""
+Search-as-you-type suggestions.
+
+Product names, category names and product keywords are kept in a sorted
+array of normalized keys, one key per word the text can be typed from
+('red apples' is found by 'red a' and by 'app'). A prefix is a bisect plus a
+scan of its range, ranked by popularity: units sold plus customers who viewed
+the product. Answers for hot prefixes are kept in an LRU, cleared whenever
+the index changes, so repeated keystrokes never scan at all.
+
+The index is built from the catalog the first time it is used, then kept
+current by the product signals. Like InvertedIndexBackend, other processes
+notice writes through the SYNC_TAGS cache tags and apply just the changed
+and deleted rows. Popularity, which moves with every sale and page view, is
+computed out of band by the ``refresh_suggestions`` command, which publishes
+it in the cache; every process reweights its index in memory when the
+'popularity' tag moves.
+"""
+import bisect
+import heapq
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import OrderItem, RecentlyViewed
+from api.cache_utils import bump_tags, get_tag_versions, tagged_key
+from products.models import Category, Product
+from .backends import DELETION_RETENTION, SYNC_OVERLAP, SYNC_TAGS, deleted_since
+from .engine import TOKEN_RE, normalize
+
+MAX_SUGGESTIONS = 10
+LRU_SIZE = 2048
+
+# How often a process checks the SYNC_TAGS and 'popularity' tags.
+VERSION_CHECK_INTERVAL = 1.0
+
+POPULARITY_TAG = 'popularity'
+POPULARITY_KEY = 'suggest:popularity'
+
+# Suggestions of the same text and kind from several products are merged;
+# products themselves stay distinct.
+MERGED_KINDS = ('keyword', 'category')
+
+
+class Suggestion:
+    """One suggestible text."""
+
+    __slots__ = ('id', 'owner', 'kind', 'text', 'weight', 'data', 'keys')
+
+    def __init__(self, owner, kind, text, weight=0, data=None):
+        self.owner = owner  # (model label, pk) the suggestion comes from
+        self.kind = kind
+        self.text = text
+        self.weight = weight
+        self.data = data or {}
+        self.keys = suggestion_keys(text)
+        self.id = None
+
+    def as_dict(self):
+        return {'text': self.text, 'value': self.text, 'type': self.kind, **self.data}
+
+
+def suggestion_keys(text):
+    """Normalized keys of ``text``: from every word to the end of the text."""
+    normalized = ' '.join(TOKEN_RE.findall(normalize(text)))
+    keys = []
+    for match in TOKEN_RE.finditer(normalized):
+        keys.append(normalized[match.start():])
+    return keys
+
+
+def normalize_prefix(prefix):
+    """Normalize typed text the way keys are, keeping a trailing space meaningful."""
+    words = TOKEN_RE.findall(normalize(prefix))
+    normalized = ' '.join(words)
+    if normalized and prefix[-1:].isspace():
+        normalized += ' '
+    return normalized
+
+
+class PrefixIndex:
+    """
+    Thread-safe sorted-array prefix index of Suggestions.
+
+    ``keys`` is a sorted list of (key, suggestion id); every write replaces
+    all suggestions of one owner and empties the prefix LRU.
+    """
+
+    def __init__(self, lru_size=LRU_SIZE):
+        self._lock = threading.RLock()
+        self.lru_size = lru_size
+        self.clear()
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def clear(self):
+        with self._lock:
+            self.keys = []
+            self.suggestions = {}
+            self.owners = {}  # owner -> [suggestion id, ...]
+            self._next_id = 0
+            self._lru = OrderedDict()
+
+    def load(self, suggestions):
+        """Replace the whole index in one sort."""
+        with self._lock:
+            self.clear()
+            keys = []
+            for suggestion in suggestions:
+                self._register(suggestion)
+                keys.extend((key, suggestion.id) for key in suggestion.keys)
+            keys.sort()
+            self.keys = keys
+
+    def _register(self, suggestion):
+        suggestion.id = self._next_id
+        self._next_id += 1
+        self.suggestions[suggestion.id] = suggestion
+        self.owners.setdefault(suggestion.owner, []).append(suggestion.id)
+
+    def replace(self, owner, suggestions):
+        """Swap every suggestion of ``owner`` for ``suggestions``."""
+        with self._lock:
+            self._remove(owner)
+            for suggestion in suggestions:
+                self._register(suggestion)
+                for key in suggestion.keys:
+                    bisect.insort(self.keys, (key, suggestion.id))
+            self._lru.clear()
+
+    def remove(self, owner):
+        with self._lock:
+            self._remove(owner)
+            self._lru.clear()
+
+    def reweight(self, weights):
+        """Set every suggestion's weight from ``weights[kind][pk]`` of its owner."""
+        with self._lock:
+            for (kind, pk), suggestion_ids in self.owners.items():
+                weight = weights.get(kind, {}).get(pk, 0)
+                for suggestion_id in suggestion_ids:
+                    self.suggestions[suggestion_id].weight = weight
+            self._lru.clear()
+
+    def _remove(self, owner):
+        for suggestion_id in self.owners.pop(owner, ()):
+            suggestion = self.suggestions.pop(suggestion_id)
+            for key in suggestion.keys:
+                position = bisect.bisect_left(self.keys, (key, suggestion_id))
+                if position < len(self.keys) and self.keys[position] == (key, suggestion_id):
+                    del self.keys[position]
+
+    def lookup(self, prefix, limit=MAX_SUGGESTIONS):
+        """The ``limit`` most popular suggestions starting with ``prefix``."""
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            top = self._lru.get(prefix)
+            if top is not None:
+                self._lru.move_to_end(prefix)
+            else:
+                top = self._scan(prefix)
+                self._lru[prefix] = top
+                if len(self._lru) > self.lru_size:
+                    self._lru.popitem(last=False)
+        return top[:limit]
+
+    def _scan(self, prefix):
+        start = bisect.bisect_left(self.keys, (prefix,))
+        # No key continues the prefix with a character sorting after this one.
+        end = bisect.bisect_left(self.keys, (prefix + '\uffff',), start)
+
+        merged = {}
+        seen = set()
+        for _, suggestion_id in self.keys[start:end]:
+            if suggestion_id in seen:
+                continue  # several words of one text start with the prefix
+            seen.add(suggestion_id)
+            suggestion = self.suggestions[suggestion_id]
+            if suggestion.kind in MERGED_KINDS:
+                group = (suggestion.kind, suggestion.text.lower())
+            else:
+                group = suggestion_id
+            if group in merged:
+                merged[group][0] += suggestion.weight
+            else:
+                merged[group] = [suggestion.weight, suggestion]
+        best = heapq.nsmallest(
+            MAX_SUGGESTIONS, merged.values(), key=lambda item: (-item[0], item[1].text.lower())
+        )
+        return [suggestion.as_dict() for _, suggestion in best]
+
+
+def product_popularity():
+    """Units sold plus customers who viewed, per product, as an annotation."""
+    sold = OrderItem.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    viewed = RecentlyViewed.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        total=Count('pk')
+    ).values('total')
+    return (
+        Coalesce(Subquery(sold, output_field=IntegerField()), Value(0))
+        + Coalesce(Subquery(viewed, output_field=IntegerField()), Value(0))
+    )
+
+
+def popularity_counts():
+    """Popularity of every product and category, from two grouped queries."""
+    counts = {'product': Counter(), 'category': Counter()}
+    for rows in (
+        OrderItem.objects.values_list('product', 'product__category').annotate(total=Sum('quantity')),
+        RecentlyViewed.objects.values_list('product', 'product__category').annotate(total=Count('pk')),
+    ):
+        for product_id, category_id, total in rows.order_by():
+            counts['product'][product_id] += total or 0
+            counts['category'][category_id] += total or 0
+    return {kind: dict(totals) for kind, totals in counts.items()}
+
+
+def published_popularity():
+    """The popularity last published by publish_popularity(), if still cached."""
+    return cache.get(tagged_key(POPULARITY_KEY, [POPULARITY_TAG]))
+
+
+def publish_popularity():
+    """Compute popularity and hand it to every process's suggestions."""
+    counts = popularity_counts()
+    bump_tags(POPULARITY_TAG)
+    cache.set(tagged_key(POPULARITY_KEY, [POPULARITY_TAG]), counts, None)
+    return counts
+
+
+PRODUCT_FIELDS = ('uid', 'product_name', 'slug', 'keywords', 'category_id', 'category__category_name', 'popularity')
+
+
+def product_suggestions(row):
+    """Suggestions of a Product.objects.values(*PRODUCT_FIELDS) row."""
+    owner = ('product', row['uid'])
+    weight = row['popularity']
+    suggestions = [Suggestion(owner, 'product', row['product_name'], weight, {
+        'slug': row['slug'], 'category': row['category__category_name'],
+    })]
+    for keyword in dict.fromkeys(filter(None, (word.strip() for word in (row['keywords'] or '').split(',')))):
+        suggestions.append(Suggestion(owner, 'keyword', keyword, weight))
+    return suggestions
+
+
+def category_suggestion(category_id, name, slug, popularity):
+    return Suggestion(('category', category_id), 'category', name, popularity, {'slug': slug})
+
+
+class SuggestionService:
+    """The process-wide PrefixIndex, built from and kept in step with the catalog."""
+
+    def __init__(self):
+        self.index = PrefixIndex()
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._version = None
+        self._popularity_version = None
+        self._checked_at = 0.0
+
+    def _product_rows(self, products):
+        return products.annotate(popularity=product_popularity()).values(*PRODUCT_FIELDS)
+
+    def _category_suggestions(self, categories, popularity):
+        return [
+            category_suggestion(row['uid'], row['category_name'], row['slug'], popularity.get(row['uid'], 0))
+            for row in categories.values('uid', 'category_name', 'slug')
+        ]
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        versions = get_tag_versions([*SYNC_TAGS, POPULARITY_TAG])
+        started = timezone.now()
+        popularity = published_popularity() or popularity_counts()
+        suggestions = []
+        for row in Product.objects.values(*PRODUCT_FIELDS[:-1]):
+            row['popularity'] = popularity['product'].get(row['uid'], 0)
+            suggestions.extend(product_suggestions(row))
+        suggestions.extend(self._category_suggestions(Category.objects.all(), popularity['category']))
+        self.index.load(suggestions)
+        self._checked_at = time.monotonic()
+        self._synced_at, self._version = started, {tag: versions[tag] for tag in SYNC_TAGS}
+        self._popularity_version = versions[POPULARITY_TAG]
+
+    def sync(self):
+        """Build on first use, then catch up with other processes' writes now and then."""
+        if self._synced_at is None:
+            with self._lock:
+                if self._synced_at is None:
+                    self._rebuild()
+            return
+        if time.monotonic() - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        versions = get_tag_versions([*SYNC_TAGS, POPULARITY_TAG])
+        version = {tag: versions[tag] for tag in SYNC_TAGS}
+        if version != self._version:
+            with self._lock:
+                self._catch_up(version)
+        if versions[POPULARITY_TAG] != self._popularity_version:
+            popularity = published_popularity()
+            if popularity is not None:
+                self.index.reweight(popularity)
+                self._popularity_version = versions[POPULARITY_TAG]
+
+    def _catch_up(self, version):
+        started = timezone.now()
+        since = self._synced_at - SYNC_OVERLAP
+        if since < started - DELETION_RETENTION:
+            self._rebuild()
+            return
+        self._index_products(Product.objects.filter(
+            Q(updated_at__gte=since) | Q(category__updated_at__gte=since)
+        ))
+        self._index_categories(Category.objects.filter(updated_at__gte=since))
+        for pk in deleted_since(since):
+            self.index.remove(('product', pk))
+        categories = set(Category.objects.values_list('pk', flat=True))
+        for owner in [owner for owner in self.index.owners if owner[0] == 'category' and owner[1] not in categories]:
+            self.index.remove(owner)
+        self._synced_at, self._version = started, version
+
+    def _index_products(self, products):
+        for row in self._product_rows(products):
+            self.index.replace(('product', row['uid']), product_suggestions(row))
+
+    def _index_categories(self, categories):
+        # A category's popularity only moves with its products' sales and
+        # views, which the published popularity brings; keep what we had.
+        for suggestion in self._category_suggestions(categories, {}):
+            previous = self.index.owners.get(suggestion.owner)
+            if previous:
+                suggestion.weight = self.index.suggestions[previous[0]].weight
+            self.index.replace(suggestion.owner, [suggestion])
+
+    def index_products(self, pks):
+        if self._synced_at is not None:
+            self._index_products(Product.objects.filter(pk__in=list(pks)))
+
+    def remove_products(self, pks):
+        for pk in pks:
+            self.index.remove(('product', pk))
+
+    def index_category(self, pk):
+        if self._synced_at is not None:
+            self._index_categories(Category.objects.filter(pk=pk))
+
+    def remove_category(self, pk):
+        self.index.remove(('category', pk))
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        self.sync()
+        return self.index.lookup(prefix, limit)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_suggester():
+    """The suggestion service, created once per process."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = SuggestionService()
+    return _service
+
+
+def reset_suggester():
+    global _service
+    _service = None
@@ -1,105 +1,103 @@
-from django.shortcuts import render
-from django.http import JsonResponse
+from django.db.models import Count
+from api.fastjson import FastJsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.core.paginator import Paginator
-from search.documents import ProductDocument, CategoryDocument
+from products.models import Product, Category
+from search.backends import get_backend, products_for
+from search.suggest import MAX_SUGGESTIONS, get_suggester
 import json
 
+# Hits sent to the database as an IN list; past this, the filter's own
+# matches are read instead (SQLite allows 999 variables per statement).
+FILTER_IN_LIMIT = 500
+
+
+def _number(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _product_hit(product, score):
+    return {
+        'uid': str(product.uid),
+        'product_name': product.product_name,
+        'slug': product.slug,
+        'price': product.price,
+        'category_name': product.category.category_name,
+        'is_in_stock': product.is_in_stock,
+        'is_featured': product.is_featured,
+        'is_bestseller': product.is_bestseller,
+        'is_new_arrival': product.is_new_arrival,
+        'score': score,
+    }
+
+
+def _narrow(hits, **filters):
+    """
+    The hits of products matching ``filters``, in rank order, with one query.
+
+    A short list of hits is checked by primary key; for a broad query the
+    products matching the filters are read instead, so no statement is
+    bound to the size of the catalog.
+    """
+    products = Product.objects.filter(**filters)
+    if len(hits) <= FILTER_IN_LIMIT:
+        products = products.filter(pk__in=[pk for pk, _ in hits])
+    allowed = set(products.values_list('pk', flat=True))
+    return [(pk, score) for pk, score in hits if pk in allowed]
+
+
+def _page(result, page, per_page, flags=()):
+    """Hits of one page, after the boolean filters the index does not know about."""
+    hits = result.hits
+    scores = dict(hits)
+    queryset = Product.objects.select_related('category')
+    if flags:
+        hits = _narrow(hits, **{flag: True for flag in flags})
+    start = (page - 1) * per_page
+    pks = [pk for pk, _ in hits[start:start + per_page]]
+    return [_product_hit(product, scores[product.pk]) for product in products_for(pks, queryset)], len(hits)
+
 
 class ProductSearchView(View):
     def get(self, request):
         query = request.GET.get('q', '')
         category = request.GET.get('category', '')
-        min_price = request.GET.get('min_price', '')
-        max_price = request.GET.get('max_price', '')
         in_stock = request.GET.get('in_stock', '')
         featured = request.GET.get('featured', '')
         sort_by = request.GET.get('sort', 'relevance')
-        page = int(request.GET.get('page', 1))
-        per_page = int(request.GET.get('per_page', 20))
-
-        # Build search query
-        search = ProductDocument.search()
-
-        # Text search
-        if query:
-            search = search.query(
-                Q('multi_match', 
-                  query=query,
-                  fields=['product_name^3', 'product_description^2', 'category_name'],
-                  fuzziness='AUTO')
-            )
-
-        # Filters
-        filters = []
-        
-        if category:
-            filters.append(Q('term', category_name=category))
-        
-        if min_price:
-            filters.append(Q('range', price={'gte': float(min_price)}))
-        
-        if max_price:
-            filters.append(Q('range', price={'lte': float(max_price)}))
-        
-        if in_stock == 'true':
-            filters.append(Q('term', is_in_stock=True))
-        
-        if featured == 'true':
-            filters.append(Q('term', is_featured=True))
-
-        # Apply filters
-        if filters:
-            search = search.filter(Q('bool', must=filters))
-
-        # Sorting
-        if sort_by == 'price_asc':
-            search = search.sort('price')
-        elif sort_by == 'price_desc':
-            search = search.sort('-price')
-        elif sort_by == 'name':
-            search = search.sort('product_name.raw')
-        elif sort_by == 'newest':
-            search = search.sort('-created_at')
-        else:  # relevance
-            pass  # Use default relevance scoring
-
-        # Pagination
-        start = (page - 1) * per_page
-        search = search[start:start + per_page]
-
-        # Execute search
-        response = search.execute()
-
-        # Format results
-        results = []
-        for hit in response:
-            results.append({
-                'uid': hit.uid,
-                'product_name': hit.product_name,
-                'slug': hit.slug,
-                'price': hit.price,
-                'category_name': hit.category_name,
-                'is_in_stock': hit.is_in_stock,
-                'is_featured': hit.is_featured,
-                'is_bestseller': hit.is_bestseller,
-                'is_new_arrival': hit.is_new_arrival,
-                'score': hit.meta.score
-            })
-
-        # Get aggregations for faceted search
-        aggregations = {}
-        if hasattr(response, 'aggregations'):
-            aggregations = response.aggregations.to_dict()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        try:
+            per_page = min(max(int(request.GET.get('per_page', 20)), 1), 100)
+        except ValueError:
+            per_page = 20
+
+        sort = {'name': 'name_asc'}.get(sort_by, sort_by)
+        result = get_backend().search(
+            query,
+            category=category or None,
+            min_price=_number(request.GET.get('min_price')),
+            max_price=_number(request.GET.get('max_price')),
+            in_stock=True if in_stock == 'true' else None,
+            sort=sort,
+        )
+        results, total = _page(result, page, per_page, ['is_featured'] if featured == 'true' else [])
 
-        return JsonResponse({
+        return FastJsonResponse({
             'results': results,
-            'total': response.hits.total.value if hasattr(response.hits.total, 'value') else response.hits.total,
+            'total': total,
             'page': page,
             'per_page': per_page,
-            'aggregations': aggregations,
+            'aggregations': {
+                name: {str(key): count for key, count in counts.items()}
+                for name, counts in result.facets.items()
+            },
             'query': query
         })
 
@@ -107,58 +105,43 @@ class ProductSearchView(View):
 class CategorySearchView(View):
     def get(self, request):
         query = request.GET.get('q', '')
-        
-        search = CategoryDocument.search()
-        
+
+        categories = Category.objects.annotate(product_count=Count('products'))
         if query:
-            search = search.query(
-                Q('match', category_name=query)
+            categories = categories.filter(category_name__icontains=query)
+
+        results = [
+            {
+                'uid': str(category['uid']),
+                'category_name': category['category_name'],
+                'slug': category['slug'],
+                'product_count': category['product_count'],
+            }
+            for category in categories.order_by('category_name').values(
+                'uid', 'category_name', 'slug', 'product_count'
             )
-        
-        response = search.execute()
-        
-        results = []
-        for hit in response:
-            results.append({
-                'uid': hit.uid,
-                'category_name': hit.category_name,
-                'slug': hit.slug,
-                'product_count': hit.product_count
-            })
-        
-        return JsonResponse({
+        ]
+
+        return FastJsonResponse({
             'results': results,
-            'total': response.hits.total.value if hasattr(response.hits.total, 'value') else response.hits.total
+            'total': len(results)
         })
 
 
 class SearchSuggestionsView(View):
+    """Search-as-you-type: the most popular names, categories and keywords for a prefix."""
+
     def get(self, request):
         query = request.GET.get('q', '')
-        limit = int(request.GET.get('limit', 5))
-        
-        if not query or len(query) < 2:
-            return JsonResponse({'suggestions': []})
-        
-        # Search for product names that start with or contain the query
-        search = ProductDocument.search()
-        search = search.query(
-            Q('prefix', product_name=query) | 
-            Q('match_phrase_prefix', product_name=query)
-        )
-        search = search[:limit]
-        
-        response = search.execute()
-        
-        suggestions = []
-        for hit in response:
-            suggestions.append({
-                'text': hit.product_name,
-                'value': hit.product_name,
-                'category': hit.category_name
-            })
-        
-        return JsonResponse({'suggestions': suggestions})
+        try:
+            limit = min(max(int(request.GET.get('limit', 5)), 1), MAX_SUGGESTIONS)
+        except ValueError:
+            limit = 5
+
+        if not query or len(query.strip()) < 2:
+            return FastJsonResponse({'suggestions': []})
+
+        return FastJsonResponse({'suggestions': get_suggester().suggest(query, limit)})
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -166,97 +149,57 @@ class AdvancedSearchView(View):
     def post(self, request):
         try:
             data = json.loads(request.body)
-            
+
             # Advanced search parameters
             query = data.get('query', '')
             filters = data.get('filters', {})
             sort = data.get('sort', {})
             pagination = data.get('pagination', {})
-            
-            # Build search
-            search = ProductDocument.search()
-            
-            # Query
-            if query:
-                search = search.query(
-                    Q('multi_match',
-                      query=query,
-                      fields=['product_name^3', 'product_description^2', 'category_name'],
-                      type='best_fields',
-                      fuzziness='AUTO')
-                )
-            
-            # Filters
-            must_filters = []
-            
-            if filters.get('categories'):
-                must_filters.append(Q('terms', category_name=filters['categories']))
-            
-            if filters.get('price_range'):
-                price_range = filters['price_range']
-                if price_range.get('min'):
-                    must_filters.append(Q('range', price={'gte': price_range['min']}))
-                if price_range.get('max'):
-                    must_filters.append(Q('range', price={'lte': price_range['max']}))
-            
-            if filters.get('in_stock'):
-                must_filters.append(Q('term', is_in_stock=True))
-            
-            if filters.get('featured'):
-                must_filters.append(Q('term', is_featured=True))
-            
-            if filters.get('bestsellers'):
-                must_filters.append(Q('term', is_bestseller=True))
-            
-            if filters.get('new_arrivals'):
-                must_filters.append(Q('term', is_new_arrival=True))
-            
-            # Apply filters
-            if must_filters:
-                search = search.filter(Q('bool', must=must_filters))
-            
+
+            categories = filters.get('categories') or []
+            price_range = filters.get('price_range') or {}
+            flags = [
+                flag for option, flag in (
+                    ('featured', 'is_featured'),
+                    ('bestsellers', 'is_bestseller'),
+                    ('new_arrivals', 'is_new_arrival'),
+                ) if filters.get(option)
+            ]
+
             # Sorting
-            if sort.get('field') and sort.get('order'):
-                field = sort['field']
-                order = sort['order']
-                if order == 'desc':
-                    field = f'-{field}'
-                search = search.sort(field)
-            
+            order = sort.get('order', 'asc')
+            sort_by = {
+                'price': f'price_{order}',
+                'product_name': f'name_{order}',
+                'created_at': 'newest',
+            }.get(sort.get('field'), 'relevance')
+
+            result = get_backend().search(
+                query,
+                category=categories[0] if len(categories) == 1 else None,
+                min_price=_number(price_range.get('min')),
+                max_price=_number(price_range.get('max')),
+                in_stock=True if filters.get('in_stock') else None,
+                sort=sort_by,
+            )
+            if len(categories) > 1:
+                # The index filters on one category; narrow to several here.
+                result.hits = _narrow(result.hits, category__category_name__in=categories)
+
             # Pagination
-            page = pagination.get('page', 1)
-            per_page = pagination.get('per_page', 20)
-            start = (page - 1) * per_page
-            search = search[start:start + per_page]
-            
-            # Execute search
-            response = search.execute()
-            
-            # Format results
-            results = []
-            for hit in response:
-                results.append({
-                    'uid': hit.uid,
-                    'product_name': hit.product_name,
-                    'slug': hit.slug,
-                    'price': hit.price,
-                    'category_name': hit.category_name,
-                    'is_in_stock': hit.is_in_stock,
-                    'is_featured': hit.is_featured,
-                    'is_bestseller': hit.is_bestseller,
-                    'is_new_arrival': hit.is_new_arrival,
-                    'score': hit.meta.score
-                })
-            
-            return JsonResponse({
+            page = max(int(pagination.get('page', 1)), 1)
+            per_page = min(max(int(pagination.get('per_page', 20)), 1), 100)
+            results, total = _page(result, page, per_page, flags)
+
+            return FastJsonResponse({
                 'results': results,
-                'total': response.hits.total.value if hasattr(response.hits.total, 'value') else response.hits.total,
+                'total': total,
                 'page': page,
                 'per_page': per_page,
                 'query': query
             })
-            
+
         except json.JSONDecodeError:
-            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+            return FastJsonResponse({'error': 'Invalid JSON'}, status=400)
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
+            return FastJsonResponse({'error': str(e)}, status=500)
@@ -1,10 +1,22 @@
 """
 Test analytics functionality.
 """
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Count, Sum
 from django.urls import reverse
-from accounts.models import Profile, Order, Analytics
+from openpyxl import load_workbook
+from django.utils import timezone
+from accounts.models import Profile, Order, OrderItem, Analytics, CustomerLoyalty
+from accounts.rollups import (
+    dirty_days, daily_metric, refresh, rollup_day, AOV, CATEGORY_REVENUE, NEW_CUSTOMERS, ORDER_COUNT,
+    REVENUE, UNITS_BY_PRODUCT,
+)
+from accounts.timeseries import daily_series, monthly_series
 from products.models import Product, Category
 
 
@@ -117,3 +129,180 @@ class AnalyticsTestCase(TestCase):
             'metrics': ['sales_revenue', 'order_count']
         })
         self.assertEqual(response.status_code, 302)  # Redirect after creation
+
+
+class TimeSeriesTestCase(TestCase):
+    """Test the dashboard time-series helpers."""
+
+    def setUp(self):
+        """Create orders on a few known days."""
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.today = date(2025, 3, 10)
+        for order_id, days_ago, total in [('TS-1', 0, 10), ('TS-2', 0, 5), ('TS-3', 2, 7), ('TS-4', 40, 100)]:
+            order = Order.objects.create(
+                user=self.user, order_id=order_id, payment_status='completed', payment_mode='COD',
+                order_total_price=total, grand_total=total,
+            )
+            when = timezone.make_aware(datetime.combine(self.today - timedelta(days=days_ago), datetime.min.time()))
+            Order.objects.filter(pk=order.pk).update(order_date=when + timedelta(hours=12))
+
+    def test_daily_series_is_zero_filled(self):
+        """Test every day is present and empty days are zero."""
+        series = daily_series(
+            Order.objects.all(), 'order_date', days=5, end=self.today,
+            revenue=Sum('grand_total'), orders=Count('uid'),
+        )
+        self.assertEqual([day['date'] for day in series], [self.today - timedelta(days=i) for i in range(5)])
+        self.assertEqual(series[0]['revenue'], Decimal('15'))
+        self.assertEqual(series[0]['orders'], 2)
+        self.assertEqual(series[1]['revenue'], 0)
+        self.assertEqual(series[2]['orders'], 1)
+
+    def test_daily_series_oldest_first(self):
+        """Test the order can be reversed for charts."""
+        series = daily_series(Order.objects.all(), 'order_date', days=3, end=self.today,
+                              newest_first=False, orders=Count('uid'))
+        self.assertEqual([day['orders'] for day in series], [1, 0, 2])
+
+    def test_series_is_a_single_query(self):
+        """Test one query is used however long the range is."""
+        with self.assertNumQueries(1):
+            daily_series(Order.objects.all(), 'order_date', days=90, end=self.today, revenue=Sum('grand_total'))
+
+    def test_monthly_series_uses_calendar_months(self):
+        """Test months are bucketed by calendar month."""
+        series = monthly_series(Order.objects.all(), 'order_date', months=3, end=self.today,
+                                revenue=Sum('grand_total'))
+        self.assertEqual([month['date'] for month in series],
+                         [date(2025, 3, 1), date(2025, 2, 1), date(2025, 1, 1)])
+        self.assertEqual([month['revenue'] for month in series], [Decimal('22'), 0, Decimal('100')])
+
+
+class RollupTestCase(TestCase):
+    """Test the daily Analytics rollups."""
+
+    def setUp(self):
+        """Create a customer, a product and an order placed today."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.category = Category.objects.create(category_name='Snacks', category_image='')
+        self.product = Product.objects.create(
+            product_name='Chips', category=self.category, price=5, product_desription='Chips'
+        )
+        self.today = timezone.localdate()
+        self.order = self.place_order('RU-1', 30, quantity=3)
+
+    def place_order(self, order_id, total, quantity=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                user=self.user, order_id=order_id, payment_status='completed', payment_mode='COD',
+                order_total_price=total, grand_total=total,
+            )
+            OrderItem.objects.create(order=order, product=self.product, quantity=quantity, product_price=total)
+        return order
+
+    def metric(self, metric_type, day=None):
+        refresh()
+        return Analytics.objects.get(date=day or self.today, metric_type=metric_type)
+
+    def test_writes_only_mark_their_day(self):
+        """Test writes leave the rollup to the next refresh instead of computing it."""
+        self.assertFalse(Analytics.objects.exists())
+        self.assertEqual(dirty_days(), [self.today])
+
+    def test_refresh_rolls_up_written_days(self):
+        """Test order and customer writes are materialized by the next refresh."""
+        self.assertEqual(self.metric(REVENUE).value, Decimal('30'))
+        self.assertEqual(self.metric(ORDER_COUNT).value, 1)
+        self.assertEqual(self.metric(NEW_CUSTOMERS).value, 1)
+        self.assertEqual(self.metric(UNITS_BY_PRODUCT).value, 3)
+        self.assertEqual(
+            self.metric(UNITS_BY_PRODUCT).metadata['products'][str(self.product.pk)]['units'], 3
+        )
+        self.assertEqual(self.metric(CATEGORY_REVENUE).metadata['categories'], {'Snacks': 30.0})
+
+    def test_rollup_follows_changes(self):
+        """Test later orders, items and deletions update the stored values."""
+        self.place_order('RU-2', 10)
+        self.assertEqual(self.metric(REVENUE).value, Decimal('40'))
+        self.assertEqual(self.metric(AOV).value, Decimal('20'))
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2, product_price=10)
+        self.assertEqual(self.metric(UNITS_BY_PRODUCT).value, 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.delete()
+        self.assertEqual(self.metric(ORDER_COUNT).value, 1)
+
+    def test_dirty_days_detects_missed_writes(self):
+        """Test days changed behind the signals' back are found and fixed."""
+        refresh()
+        self.assertEqual(dirty_days(), [])
+        Order.objects.filter(pk=self.order.pk).update(grand_total=50, updated_at=timezone.now())
+        self.assertEqual(dirty_days(), [self.today])
+        rollup_day(self.today)
+        self.assertEqual(self.metric(REVENUE).value, Decimal('50'))
+        self.assertEqual(dirty_days(), [])
+
+    def test_dashboard_reads_rollups(self):
+        """Test daily_metric returns a zero-filled window of stored values."""
+        series = daily_metric(REVENUE, days=3)
+        self.assertEqual([day['value'] for day in series], [Decimal('30'), 0, 0])
+
+    def test_command_recomputes_dirty_days(self):
+        """Test the management command rolls up dirty days."""
+        Analytics.objects.all().delete()
+        call_command('rollup_analytics', stdout=StringIO())
+        self.assertEqual(self.metric(REVENUE).value, Decimal('30'))
+
+
+class ExportTestCase(TestCase):
+    """Test the streaming report exports."""
+
+    def setUp(self):
+        """Create a staff user and two customers with orders."""
+        self.staff = User.objects.create_user(username='manager', password='testpass123', is_staff=True)
+        for i, orders in enumerate([3, 1]):
+            user = User.objects.create_user(
+                username=f'customer{i}', first_name='Customer', last_name=str(i), email=f'c{i}@example.com',
+            )
+            CustomerLoyalty.objects.create(user=user, total_spent=100 - i)
+            for n in range(orders):
+                Order.objects.create(
+                    user=user, order_id=f'EX-{i}-{n}', payment_status='completed', payment_mode='COD',
+                    order_total_price=10, grand_total=10,
+                )
+        self.client.force_login(self.staff)
+
+    def test_customers_csv_is_streamed_with_annotated_counts(self):
+        """Test the customer export streams and counts orders in the same query."""
+        response = self.client.get(reverse('export_analytics') + '?type=customers')
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), [
+            'Customer,Email,Total Spent,Orders,Tier',
+            'Customer 0,c0@example.com,100.00,3,bronze',
+            'Customer 1,c1@example.com,99.00,1,bronze',
+        ])
+
+    def test_xlsx_export(self):
+        """Test ?format=excel returns a workbook with the same rows."""
+        response = self.client.get(reverse('export_analytics') + '?type=customers&format=excel')
+        self.assertEqual(
+            response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.values)
+        self.assertEqual(rows[0], ('Customer', 'Email', 'Total Spent', 'Orders', 'Tier'))
+        self.assertEqual(rows[1][3], 3)
+        self.assertEqual(len(rows), 3)
+
+    def test_inventory_report_export(self):
+        """Test inventory reports download as CSV when a format is given."""
+        category = Category.objects.create(category_name='Snacks', category_image='')
+        Product.objects.create(
+            product_name='Chips', category=category, price=5, product_desription='Chips', stock_quantity=4
+        )
+        response = self.client.get(reverse('inventory_reports') + '?type=low_stock&format=csv')
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[1], 'Chips,Snacks,4,10,True')
+
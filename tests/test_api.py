@@ -0,0 +1,288 @@
+"""
+Test API serializer profiles, query planning, JSON encoding and conditional GET.
+"""
+import datetime
+import io
+import json
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import viewsets
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from api import fastjson
+from api.conditional import ConditionalGetMixin
+from api.prefetch import plan_queryset
+from api.serializers import CategorySerializer, OrderSerializer
+from api.views import OrderViewSet, ProductViewSet
+from accounts.models import Order, OrderItem
+from products.models import Product, Category, ProductImage, ProductReview
+from products.stock import apply_stock_updates
+
+
+class ProductAPIProfileTestCase(TestCase):
+    """Test the list and detail profiles of the product API."""
+
+    def setUp(self):
+        """Create a category and three reviewers."""
+        cache.clear()
+        self.category = Category.objects.create(category_name='Pantry', category_image='')
+        self.users = [User.objects.create_user(username=f'reviewer{i}', password='testpass123') for i in range(3)]
+        self.factory = APIRequestFactory()
+        self.list_view = ProductViewSet.as_view({'get': 'list'})
+        self.detail_view = ProductViewSet.as_view({'get': 'retrieve'})
+
+    def add_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                product_name=f'Item {Product.objects.count()}', category=self.category, price=i,
+                product_desription='A long description ' * 20,
+            )
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=f'product/{product.slug}-{n}.jpg', sort_order=n,
+                             is_primary=n == 1)
+                for n in range(2)
+            ])
+            for user in self.users:
+                ProductReview.objects.create(product=product, user=user, stars=4, content='Good')
+
+    def list_queries(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.list_view(self.factory.get('/api/products/', params))
+            response.render()
+        return response, len(context.captured_queries)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        """Test the product list costs the same queries for 2 rows as for 10."""
+        self.add_products(2)
+        _, few = self.list_queries()
+        self.add_products(8)
+        response, many = self.list_queries()
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(few, many)
+
+    def test_list_profile_is_lean(self):
+        """Test list rows carry a category summary and one image, not reviews."""
+        self.add_products(1)
+        product = Product.objects.get()
+        item = self.list_view(self.factory.get('/api/products/')).data['results'][0]
+        self.assertEqual(set(item['category']), {'uid', 'category_name', 'slug'})
+        self.assertTrue(item['image'].endswith(f'{product.slug}-1.jpg'))
+        self.assertNotIn('reviews', item)
+        self.assertNotIn('product_desription', item)
+
+        detail = self.detail_view(self.factory.get(f'/api/products/{product.pk}/'), pk=product.pk)
+        self.assertEqual(len(detail.data['reviews']), 3)
+        self.assertEqual(len(detail.data['product_images']), 2)
+        list_size = len(json.dumps(item, default=str))
+        self.assertLess(list_size * 3, len(json.dumps(detail.data, default=str)))
+
+    def test_sparse_fieldsets(self):
+        """Test ?fields= trims rows and the queries behind them."""
+        self.add_products(3)
+        response, queries = self.list_queries(fields='uid,product_name,bogus')
+        self.assertEqual([set(item) for item in response.data['results']], [{'uid', 'product_name'}] * 3)
+        # The conditional GET aggregate, then the page itself: nothing to prefetch.
+        self.assertEqual(queries, 2)
+
+        product = Product.objects.first()
+        detail = self.detail_view(
+            self.factory.get(f'/api/products/{product.pk}/', {'fields': 'uid,reviews'}), pk=product.pk,
+        )
+        self.assertEqual(set(detail.data), {'uid', 'reviews'})
+
+    def test_nested_relations_are_planned(self):
+        """Test relations below a to-many relation are prefetched with it."""
+        queryset = plan_queryset(Order.objects.all(), OrderSerializer())
+        self.assertEqual(queryset.query.select_related, {'user': {}, 'assigned_employee': {}})
+        self.assertIn('order_items__product__reviews__user', queryset._prefetch_related_lookups)
+        self.assertIn('order_items__product__category', queryset._prefetch_related_lookups)
+
+
+class FastJsonTestCase(TestCase):
+    """Test the fast JSON layer and its stdlib fallback."""
+
+    payload = {
+        'uid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'price': Decimal('12.50'),
+        'created_at': datetime.datetime(2024, 5, 1, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(2024, 5, 1),
+        'tags': ['fresh', 'local'],
+        'name': 'Crème brûlée',
+    }
+    expected = {
+        'uid': '12345678-1234-5678-1234-567812345678',
+        'price': '12.50',
+        'created_at': '2024-05-01T08:30:15.123456Z',
+        'day': '2024-05-01',
+        'tags': ['fresh', 'local'],
+        'name': 'Crème brûlée',
+    }
+
+    def tearDown(self):
+        """Forget the backend chosen under overridden settings."""
+        fastjson.reset_json_backend()
+
+    def test_backends_encode_alike(self):
+        """Test every available backend writes Decimal, UUID and datetimes the same way."""
+        names = ['stdlib'] + (['orjson'] if fastjson.orjson is not None else [])
+        for name in names:
+            backend = fastjson.JSON_BACKENDS[name]()
+            self.assertEqual(json.loads(backend.dumps(self.payload)), self.expected, name)
+            self.assertEqual(backend.loads(backend.dumps(self.expected)), self.expected, name)
+        with self.assertRaises(TypeError):
+            fastjson.StdlibBackend().dumps({'value': object()})
+
+    @override_settings(JSON_BACKEND='stdlib')
+    def test_fast_json_response(self):
+        """Test FastJsonResponse behaves like JsonResponse."""
+        fastjson.reset_json_backend()
+        response = fastjson.FastJsonResponse(self.payload, status=201)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), self.expected)
+        with self.assertRaises(TypeError):
+            fastjson.FastJsonResponse(['not', 'a', 'dict'])
+        self.assertEqual(json.loads(fastjson.FastJsonResponse([1], safe=False).content), [1])
+
+    def test_renderer_and_parser(self):
+        """Test the DRF renderer indents on request and the parser rejects bad JSON."""
+        renderer = fastjson.FastJSONRenderer()
+        self.assertEqual(json.loads(renderer.render(self.payload)), self.expected)
+        self.assertIn(b'\n', renderer.render(self.payload, 'application/json; indent=4'))
+        self.assertEqual(renderer.render(None), b'')
+
+        parser = fastjson.FastJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO('{"name": "Crème"}'.encode())), {'name': 'Crème'})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"name": '))
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test ETags, Last-Modified and 304s on the API viewsets."""
+
+    def setUp(self):
+        """Create products and an order."""
+        cache.clear()
+        self.category = Category.objects.create(category_name='Pantry', category_image='')
+        self.products = [
+            Product.objects.create(product_name=f'Item {i}', category=self.category, price=i, product_desription='Test')
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user(username='customer', password='testpass123')
+        self.factory = APIRequestFactory()
+        self.list_view = ProductViewSet.as_view({'get': 'list'})
+        self.detail_view = ProductViewSet.as_view({'get': 'retrieve'})
+
+    def get(self, view, path='/api/products/', user=None, **kwargs):
+        headers = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in kwargs.pop('headers', {}).items()}
+        request = self.factory.get(path, **headers)
+        if user is not None:
+            force_authenticate(request, user=user)
+        return view(request, **kwargs)
+
+    def test_list_revalidates_without_serializing(self):
+        """Test a matching If-None-Match costs one aggregate query and returns 304."""
+        response = self.get(self.list_view)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            response = self.get(self.list_view, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_writes_change_the_etag(self):
+        """Test saving, deleting and reviewing products give new ETags."""
+        etags = [self.get(self.list_view)['ETag']]
+        self.products[0].save()
+        etags.append(self.get(self.list_view)['ETag'])
+        Product.objects.filter(pk=self.products[1].pk).delete()
+        etags.append(self.get(self.list_view)['ETag'])
+        ProductReview.objects.create(product=self.products[2], user=self.user, stars=5, content='Great')
+        etags.append(self.get(self.list_view)['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+        self.assertEqual(self.get(self.list_view, headers={'If-None-Match': etags[-1]}).status_code, 304)
+
+    def test_if_modified_since(self):
+        """Test If-Modified-Since is answered from the newest updated_at of an untagged resource."""
+        class UntaggedCategoryViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+            queryset = Category.objects.all()
+            serializer_class = CategorySerializer
+
+        view = UntaggedCategoryViewSet.as_view({'get': 'list'})
+        last_modified = self.get(view, '/api/categories/')['Last-Modified']
+        self.assertEqual(self.get(view, '/api/categories/', headers={'If-Modified-Since': last_modified}).status_code, 304)
+        Category.objects.filter(pk=self.category.pk).update(updated_at=timezone.now() + datetime.timedelta(minutes=1))
+        self.assertEqual(self.get(view, '/api/categories/', headers={'If-Modified-Since': last_modified}).status_code, 200)
+
+    def test_tagged_resources_revalidate_by_etag_only(self):
+        """Test a category rename, which leaves updated_at alone, still changes the product list."""
+        response = self.get(self.list_view)
+        future = http_date((timezone.now() + datetime.timedelta(minutes=1)).timestamp())
+        self.assertEqual(self.get(self.list_view, headers={'If-Modified-Since': future}).status_code, 200)
+        self.category.category_name = 'Larder'
+        self.category.save()
+        self.assertEqual(self.get(self.list_view, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_detail_etag_follows_the_product(self):
+        """Test a product's ETag moves with its reviews but not with other products."""
+        product = self.products[0]
+        path = f'/api/products/{product.pk}/'
+        etag = self.get(self.detail_view, path, pk=product.pk)['ETag']
+        self.assertEqual(self.get(self.detail_view, path, pk=product.pk, headers={'If-None-Match': etag}).status_code, 304)
+        self.products[1].save()
+        self.assertEqual(self.get(self.detail_view, path, pk=product.pk, headers={'If-None-Match': etag}).status_code, 304)
+        ProductReview.objects.create(product=product, user=self.user, stars=4, content='Good')
+        self.assertEqual(self.get(self.detail_view, path, pk=product.pk, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_order_etag_follows_its_products(self):
+        """Test stock and description edits of an ordered product change the order's ETag."""
+        product = self.products[0]
+        order = Order.objects.create(
+            user=self.user, order_id='ETAG-002', payment_status='pending', payment_mode='COD',
+            order_total_price=10, grand_total=10,
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=1, product_price=0)
+        detail = OrderViewSet.as_view({'get': 'retrieve'})
+        listing = OrderViewSet.as_view({'get': 'list'})
+        path = f'/api/orders/{order.pk}/'
+        detail_etag = self.get(detail, path, user=self.user, pk=order.pk)['ETag']
+        list_etag = self.get(listing, '/api/orders/', user=self.user)['ETag']
+
+        apply_stock_updates([{'product_id': str(product.pk), 'action': 'set', 'quantity': 7}])
+        response = self.get(detail, path, user=self.user, pk=order.pk, headers={'If-None-Match': detail_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['order_items'][0]['product']['stock_quantity'], 7)
+        response = self.get(listing, '/api/orders/', user=self.user, headers={'If-None-Match': list_etag})
+        self.assertEqual(response.status_code, 200)
+
+        detail_etag = self.get(detail, path, user=self.user, pk=order.pk)['ETag']
+        product.product_desription = 'Now with more crunch'
+        product.save()
+        response = self.get(detail, path, user=self.user, pk=order.pk, headers={'If-None-Match': detail_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_orders_stay_private(self):
+        """Test another customer's order is a 404, whatever the validators."""
+        other = User.objects.create_user(username='other', password='testpass123')
+        order = Order.objects.create(
+            user=other, order_id='ETAG-001', payment_status='pending', payment_mode='COD',
+            order_total_price=10, grand_total=10,
+        )
+        view = OrderViewSet.as_view({'get': 'retrieve'})
+        path = f'/api/orders/{order.pk}/'
+        response = self.get(view, path, user=other, pk=order.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        response = self.get(view, path, user=self.user, pk=order.pk, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,293 @@
+"""
+Test the tiered cache backend.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from api.cache_utils import bump_tags, cache_result, invalidate_cache_pattern, tagged_key
+from products.models import Category, Product
+
+
+class TieredCacheTestCase(TestCase):
+    """Test the in-process LRU in front of the SQLite shared tier."""
+
+    def setUp(self):
+        """Point a fresh tiered cache at a throwaway SQLite file."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.location = f"test-tiered-{id(self)}"
+        self.settings_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'api.cache_backend.TieredCache',
+                'LOCATION': self.location,
+                'OPTIONS': {
+                    'SHARED': 'shared',
+                    'L1_MAX_ENTRIES': 3,
+                    'L1_TIMEOUT': 30,
+                    'L1_BYPASS_PREFIXES': ('rate_limit_',),
+                    'LOCK_POLL': 0.01,
+                },
+            },
+            'shared': {
+                'BACKEND': 'api.cache_backend.SQLiteCache',
+                'LOCATION': os.path.join(self.tmpdir, 'cache.sqlite3'),
+            },
+        })
+        self.settings_override.enable()
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+        self.cache.reset_stats()
+
+    def tearDown(self):
+        """Remove the temporary cache file."""
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_set_and_get_hits_local_tier(self):
+        """Test values are served from L1 after a set."""
+        self.cache.set('greeting', {'text': 'hello'})
+        self.assertEqual(self.cache.get('greeting'), {'text': 'hello'})
+        self.assertEqual(self.cache.stats()['l1_hits'], 1)
+
+    def test_shared_tier_serves_other_workers(self):
+        """Test a value set by one worker is read from the shared tier by another."""
+        self.cache.set('shared-key', 42)
+        self.cache.clear_local()  # what a different worker process would see
+        self.assertEqual(self.cache.get('shared-key'), 42)
+        self.assertEqual(self.cache.stats()['l2_hits'], 1)
+        # The value is promoted into L1 for the next lookup.
+        self.assertEqual(self.cache.get('shared-key'), 42)
+        self.assertEqual(self.cache.stats()['l1_hits'], 1)
+
+    def test_local_tier_is_bounded(self):
+        """Test the LRU evicts the least recently used entries."""
+        for i in range(5):
+            self.cache.set(f'key-{i}', i)
+        stats = self.cache.stats()
+        self.assertEqual(stats['l1_entries'], 3)
+        self.assertEqual(stats['evictions'], 2)
+        # Evicted entries are still available from the shared tier.
+        self.assertEqual(self.cache.get('key-0'), 0)
+
+    def test_delete_removes_both_tiers(self):
+        """Test delete clears L1 and the shared tier."""
+        self.cache.set('doomed', 'value')
+        self.cache.delete('doomed')
+        self.assertIsNone(self.cache.get('doomed'))
+        self.assertIsNone(self.shared.get('doomed'))
+
+    def test_add_and_incr_are_shared(self):
+        """Test add is atomic and counters bypass the local tier."""
+        self.assertTrue(self.cache.add('rate_limit_general_1.2.3.4', 1, 60))
+        self.assertFalse(self.cache.add('rate_limit_general_1.2.3.4', 5, 60))
+        self.assertEqual(self.cache.incr('rate_limit_general_1.2.3.4'), 2)
+        self.assertEqual(self.shared.get('rate_limit_general_1.2.3.4'), 2)
+
+    def test_expired_entries_are_misses(self):
+        """Test entries expire in the shared tier."""
+        self.shared.set('short', 'lived', 1)
+        self.assertEqual(self.shared.get('short'), 'lived')
+        time.sleep(1.1)
+        self.assertIsNone(self.shared.get('short'))
+        self.assertTrue(self.shared.add('short', 'again', 60))
+
+    def test_get_or_set_single_flight(self):
+        """Test concurrent misses recompute the value only once."""
+        calls = []
+
+        def expensive():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'computed'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_set('hot', expensive, 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['computed'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats()['computes'], 1)
+
+    def test_get_or_set_waits_for_other_worker(self):
+        """Test a worker waits for another worker's recompute lock."""
+        self.shared.add('lock:slow', 1, 30)
+
+        def finish_elsewhere():
+            time.sleep(0.1)
+            self.shared.set('slow', 'from-other-worker', 60)
+            self.shared.delete('lock:slow')
+
+        helper = threading.Thread(target=finish_elsewhere)
+        helper.start()
+        value = self.cache.get_or_set('slow', lambda: 'recomputed', 60)
+        helper.join()
+
+        self.assertEqual(value, 'from-other-worker')
+        self.assertEqual(self.cache.stats()['stampede_waits'], 1)
+        self.assertEqual(self.cache.stats()['computes'], 0)
+
+    def test_get_many(self):
+        """Test get_many merges both tiers."""
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.clear_local()
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c', 'd']), {'a': 1, 'b': 2, 'c': 3})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheTagTestCase(TestCase):
+    """Test tag-based cache invalidation."""
+
+    def setUp(self):
+        """Start each test from an empty cache."""
+        cache.clear()
+        self.category = Category.objects.create(category_name="Snacks", category_image="")
+        self.product = Product.objects.create(
+            product_name="Chips", category=self.category, price=5, product_desription="Salted chips"
+        )
+
+    def test_tests_do_not_clear_the_dev_cache(self):
+        """Test the suite's shared tier is in memory, not the dev server's SQLite file."""
+        self.assertEqual(settings.SHARED_CACHE['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+    def test_bumping_a_tag_changes_the_key(self):
+        """Test tagged keys change only when one of their tags is bumped."""
+        key = tagged_key('listing', ['products'])
+        self.assertEqual(tagged_key('listing', ['products']), key)
+        bump_tags('categories')
+        self.assertEqual(tagged_key('listing', ['products']), key)
+        bump_tags('products')
+        self.assertNotEqual(tagged_key('listing', ['products']), key)
+
+    def test_invalidate_pattern_keeps_unrelated_entries(self):
+        """Test invalidation no longer clears the whole cache."""
+        cache.set('rate_limit_general_1.2.3.4', 3, 60)
+        invalidate_cache_pattern('products')
+        self.assertEqual(cache.get('rate_limit_general_1.2.3.4'), 3)
+
+    def test_cache_result_with_tags(self):
+        """Test tagged results are recomputed after a bump."""
+        calls = []
+
+        @cache_result(timeout=60, tags=lambda slug: [f'product:{slug}'])
+        def load(slug):
+            calls.append(slug)
+            return len(calls)
+
+        self.assertEqual(load('chips'), 1)
+        self.assertEqual(load('chips'), 1)
+        bump_tags('product:chips')
+        self.assertEqual(load('chips'), 2)
+
+    def test_product_save_bumps_its_tags(self):
+        """Test saving a product invalidates listing and detail entries."""
+        listing = tagged_key('listing', ['products'])
+        detail = tagged_key('detail', [f'product:{self.product.slug}'])
+        other = tagged_key('detail', ['product:something-else'])
+        self.product.price = 6
+        self.product.save()
+        self.assertNotEqual(tagged_key('listing', ['products']), listing)
+        self.assertNotEqual(tagged_key('detail', [f'product:{self.product.slug}']), detail)
+        self.assertEqual(tagged_key('detail', ['product:something-else']), other)
+
+    def test_stock_edit_keeps_listings_cached(self):
+        """Test a save that does not change how a product is listed leaves 'products' alone."""
+        listing = tagged_key('listing', ['products'])
+        detail = tagged_key('detail', [f'product:{self.product.pk}'])
+        self.product.stock_quantity = 40
+        self.product.save()
+        self.assertEqual(tagged_key('listing', ['products']), listing)
+        self.assertNotEqual(tagged_key('detail', [f'product:{self.product.pk}']), detail)
+
+        self.product.is_in_stock = False
+        self.product.save(update_fields=['is_in_stock'])
+        self.assertNotEqual(tagged_key('listing', ['products']), listing)
+
+    def test_category_save_bumps_category_tag(self):
+        """Test saving a category invalidates its tag."""
+        key = tagged_key('category-page', [f'category:{self.category.pk}'])
+        self.category.save()
+        self.assertNotEqual(tagged_key('category-page', [f'category:{self.category.pk}']), key)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResponseCacheTestCase(TestCase):
+    """Test the response cache on anonymous catalog pages."""
+
+    def setUp(self):
+        """Create a product to render."""
+        cache.clear()
+        self.category = Category.objects.create(category_name="Snacks", category_image="")
+        self.product = Product.objects.create(
+            product_name="Chips", category=self.category, price=5, product_desription="Salted chips"
+        )
+
+    def test_repeat_request_skips_the_view(self):
+        """Test a cached page is served without touching the database."""
+        first = self.client.get(reverse('index'))
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('index'))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_if_none_match_returns_304(self):
+        """Test revalidation with a matching ETag returns Not Modified."""
+        etag = self.client.get(reverse('products_only'))['ETag']
+        response = self.client.get(reverse('products_only'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_query_string_is_part_of_the_key(self):
+        """Test different sorts are cached separately."""
+        self.client.get(reverse('index'), {'sort': 'priceAsc'})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index'), {'sort': 'priceAsc'})
+        with self.assertRaises(AssertionError):
+            with self.assertNumQueries(0):
+                self.client.get(reverse('index'), {'sort': 'priceDesc'})
+
+    def test_product_change_invalidates_pages(self):
+        """Test saving a product re-renders the listing and its detail page."""
+        self.client.get(reverse('products_only'))
+        self.client.get(reverse('get_product', args=[self.product.slug]))
+        self.product.product_name = "Crisps"
+        self.product.save()
+        self.assertContains(self.client.get(reverse('products_only')), "Crisps")
+        self.assertContains(self.client.get(reverse('get_product', args=[self.product.slug])), "Crisps")
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        """Test logged-in users always get a freshly rendered page."""
+        user = User.objects.create_user(username='shopper', password='testpass123')
+        self.client.get(reverse('index'))
+        self.client.force_login(user)
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('ETag', response)
+
+    def test_cached_page_gets_its_own_csrf_token(self):
+        """Test each visitor receives a token that matches their own cookie."""
+        url = reverse('get_product', args=[self.product.slug])
+        Client().get(url)
+        visitor = Client(enforce_csrf_checks=True)
+        page = visitor.get(url)
+        token = re.search(rb'name="csrfmiddlewaretoken" value="(\w+)"', page.content).group(1).decode()
+        self.assertIn('csrftoken', page.cookies)
+        response = visitor.post(reverse('add_to_cart', args=[self.product.uid]), {'csrfmiddlewaretoken': token})
+        self.assertNotEqual(response.status_code, 403)
@@ -1,11 +1,14 @@
 """
 Test cart functionality.
 """
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
 from django.urls import reverse
+from accounts.cart_utils import get_cart_summary
 from accounts.models import Profile, Cart, CartItem, Coupon
-from products.models import Product, Category
+from products.models import Product, Category, ColorVariant, SizeVariant
 
 
 class CartTestCase(TestCase):
@@ -30,7 +33,7 @@ class CartTestCase(TestCase):
         self.product = Product.objects.create(
             product_name='Test Product',
             category=self.category,
-            price=99.99,
+            price=100,
             product_desription='Test product description',
             stock_quantity=100
         )
@@ -60,7 +63,7 @@ class CartTestCase(TestCase):
         )
         
         self.assertEqual(cart_item.quantity, 2)
-        self.assertEqual(cart_item.get_product_price(), 199.98)
+        self.assertEqual(cart_item.get_product_price(), 200)
     
     def test_cart_total_calculation(self):
         """Test cart total calculation."""
@@ -71,7 +74,7 @@ class CartTestCase(TestCase):
         )
         
         total = self.cart.get_cart_total()
-        self.assertEqual(total, 199.98)
+        self.assertEqual(total, 200)
     
     def test_coupon_application(self):
         """Test coupon application."""
@@ -85,7 +88,7 @@ class CartTestCase(TestCase):
         self.cart.save()
         
         total_after_coupon = self.cart.get_cart_total_price_after_coupon()
-        self.assertEqual(total_after_coupon, 89.99)  # 99.99 - 10
+        self.assertEqual(total_after_coupon, 90)  # 100 - 10
     
     def test_coupon_minimum_amount(self):
         """Test coupon minimum amount requirement."""
@@ -127,3 +130,155 @@ class CartTestCase(TestCase):
         
         response = self.client.post(reverse('remove_cart', args=[cart_item.uid]))
         self.assertEqual(response.status_code, 302)  # Redirect after removal
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CartSummaryTestCase(TestCase):
+    """Test the cached cart count used by page templates."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='shopper', password='testpass123')
+        self.category = Category.objects.create(category_name='Test Category', category_image='')
+        self.product = Product.objects.create(
+            product_name='Test Product',
+            category=self.category,
+            price=20,
+            product_desription='Test product description',
+            stock_quantity=100
+        )
+
+    def request_for(self, user=None, session_key=None):
+        request = self.factory.get('/')
+        request.user = user or AnonymousUser()
+        request.session = SessionStore(session_key=session_key)
+        return request
+
+    def test_anonymous_visitor_gets_no_cart(self):
+        """Test rendering the badge for a new visitor writes nothing."""
+        request = self.request_for()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_summary(request)['count'], 0)
+        self.assertIsNone(request.session.session_key)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_count_is_summed_and_cached(self):
+        """Test the count is aggregated once and then read from the cache."""
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=3)
+
+        self.assertEqual(get_cart_summary(self.request_for(self.user))['count'], 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_summary(self.request_for(self.user))['count'], 5)
+            self.assertEqual(self.user.profile.get_cart_count(), 5)
+
+    def test_summary_is_resolved_once_per_request(self):
+        """Test repeated tag calls in one request reuse the summary."""
+        request = self.request_for(self.user)
+        get_cart_summary(request)
+        cache.clear()
+        with self.assertNumQueries(0):
+            get_cart_summary(request)
+
+    def test_cart_changes_invalidate_count(self):
+        """Test adding, editing and removing items refreshes the count."""
+        cart = Cart.objects.create(session_key='visitorsession1')
+        self.assertEqual(get_cart_summary(self.request_for(session_key='visitorsession1'))['count'], 0)
+
+        item = CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        self.assertEqual(get_cart_summary(self.request_for(session_key='visitorsession1'))['count'], 1)
+
+        item.quantity = 4
+        item.save()
+        self.assertEqual(get_cart_summary(self.request_for(session_key='visitorsession1'))['count'], 4)
+
+        item.delete()
+        self.assertEqual(get_cart_summary(self.request_for(session_key='visitorsession1'))['count'], 0)
+
+    def test_paid_cart_is_not_counted(self):
+        """Test paying for a cart resets the badge."""
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.assertEqual(self.user.profile.get_cart_count(), 2)
+        cart.is_paid = True
+        cart.save()
+        self.assertEqual(self.user.profile.get_cart_count(), 0)
+
+
+class CartPricingTestCase(TestCase):
+    """Test cart totals computed in one query per cart revision."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.category = Category.objects.create(category_name='Test Category', category_image='')
+        self.product = Product.objects.create(
+            product_name='Test Product',
+            category=self.category,
+            price=20,
+            product_desription='Test product description',
+            stock_quantity=100
+        )
+        self.red = ColorVariant.objects.create(color_name='Red', price=5)
+        self.large = SizeVariant.objects.create(size_name='L')
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        CartItem.objects.create(
+            cart=self.cart, product=self.product, quantity=1,
+            color_variant=self.red, size_variant=self.large,
+        )
+
+    def test_totals_include_variant_surcharges(self):
+        """Test line totals, subtotal and item count."""
+        cart = Cart.objects.get(pk=self.cart.pk)
+        pricing = cart.get_pricing()
+        self.assertEqual(sorted(pricing['lines'].values()), [25, 40])
+        self.assertEqual(pricing['subtotal'], 65)
+        self.assertEqual(pricing['line_count'], 2)
+        self.assertEqual(pricing['item_count'], 3)
+        self.assertEqual(cart.get_cart_total(), 65)
+        self.assertEqual(cart.get_final_total(), 65)
+
+    def test_totals_take_one_query_per_revision(self):
+        """Test the pricing query runs once and is then served from memory or cache."""
+        cart = Cart.objects.get(pk=self.cart.pk)
+        items = list(cart.cart_items.all())
+        with self.assertNumQueries(1):
+            cart.get_cart_total()
+            cart.get_cart_total_price_after_coupon()
+            for item in items:
+                item.get_total_price()
+        with self.assertNumQueries(0):
+            self.assertEqual(Cart(pk=self.cart.pk).get_cart_total(), 65)
+
+    def test_coupon_applies_above_minimum(self):
+        """Test the discount only applies once the subtotal reaches the minimum."""
+        self.cart.coupon = Coupon.objects.create(coupon_code='SAVE10', discount_amount=10, minimum_amount=50)
+        self.cart.save()
+        cart = Cart.objects.get(pk=self.cart.pk)
+        self.assertEqual(cart.get_cart_total_price_after_coupon(), 55)
+
+        cart.coupon.minimum_amount = 100
+        cart.coupon.save()
+        self.assertEqual(cart.get_pricing(fresh=True)['total'], 65)
+
+    def test_item_changes_invalidate_pricing(self):
+        """Test editing and removing items refreshes the totals."""
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).get_cart_total(), 65)
+        item = self.cart.cart_items.get(color_variant__isnull=True)
+        item.quantity = 5
+        item.save()
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).get_cart_total(), 125)
+        item.delete()
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).get_cart_total(), 25)
+
+    def test_product_price_change_reprices_cached_cart(self):
+        """Test the cached totals follow a product's new price, as checkout will."""
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).get_cart_total(), 65)
+        self.product.price = 30
+        self.product.save()
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).get_cart_total(), 95)
@@ -0,0 +1,68 @@
+"""
+Test catalog listing helpers.
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from products.catalog import catalog_queryset, display_products
+from products.models import Product, Category
+
+
+class ProductListTestCase(TestCase):
+    """Test the product list page and display variant resolution."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.category = Category.objects.create(category_name='Drinks', category_image='')
+
+    def make_product(self, name, parent=None):
+        return Product.objects.create(
+            product_name=name,
+            category=self.category,
+            parent=parent,
+            price=10,
+            product_desription='Test product description',
+            stock_quantity=50,
+        )
+
+    def test_regular_variant_is_displayed(self):
+        """Test products with sizes are shown through their Regular variant."""
+        cola = self.make_product('Cola')
+        self.make_product('Cola Large', parent=cola)
+        regular = self.make_product('Cola Regular', parent=cola)
+        juice = self.make_product('Juice')
+        small = self.make_product('Juice Small', parent=juice)
+        water = self.make_product('Water')
+
+        shown = display_products(catalog_queryset().order_by('product_name'))
+        self.assertEqual(shown, [regular, small, water])
+
+    def test_query_count_does_not_grow_with_products(self):
+        """Test the page costs the same number of queries for 2 or 12 products."""
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('product_list'))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        for i in range(2):
+            parent = self.make_product(f'Parent {i}')
+            self.make_product(f'Parent {i} Regular', parent=parent)
+        small_catalog = count_queries()
+
+        for i in range(2, 12):
+            parent = self.make_product(f'Parent {i}')
+            self.make_product(f'Parent {i} Regular', parent=parent)
+        self.assertEqual(count_queries(), small_catalog)
+
+    def test_product_list_is_paginated(self):
+        """Test the list is split into pages."""
+        for i in range(30):
+            self.make_product(f'Snack {i}')
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(len(response.context['products']), 24)
+        response = self.client.get(reverse('product_list'), {'page': 2})
+        self.assertEqual(len(response.context['products']), 6)
@@ -0,0 +1,360 @@
+"""
+Test background image processing.
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from products import codecs, image_jobs
+from products.blob_views import serve_blob
+from products.image_utils import ImageOptimizer, downscale_chain
+from products.management.commands import optimize_images as optimize_images_command
+from products.models import Category, ImageProcessingJob, ImageRendition, Product, ProductImage, StoredBlob
+from products.renditions import render_renditions
+from products.storage import BLOB_DIR
+
+
+def png_upload(name='photo.png', size=(1200, 900), color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageTestCase(TestCase):
+    """Base for tests writing media to a scratch directory."""
+
+    def setUp(self):
+        """Point MEDIA_ROOT at a temporary directory."""
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(category_name='Pantry', category_image='')
+        self.product = Product.objects.create(
+            product_name='Tomato', category=self.category, price=3, product_desription='Test',
+        )
+
+
+class ImageProcessingJobTestCase(ImageTestCase):
+    """Test uploads are stored as they came and optimized by the worker."""
+
+    def test_save_stores_original_and_queues_job(self):
+        """Test saving an upload does no encoding and queues one job."""
+        image = ProductImage.objects.create(product=self.product, image=png_upload(), is_primary=True)
+        self.assertTrue(image.image.name.endswith('.png'))
+        job = ImageProcessingJob.objects.get()
+        self.assertEqual((job.kind, job.object_id, job.source, job.status),
+                         ('product_image', image.pk, image.image.name, 'pending'))
+        self.assertEqual(image.get_optimization_info()['status'], 'pending')
+
+        # Saving without a new upload queues nothing.
+        image.alt_text = 'A tomato'
+        image.save()
+        self.assertEqual(ImageProcessingJob.objects.count(), 1)
+
+    def test_worker_swaps_in_optimized_image(self):
+        """Test the worker replaces the original with a resized WebP."""
+        image = ProductImage.objects.create(product=self.product, image=png_upload(), is_primary=True)
+        original = image.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(image_jobs.drain(), 1)
+
+        image.refresh_from_db()
+        self.assertTrue(image.image.name.endswith('.webp'))
+        self.assertFalse(default_storage.exists(original))
+        with default_storage.open(image.image.name) as optimized:
+            self.assertEqual(Image.open(optimized).size, (800, 600))
+        info = image.get_optimization_info()
+        self.assertEqual(info['status'], 'done')
+        self.assertLess(info['optimized_size'], info['original_size'])
+
+    def test_category_images_are_processed(self):
+        """Test category uploads go through the same queue."""
+        category = Category.objects.create(category_name='Bakery', category_image=png_upload('bakery.png'))
+        image_jobs.drain()
+        category.refresh_from_db()
+        self.assertTrue(category.category_image.name.endswith('.webp'))
+        self.assertEqual(category.get_optimization_info()['status'], 'done')
+
+    def test_newer_upload_supersedes_older_job(self):
+        """Test a job whose original was replaced does not overwrite the newer upload."""
+        image = ProductImage.objects.create(product=self.product, image=png_upload())
+        first_job = ImageProcessingJob.objects.get()
+        image.image = png_upload('second.png', color=(0, 0, 200))
+        image.save()
+
+        image_jobs.drain()
+        first_job.refresh_from_db()
+        self.assertEqual(first_job.status, 'superseded')
+        image.refresh_from_db()
+        self.assertTrue(image.image.name.endswith('.webp'))
+        self.assertEqual(image.get_optimization_info()['status'], 'done')
+
+    def test_broken_originals_fail_after_retries(self):
+        """Test undecodable files are retried, then marked failed."""
+        image = ProductImage.objects.create(product=self.product, image=png_upload())
+        with default_storage.open(image.image.name, 'wb') as original:
+            original.write(b'not an image')
+
+        for _ in range(image_jobs.MAX_ATTEMPTS):
+            image_jobs.process_batch()
+        job = ImageProcessingJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, image_jobs.MAX_ATTEMPTS)
+        self.assertTrue(job.last_error)
+        self.assertEqual(image_jobs.process_batch(), 0)
+
+    def test_invalid_uploads_are_rejected_in_the_request(self):
+        """Test validation still happens on save."""
+        with self.assertRaises(ValueError):
+            ProductImage.objects.create(product=self.product, image=png_upload(size=(50, 50)))
+        self.assertFalse(ImageProcessingJob.objects.exists())
+
+
+class ImageRenditionTestCase(ImageTestCase):
+    """Test responsive renditions and their markup."""
+
+    def test_downscale_chain_never_upscales(self):
+        """Test each width comes from the previous step and wider ones keep the image."""
+        steps = list(downscale_chain(Image.new('RGB', (1000, 500)), [200, 400, 800, 1200]))
+        self.assertEqual([width for width, _ in steps], [1200, 800, 400, 200])
+        self.assertEqual([image.size for _, image in steps],
+                         [(1000, 500), (800, 400), (400, 200), (200, 100)])
+
+    def test_renditions_collapse_widths_past_the_image(self):
+        """Test a narrow image gets one unscaled rendition instead of upscaled ones."""
+        renditions = render_renditions(Image.new('RGB', (500, 250)), formats=['JPEG'])
+        self.assertEqual([(width, height) for width, height, _, _ in renditions],
+                         [(500, 250), (400, 200), (200, 100)])
+
+    def test_job_stores_renditions(self):
+        """Test the worker writes every width and format of the swapped image."""
+        image = ProductImage.objects.create(product=self.product, image=png_upload(), is_primary=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            image_jobs.drain()
+        image.refresh_from_db()
+
+        renditions = ImageRendition.objects.filter(source=image.image.name)
+        formats = set(renditions.values_list('format', flat=True))
+        self.assertTrue({'WEBP', 'JPEG'} <= formats)
+        self.assertEqual(sorted(renditions.filter(format='JPEG').values_list('width', flat=True)),
+                         [200, 400, 800, 1200])
+        for rendition in renditions:
+            self.assertTrue(default_storage.exists(rendition.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(ImageRendition.objects.exists())
+        self.assertFalse(default_storage.exists(rendition.file.name))
+
+    def test_reprocessing_a_shared_blob_keeps_its_renditions(self):
+        """Test swapping one of two rows sharing an optimized blob leaves the other's renditions."""
+        first = ProductImage.objects.create(product=self.product, image=png_upload('a.png'))
+        second = ProductImage.objects.create(product=self.product, image=png_upload('b.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            image_jobs.drain()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        shared = first.image.name
+        self.assertEqual(second.image.name, shared)
+        self.assertTrue(ImageRendition.objects.filter(source=shared).exists())
+
+        with first.image.storage.open(shared) as source:
+            data = source.read()
+        job = image_jobs.start_image_job('product_image', first)
+        with self.captureOnCommitCallbacks(execute=True):
+            image_jobs.complete_job(job, first, data, lambda: image_jobs.optimize_source(data, 'product_primary'))
+        self.assertEqual(job.status, 'done')
+        renditions = ImageRendition.objects.filter(source=shared)
+        self.assertTrue(renditions.exists())
+        for rendition in renditions:
+            self.assertTrue(default_storage.exists(rendition.file.name))
+
+    def test_picture_tag_renders_sources(self):
+        """Test the picture tag offers WebP sources and a JPEG srcset fallback."""
+        image = ProductImage.objects.create(product=self.product, image=png_upload(), is_primary=True)
+        template = Template('{% load image_tags %}{% picture image.image alt="Tomato" sizes="50vw" %}')
+        before = template.render(Context({'image': image}))
+        self.assertIn(f'src="{image.image.url}"', before)
+        self.assertNotIn('srcset', before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image_jobs.drain()
+        image.refresh_from_db()
+        html = template.render(Context({'image': image}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('.jpg 1200w', html)
+        self.assertIn('sizes="50vw"', html)
+        self.assertIn('width="1200" height="900"', html)
+
+
+class CodecRegistryTestCase(TestCase):
+    """Test encoder capabilities are probed once, without encoding."""
+
+    def setUp(self):
+        """Start every test from an unprobed registry."""
+        codecs.reset_codecs()
+        self.addCleanup(codecs.reset_codecs)
+
+    def test_probe_writes_nothing_and_runs_once(self):
+        """Test the probe asks Pillow's features instead of saving an image."""
+        with mock.patch.object(Image.Image, 'save') as save, \
+                mock.patch.object(codecs.Codec, 'is_supported', autospec=True, return_value=True) as probe:
+            for _ in range(3):
+                self.assertEqual(ImageOptimizer.get_available_formats(), ['JPEG', 'WEBP', 'AVIF'])
+        save.assert_not_called()
+        self.assertEqual(probe.call_count, len(codecs.CODECS))
+
+    def test_unbuilt_formats_are_unavailable(self):
+        """Test formats missing from this Pillow build are left out."""
+        formats = ImageOptimizer.get_available_formats()
+        self.assertIn('JPEG', formats)
+        with mock.patch.dict(Image.SAVE, clear=True):
+            codecs.reset_codecs()
+            self.assertEqual(ImageOptimizer.get_available_formats(), [])
+
+    def test_save_options_use_quality_settings(self):
+        """Test encode options combine QUALITY_SETTINGS with the codec's own."""
+        self.assertEqual(ImageOptimizer.save_options('JPEG'),
+                         {'quality': 85, 'optimize': True, 'progressive': True})
+        self.assertEqual(ImageOptimizer.save_options('WEBP')['quality'], ImageOptimizer.QUALITY_SETTINGS['WEBP'])
+
+
+class OptimizeImagesCommandTestCase(ImageTestCase):
+    """Test the bulk optimize_images command."""
+
+    def setUp(self):
+        """Upload three images, two of them identical."""
+        super().setUp()
+        self.images = sorted([
+            ProductImage.objects.create(product=self.product, image=png_upload('a.png')),
+            ProductImage.objects.create(product=self.product, image=png_upload('b.png')),
+            ProductImage.objects.create(product=self.product, image=png_upload('c.png', color=(0, 90, 0))),
+        ], key=lambda image: image.pk)
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.checkpoint), ignore_errors=True)
+
+    def optimize_images(self, **options):
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('optimize_images', workers=1, checkpoint=self.checkpoint, stdout=out, **options)
+        return out.getvalue()
+
+    def test_optimizes_pending_images_once_per_content(self):
+        """Test every image is swapped while identical originals are encoded once."""
+        with mock.patch.object(optimize_images_command, 'optimize_source', wraps=image_jobs.optimize_source) as encode:
+            output = self.optimize_images()
+
+        self.assertEqual(encode.call_count, 2)
+        self.assertIn('Optimized: 3 (1 duplicate originals encoded once)', output)
+        self.assertIn('images/s', output)
+        for image in self.images:
+            image.refresh_from_db()
+            self.assertTrue(image.image.name.endswith('.webp'))
+        self.assertFalse(ImageProcessingJob.objects.filter(status='pending').exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        # Nothing is left for a second run.
+        self.assertIn('Optimized: 0', self.optimize_images())
+
+    def test_resumes_after_checkpoint(self):
+        """Test images up to the checkpointed one are not walked again."""
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump({'product_image': str(self.images[0].pk)}, checkpoint)
+        output = self.optimize_images()
+
+        self.assertIn('Resuming from', output)
+        self.assertIn('Optimized: 2', output)
+        self.images[0].refresh_from_db()
+        self.assertTrue(self.images[0].image.name.endswith('.png'))
+
+    def test_stale_rows_leave_newer_uploads_queued(self):
+        """Test the command's job for an old file neither supersedes nor overwrites a newer upload."""
+        stale = ProductImage.objects.get(pk=self.images[0].pk)
+        with stale.image.storage.open(stale.image.name) as source:
+            data = source.read()
+        current = ProductImage.objects.get(pk=stale.pk)
+        current.image = png_upload('newer.png', color=(0, 0, 200))
+        current.save()
+        upload_job = ImageProcessingJob.objects.get(source=current.image.name)
+
+        command = optimize_images_command.Command(stdout=io.StringIO())
+        command.options, command.checkpoint = {'checkpoint': self.checkpoint}, {}
+        stats = dict(optimized=0, skipped=0, errors=0, before=0, after=0)
+        future = optimize_images_command.run_inline(image_jobs.optimize_source, data, 'product_gallery')
+        with self.captureOnCommitCallbacks(execute=True):
+            command.finish('product_image', stale, data, future, stats)
+
+        self.assertEqual(stats['skipped'], 1)
+        upload_job.refresh_from_db()
+        self.assertEqual(upload_job.status, 'pending')
+        current.refresh_from_db()
+        self.assertTrue(current.image.name.endswith('.png'))
+        image_jobs.drain()
+        current.refresh_from_db()
+        self.assertTrue(current.image.name.endswith('.webp'))
+
+    def test_dry_run_changes_nothing(self):
+        """Test a dry run reports the pending images without encoding them."""
+        output = self.optimize_images(dry_run=True)
+        self.assertIn('Would optimize: 3 (1 duplicates', output)
+        self.assertFalse(ImageProcessingJob.objects.filter(status='done').exists())
+
+
+class ContentAddressedStorageTestCase(ImageTestCase):
+    """Test image files are stored once per content and reference counted."""
+
+    def test_identical_uploads_share_one_blob(self):
+        """Test the same bytes saved twice are one file with two references."""
+        first = ProductImage.objects.create(product=self.product, image=png_upload('front.png'))
+        second = ProductImage.objects.create(product=self.product, image=png_upload('copy.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('blobs/'))
+        self.assertEqual(StoredBlob.objects.get(name=first.image.name).refs, 2)
+
+        other = ProductImage.objects.create(product=self.product, image=png_upload(color=(0, 0, 0)))
+        self.assertNotEqual(other.image.name, first.image.name)
+
+    def test_file_outlives_all_but_the_last_reference(self):
+        """Test deleting a row keeps a blob another row still uses."""
+        first = ProductImage.objects.create(product=self.product, image=png_upload())
+        second = ProductImage.objects.create(product=self.product, image=png_upload())
+        with self.captureOnCommitCallbacks(execute=True):
+            image_jobs.drain()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        renditions = ImageRendition.objects.filter(source=first.image.name)
+        self.assertTrue(renditions.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.image.name))
+        self.assertTrue(renditions.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.image.name))
+        self.assertFalse(renditions.exists())
+        self.assertFalse(StoredBlob.objects.filter(name=second.image.name).exists())
+
+    def test_blob_urls_are_cached_for_good(self):
+        """Test blobs are served with a far-future immutable Cache-Control."""
+        image = ProductImage.objects.create(product=self.product, image=png_upload())
+        path = image.image.name[len(f'{BLOB_DIR}/'):]
+        response = serve_blob(RequestFactory().get(image.image.url), path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
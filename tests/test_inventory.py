@@ -4,8 +4,9 @@ Test inventory management functionality.
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
-from accounts.models import Profile, InventoryAlert, StoreLocation
+from accounts.models import Profile, InventoryAlert, StoreLocation, Order, OrderItem
 from products.models import Product, Category, StockMovement
+from products.stock import InsufficientStock, apply_stock_updates, reserve_stock
 
 
 class InventoryTestCase(TestCase):
@@ -129,3 +130,153 @@ class InventoryTestCase(TestCase):
             }]
         }, content_type='application/json')
         self.assertEqual(response.status_code, 200)
+
+
+class StockReservationTestCase(TestCase):
+    """Test conditional stock deduction for order confirmation."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.employee = User.objects.create_user(username='picker', password='testpass123', is_staff=True)
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+        self.category = Category.objects.create(category_name='Test Category', category_image='')
+        self.apples = Product.objects.create(
+            product_name='Apples', category=self.category, price=2,
+            product_desription='Apples', stock_quantity=10,
+        )
+        self.pears = Product.objects.create(
+            product_name='Pears', category=self.category, price=3,
+            product_desription='Pears', stock_quantity=2,
+        )
+
+    def make_order(self, *lines):
+        order = Order.objects.create(
+            user=self.customer, order_id=f'TEST{Order.objects.count()}', payment_status='Pending',
+            payment_mode='Cash on Delivery', order_total_price=0, grand_total=0,
+            assigned_employee=self.employee,
+        )
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, product_price=0)
+        return order
+
+    def test_reservation_deducts_and_records_movements(self):
+        """Test every line is deducted and logged, with repeated products merged."""
+        deducted = reserve_stock(
+            [(self.apples.pk, 3), (self.pears.pk, 2), (str(self.apples.pk), 1)], reference='REF1',
+        )
+        self.assertEqual(deducted, {self.apples.pk: 4, self.pears.pk: 2})
+        self.apples.refresh_from_db()
+        self.pears.refresh_from_db()
+        self.assertEqual(self.apples.stock_quantity, 6)
+        self.assertEqual(self.pears.stock_quantity, 0)
+        self.assertFalse(self.pears.is_in_stock)
+        self.assertTrue(self.apples.is_in_stock)
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(reference='REF1').values_list('quantity', flat=True)), [2, 4],
+        )
+
+    def test_shortfall_rolls_back_every_line(self):
+        """Test one short line leaves all stock untouched."""
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock([(self.apples.pk, 3), (self.pears.pk, 5)])
+        self.assertEqual(raised.exception.shortages, [(self.pears.pk, 'Pears', 5, 2)])
+        self.apples.refresh_from_db()
+        self.assertEqual(self.apples.stock_quantity, 10)
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_confirm_order_deducts_stock_once(self):
+        """Test confirming an order twice only deducts its stock once."""
+        order = self.make_order((self.apples, 4))
+        self.client.force_login(self.employee)
+        url = reverse('confirm_order', args=[order.order_id])
+        self.client.post(url)
+        self.client.post(url)
+
+        order.refresh_from_db()
+        self.apples.refresh_from_db()
+        self.assertTrue(order.is_confirmed)
+        self.assertEqual(order.status, 'confirmed')
+        self.assertEqual(self.apples.stock_quantity, 6)
+        self.assertEqual(StockMovement.objects.filter(reference=order.order_id).count(), 1)
+
+    def test_confirm_order_with_shortfall_stays_pending(self):
+        """Test a shortfall leaves the order unconfirmed and stock untouched."""
+        order = self.make_order((self.apples, 4), (self.pears, 3))
+        self.client.force_login(self.employee)
+        self.client.post(reverse('confirm_order', args=[order.order_id]))
+
+        order.refresh_from_db()
+        self.apples.refresh_from_db()
+        self.assertFalse(order.is_confirmed)
+        self.assertEqual(self.apples.stock_quantity, 10)
+
+
+class BulkStockUpdateTestCase(TestCase):
+    """Test batched stock updates."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='stocker', password='testpass123', is_staff=True)
+        self.category = Category.objects.create(category_name='Test Category', category_image='')
+        self.products = [
+            Product.objects.create(
+                product_name=f'Product {i}', category=self.category, price=1,
+                product_desription='Test product description', stock_quantity=10,
+            )
+            for i in range(3)
+        ]
+
+    def test_updates_are_applied_in_constant_queries(self):
+        """Test a batch costs the same queries whatever its size."""
+        updates = [
+            {'product_id': str(product.uid), 'action': 'add', 'quantity': 5}
+            for product in self.products
+        ]
+        with self.assertNumQueries(7):
+            results = apply_stock_updates(updates, user=self.user)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(
+            list(Product.objects.values_list('stock_quantity', flat=True).distinct()), [15],
+        )
+        self.assertEqual(StockMovement.objects.filter(movement_type='in', user=self.user).count(), 3)
+
+    def test_bad_lines_are_reported_without_aborting(self):
+        """Test unknown products, bad quantities and shortfalls only fail their own line."""
+        first, second, third = self.products
+        results = apply_stock_updates([
+            {'product_id': str(first.uid), 'movement_type': 'adjustment', 'quantity': 42},
+            {'product_id': 'not-a-uuid', 'movement_type': 'in', 'quantity': 1},
+            {'product_id': '00000000-0000-0000-0000-000000000000', 'movement_type': 'in', 'quantity': 1},
+            {'product_id': str(second.uid), 'movement_type': 'out', 'quantity': 11},
+            {'product_id': str(third.uid), 'action': 'add', 'quantity': 'many'},
+            {'product_id': str(third.uid), 'movement_type': 'out', 'quantity': 10},
+        ])
+        self.assertEqual(
+            [result.get('error') for result in results],
+            [None, 'Invalid product id', 'Product not found', 'Insufficient stock', 'Invalid quantity', None],
+        )
+        for product in self.products:
+            product.refresh_from_db()
+        self.assertEqual([p.stock_quantity for p in self.products], [42, 10, 0])
+        self.assertFalse(self.products[2].is_in_stock)
+
+    def test_lines_without_action_or_quantity_change_nothing(self):
+        """Test only the products API defaults to 'set', and a set needs a quantity."""
+        first, second, _ = self.products
+        results = apply_stock_updates([
+            {'product_id': str(first.uid), 'quantity': 3},
+            {'product_id': str(second.uid), 'movement_type': 'adjustment'},
+        ])
+        self.assertEqual([result.get('error') for result in results], ['Missing action', 'Missing quantity'])
+        results = apply_stock_updates([{'product_id': str(first.uid), 'quantity': 3}], default_action='set')
+        self.assertEqual(results[0]['new_stock'], 3)
+        second.refresh_from_db()
+        self.assertEqual(second.stock_quantity, 10)
+
+    def test_subtract_clamps_when_asked(self):
+        """Test the products API keeps clamping subtractions at zero."""
+        results = apply_stock_updates(
+            [{'product_id': str(self.products[0].uid), 'action': 'subtract', 'quantity': 99}], clamp=True,
+        )
+        self.assertEqual(results[0]['new_stock'], 0)
+
@@ -0,0 +1,150 @@
+"""
+Test keyset pagination.
+"""
+from datetime import timedelta
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.db.models.functions import Length
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from api.views import ProductViewSet
+from base.pagination import KeysetPagination, KeysetPaginator, approximate_count
+from products.models import Product, Category
+
+
+class KeysetPaginatorTestCase(TestCase):
+    """Test cursors over the product table."""
+
+    def setUp(self):
+        """Create products sharing prices and creation times."""
+        cache.clear()
+        self.category = Category.objects.create(category_name='Pantry', category_image='')
+        now = timezone.now()
+        for i in range(7):
+            product = Product.objects.create(
+                product_name=f'Item {i}', category=self.category, price=i // 3, product_desription='Test',
+            )
+            Product.objects.filter(pk=product.pk).update(created_at=now - timedelta(microseconds=i % 2))
+
+    def walk(self, queryset, per_page):
+        paginator = KeysetPaginator(queryset, per_page)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return paginator, pages
+
+    def test_pages_cover_every_row_once(self):
+        """Test ties on the sort key are broken by the primary key."""
+        for ordering in (['price'], ['-price'], ['-created_at'], ['category_id', '-price']):
+            queryset = Product.objects.order_by(*ordering)
+            _, pages = self.walk(queryset, 3)
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            walked = [product.pk for page in pages for product in page]
+            self.assertEqual(walked, list(KeysetPaginator(queryset, 3).queryset.values_list('pk', flat=True)))
+
+    def test_nullable_keys_sort_nulls_last(self):
+        """Test pages over a nullable key cover every row once, with nulls after values."""
+        for i, product in enumerate(Product.objects.order_by('pk')):
+            Product.objects.filter(pk=product.pk).update(weight=None if i % 3 == 0 else i % 2)
+        for ordering in ('weight', '-weight'):
+            paginator, pages = self.walk(Product.objects.order_by(ordering), 2)
+            walked = [product for page in pages for product in page]
+            self.assertEqual(len({product.pk for product in walked}), 7)
+            weights = [product.weight for product in walked]
+            values = sorted(weight for weight in weights if weight is not None)
+            if ordering == 'weight':
+                self.assertEqual(weights, values + [None] * 3)
+            else:
+                self.assertEqual(weights, [None] * 3 + values[::-1])
+            back = paginator.get_page(pages[2].previous_cursor)
+            self.assertEqual(list(back), list(pages[1]))
+
+    def test_annotations_are_rejected(self):
+        """Test orderings without a model field cannot be paged by cursor."""
+        queryset = Product.objects.annotate(name_length=Length('product_name')).order_by('name_length')
+        with self.assertRaises(ValueError):
+            KeysetPaginator(queryset, 3)
+
+    def test_previous_cursor_returns_the_same_page(self):
+        """Test walking back gives the pages walked forward."""
+        paginator, pages = self.walk(Product.objects.order_by('price'), 3)
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.has_next())
+        first = paginator.get_page(back.previous_cursor)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    def test_deep_pages_cost_one_query(self):
+        """Test a page is one LIMIT query, with no COUNT or OFFSET."""
+        paginator, pages = self.walk(Product.objects.order_by('-created_at'), 2)
+        with self.assertNumQueries(1) as context:
+            page = paginator.get_page(pages[-2].next_cursor)
+        self.assertEqual(list(page), list(pages[-1]))
+        self.assertNotIn('OFFSET', context.captured_queries[0]['sql'])
+
+    def test_bad_cursors_give_the_first_page(self):
+        """Test garbage and tampered cursors fall back to page one."""
+        paginator = KeysetPaginator(Product.objects.order_by('price'), 3)
+        first = list(paginator.get_page())
+        self.assertEqual(list(paginator.get_page('not-a-cursor')), first)
+        self.assertEqual(list(paginator.get_page('eyJ2IjpbMV0sInIiOjB9')), first)
+
+    def test_approximate_count(self):
+        """Test small counts are exact and large ones capped."""
+        self.assertEqual(approximate_count(Product.objects.all()), (7, True))
+        self.assertEqual(approximate_count(Product.objects.all(), cap=5), (5, False))
+
+    def test_products_page_uses_cursors(self):
+        """Test the product list links to the next page by cursor."""
+        Product.objects.bulk_create([
+            Product(product_name=f'Bulk {i}', slug=f'bulk-{i}', category=self.category, price=1,
+                    product_desription='Test')
+            for i in range(20)
+        ])
+        response = self.client.get(reverse('products_only'))
+        self.assertEqual(len(response.context['products']), 20)
+        next_cursor = response.context['products'].next_cursor
+        self.assertContains(response, f'?cursor={next_cursor}')
+        response = self.client.get(reverse('products_only'), {'cursor': next_cursor})
+        self.assertEqual(len(response.context['products']), 7)
+
+
+class KeysetPaginationAPITestCase(TestCase):
+    """Test the DRF integration."""
+
+    def setUp(self):
+        """Create a handful of products."""
+        self.category = Category.objects.create(category_name='Pantry', category_image='')
+        for i in range(5):
+            Product.objects.create(
+                product_name=f'Item {i}', category=self.category, price=i, product_desription='Test',
+            )
+        self.view = ProductViewSet.as_view({'get': 'list'})
+        self.factory = APIRequestFactory()
+
+    def test_product_list_follows_next_links(self):
+        """Test the API pages with next links in the requested ordering."""
+        response = self.view(self.factory.get('/api/products/', {'ordering': '-price', 'page_size': 2, 'count': 1}))
+        self.assertEqual([item['price'] for item in response.data['results']], [4, 3])
+        self.assertEqual(response.data['count'], 5)
+        self.assertIsNone(response.data['previous'])
+
+        response = self.view(self.factory.get(response.data['next']))
+        self.assertEqual([item['price'] for item in response.data['results']], [2, 1])
+        self.assertIsNotNone(response.data['previous'])
+        self.assertNotIn('count', response.data)
+
+    def test_unsupported_ordering_pages_by_offset(self):
+        """Test an annotated ordering falls back to offset pages instead of failing."""
+        queryset = Product.objects.annotate(name_length=Length('product_name')).order_by('-name_length', 'price')
+        pagination = KeysetPagination()
+        request = Request(self.factory.get('/api/products/', {'page_size': 2}))
+        page = pagination.paginate_queryset(queryset, request)
+        self.assertEqual([product.price for product in page], [0, 1])
+        response = pagination.get_paginated_response([product.price for product in page])
+        self.assertEqual(response.data['count'], 5)
+        self.assertIn('offset=2', response.data['next'])
@@ -0,0 +1,101 @@
+"""
+Test product review aggregates.
+"""
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from products.models import Product, Category, ProductReview
+
+
+class ProductRatingTestCase(TestCase):
+    """Test the denormalized rating columns on Product."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.category = Category.objects.create(category_name='Test Category', category_image='')
+        self.product = Product.objects.create(
+            product_name='Test Product',
+            category=self.category,
+            price=20,
+            product_desription='Test product description',
+        )
+        self.users = [
+            User.objects.create_user(username=f'reviewer{i}', password='testpass123')
+            for i in range(3)
+        ]
+
+    def review(self, user, stars, product=None):
+        return ProductReview.objects.create(
+            product=product or self.product, user=user, stars=stars, content='Review'
+        )
+
+    def test_create_updates_aggregates(self):
+        """Test new reviews are added to the totals."""
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, 7)
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.get_rating(), 3.5)
+
+    def test_edit_applies_difference(self):
+        """Test changing the stars adjusts the sum only."""
+        review = self.review(self.users[0], 5)
+        review.stars = '3'  # views assign the raw POST value
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (3, 1))
+        self.assertEqual(self.product.rating_avg, 3)
+
+    def test_delete_removes_review(self):
+        """Test deleting a review takes it out of the totals."""
+        self.review(self.users[0], 4)
+        review = self.review(self.users[1], 2)
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (4, 1))
+        self.assertEqual(self.product.rating_avg, 4)
+
+        ProductReview.objects.get(user=self.users[0]).delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_avg, 0)
+
+    def test_get_rating_does_not_query(self):
+        """Test reading the rating is free once the product is loaded."""
+        self.review(self.users[0], 5)
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(product.get_rating(), 5)
+
+    def test_backfill_repairs_drift(self):
+        """Test the backfill command recomputes totals from reviews."""
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 1)
+        ProductReview.objects.filter(user=self.users[1]).update(stars=3)  # bypasses signals
+        call_command('backfill_ratings', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (8, 2))
+        self.assertEqual(self.product.rating_avg, 4)
+
+    def test_stale_product_save_keeps_new_reviews(self):
+        """Test saving an older copy of a product does not write its old totals back."""
+        stale = Product.objects.get(pk=self.product.pk)
+        self.review(self.users[0], 5)
+        stale.price = 25
+        stale.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, 25)
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (5, 1))
+
+    def test_removal_after_drift_does_not_go_negative(self):
+        """Test deleting a review whose totals were lost clamps them at zero."""
+        review = self.review(self.users[0], 4)
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=0, rating_count=0)
+        review.delete()
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (0, 0))
+        self.assertEqual(self.product.rating_avg, 0)
@@ -0,0 +1,489 @@
+"""
+Test product search.
+"""
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from products import fulltext
+from products.models import Product, Category
+from products.ratings import apply_rating_delta
+from products.stock import apply_stock_updates, reserve_stock
+from search.backends import (
+    DELETION_RETENTION, DatabaseSearchBackend, InvertedIndexBackend, SQLiteFTSBackend, get_backend, reset_backend,
+)
+from search.engine import Document, InvertedIndex, edit_distance, tokenize
+from search.indexing import LocalIndexer, drain, process_batch, reindex_all
+from search.models import DeletedProduct, SearchIndexQueue
+from search.suggest import PrefixIndex, Suggestion, SuggestionService, get_suggester, reset_suggester
+from accounts.models import Order, OrderItem, RecentlyViewed
+from django.contrib.auth.models import User
+
+
+class InvertedIndexTestCase(TestCase):
+    """Test the in-process search engine."""
+
+    def setUp(self):
+        """Index a few documents."""
+        self.index = InvertedIndex()
+        self.index.add(Document(1, name='Red Apples', description='Fresh fruit', category_name='Fruit', price=3))
+        self.index.add(Document(2, name='Apple Juice', description='Pressed apples', category_name='Drinks',
+                                price=6, in_stock=False))
+        self.index.add(Document(3, name='Banana', description='Goes well with apple pie', category_name='Fruit',
+                                price=2))
+        self.index.add(Document(4, name='Orange Soda', keywords='fizzy', category_name='Drinks', price=60))
+
+    def test_tokenize_normalizes_and_stems(self):
+        """Test accents, case, stop words and plurals are folded."""
+        self.assertEqual(tokenize('The Crème Brûlées of Berries'), ['creme', 'brulee', 'berry'])
+
+    def test_edit_distance_is_bounded(self):
+        """Test the distance stops counting past the limit."""
+        self.assertEqual(edit_distance('banana', 'bananna', 2), 1)
+        self.assertEqual(edit_distance('banana', 'orange', 1), 2)
+
+    def test_name_matches_rank_first(self):
+        """Test name hits outrank description hits and both add up."""
+        self.assertEqual(self.index.search('apple').pks, [2, 1, 3])
+
+    def test_every_token_must_match(self):
+        """Test multi-word queries are conjunctive."""
+        self.assertEqual(self.index.search('apple juice').pks, [2])
+
+    def test_prefix_and_typos(self):
+        """Test partial last words and misspellings still match."""
+        self.assertEqual(self.index.search('ban').pks, [3])
+        self.assertEqual(self.index.search('bananna').pks, [3])
+        self.assertEqual(self.index.search('fizy').pks, [4])
+
+    def test_filters_and_facets(self):
+        """Test filters narrow results while facets describe every match."""
+        result = self.index.search('apple', category='Fruit', in_stock=True)
+        self.assertEqual(result.pks, [1, 3])
+        self.assertEqual(result.facets['category'], {'Fruit': 2, 'Drinks': 1})
+        self.assertEqual(result.facets['in_stock'], {True: 2, False: 1})
+        self.assertEqual(self.index.search('', min_price=5, sort='price_desc').pks, [4, 2])
+        self.assertEqual(self.index.search('', max_price=5).facets['price'], {'0-10': 3, '50-100': 1})
+
+    def test_updates_replace_documents(self):
+        """Test re-adding and removing documents keeps postings consistent."""
+        self.index.add(Document(1, name='Green Pears', category_name='Fruit'))
+        self.assertEqual(self.index.search('apple').pks, [2, 3])
+        self.index.remove(2)
+        self.assertEqual(self.index.search('apple').pks, [3])
+        self.assertNotIn('juice', self.index.postings)
+
+
+class SearchBackendTestCase(TestCase):
+    """Test the search backends against the database."""
+
+    def setUp(self):
+        """Create products and a fresh backend."""
+        cache.clear()
+        reset_backend()
+        self.fruit = Category.objects.create(category_name='Fruit', category_image='')
+        self.apples = Product.objects.create(
+            product_name='Red Apples', category=self.fruit, price=3, product_desription='Crisp and sweet',
+        )
+        self.bananas = Product.objects.create(
+            product_name='Bananas', category=self.fruit, price=2, product_desription='Great with apples',
+        )
+
+    def test_backends_agree_on_matches(self):
+        """Test the index and the database backend find the same products."""
+        self.assertEqual(InvertedIndexBackend().search('apples').pks, [self.apples.pk, self.bananas.pk])
+        self.assertEqual(DatabaseSearchBackend().search('apples').pks, [self.apples.pk, self.bananas.pk])
+
+    def test_signals_update_the_index(self):
+        """Test saves, renames and deletes reach the process index."""
+        backend = get_backend()
+        self.assertEqual(backend.search('kiwi').pks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            kiwi = Product.objects.create(
+                product_name='Kiwi', category=self.fruit, price=4, product_desription='Green',
+            )
+        self.assertEqual(backend.index.search('kiwi').pks, [kiwi.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fruit.category_name = 'Produce'
+            self.fruit.save()
+        self.assertEqual(backend.index.search('produce').facets['category'], {'Produce': 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kiwi.delete()
+        self.assertEqual(backend.index.search('kiwi').pks, [])
+
+    def test_other_processes_catch_up(self):
+        """Test a second index notices writes it did not see through signals."""
+        other = InvertedIndexBackend()
+        other.search('anything')
+        Product.objects.create(product_name='Cherries', category=self.fruit, price=9, product_desription='Red')
+        self.bananas.delete()
+        self.assertEqual(len(other.search('cherry')), 1)
+        self.assertEqual(other.search('bananas').pks, [])
+
+    def test_other_processes_see_keyword_edits(self):
+        """Test an edit to searchable text alone reaches a second index."""
+        other = InvertedIndexBackend()
+        self.assertEqual(other.search('soda').pks, [])
+        self.bananas.keywords = 'sparkling soda'
+        self.bananas.save()
+        self.assertEqual(other.search('soda').pks, [self.bananas.pk])
+
+    def test_catch_up_reads_only_changes(self):
+        """Test catching up fetches changed rows and deletions, not the whole catalog."""
+        other = InvertedIndexBackend()
+        other.search('anything')
+        pk = self.bananas.pk
+        self.bananas.delete()
+        self.assertEqual(list(DeletedProduct.objects.values_list('product_id', flat=True)), [pk])
+        # Changed rows and deletions; the tag versions come from the cache.
+        with self.assertNumQueries(2):
+            self.assertEqual(other.search('bananas').pks, [])
+        self.assertNotIn(pk, other.index.docs)
+
+    def test_stale_index_is_rebuilt(self):
+        """Test an index that missed more deletions than are kept is rebuilt."""
+        other = InvertedIndexBackend()
+        other.search('anything')
+        other._synced_at -= DELETION_RETENTION * 2
+        DeletedProduct.objects.all().delete()
+        Product.objects.filter(pk=self.bananas.pk).delete()
+        DeletedProduct.objects.all().delete()
+        self.assertEqual(other.search('bananas').pks, [])
+
+    def test_product_search_tolerates_bad_paging(self):
+        """Test non-numeric paging parameters fall back to the defaults."""
+        response = Client().get(reverse('search:product_search'), {'q': 'apples', 'page': 'abc', 'per_page': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['page'], response.json()['per_page']), (1, 20))
+
+    def test_broad_queries_filter_without_hit_lists(self):
+        """Test flag and category filters past FILTER_IN_LIMIT do not bind every hit."""
+        drinks = Category.objects.create(category_name='Drinks', category_image='')
+        juice = Product.objects.create(
+            product_name='Apple Juice', category=drinks, price=5, product_desription='Pressed', is_featured=True,
+        )
+        Product.objects.filter(pk=self.apples.pk).update(is_featured=True)
+        client = Client()
+        for limit in (500, 1):
+            with mock.patch('search.views.FILTER_IN_LIMIT', limit), CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('search:product_search'), {'q': 'apple', 'featured': 'true'})
+            self.assertEqual({hit['uid'] for hit in response.json()['results']}, {str(self.apples.pk), str(juice.pk)})
+            self.assertEqual(response.json()['total'], 2)
+            bound = any(self.bananas.pk.hex in query['sql'] for query in queries.captured_queries)
+            self.assertEqual(bound, limit == 500)
+
+            response = client.post(reverse('search:advanced_search'), json.dumps({
+                'query': 'apple', 'filters': {'categories': ['Fruit', 'Drinks']},
+            }), content_type='application/json')
+            self.assertEqual(response.json()['total'], 3)
+
+    def test_search_page(self):
+        """Test the search page renders ranked results."""
+        response = Client().get(reverse('product_search'), {'q': 'aple'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [self.apples, self.bananas])
+
+
+class FullTextSearchTestCase(TestCase):
+    """Test the database full-text backend on SQLite FTS5."""
+
+    def setUp(self):
+        """Create products and build the FTS table."""
+        cache.clear()
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.addCleanup(setattr, fulltext, '_fts_ready', None)
+        self.fruit = Category.objects.create(category_name='Fruit', category_image='')
+        self.drinks = Category.objects.create(category_name='Drinks', category_image='')
+        self.apples = Product.objects.create(
+            product_name='Red Apples', category=self.fruit, price=3, product_desription='Crisp and sweet',
+        )
+        self.juice = Product.objects.create(
+            product_name='Orange Juice', category=self.drinks, price=60, keywords='apple blend',
+            product_desription='Freshly pressed', is_in_stock=False,
+        )
+        self.pie = Product.objects.create(
+            product_name='Banana', category=self.fruit, price=2, product_desription='Lovely in apple pie',
+        )
+        fulltext.rebuild()
+        self.backend = SQLiteFTSBackend()
+
+    def test_query_builders(self):
+        """Test every word is required and the last is a prefix."""
+        self.assertEqual(fulltext.prefix_tsquery("Red app'"), "'red' & 'app':*")
+        self.assertEqual(fulltext.fts_match_query('Red app'), '"red" "app"*')
+        self.assertEqual(fulltext.fts_match_query('  '), '')
+
+    def test_weighted_ranking_and_stemming(self):
+        """Test name hits beat keyword hits, which beat description hits."""
+        self.assertEqual(self.backend.search('apple').pks, [self.apples.pk, self.juice.pk, self.pie.pk])
+        self.assertEqual(self.backend.search('red app').pks, [self.apples.pk])
+        self.assertEqual(self.backend.search('fruit').pks, [self.pie.pk, self.apples.pk])
+
+    def test_filters_and_facets(self):
+        """Test facets count every match and filters narrow the hits."""
+        result = self.backend.search('apple', in_stock=True, sort='price_asc')
+        self.assertEqual(result.pks, [self.pie.pk, self.apples.pk])
+        self.assertEqual(result.facets['category'], {'Fruit': 2, 'Drinks': 1})
+        self.assertEqual(result.facets['price'], {'0-10': 2, '50-100': 1})
+        self.assertEqual(result.facets['in_stock'], {True: 2, False: 1})
+
+    def test_saves_keep_the_index_current(self):
+        """Test product edits, category renames and deletes reach the FTS table."""
+        self.apples.product_name = 'Green Pears'
+        self.apples.save()
+        self.assertEqual(self.backend.search('pear').pks, [self.apples.pk])
+        self.assertNotIn(self.apples.pk, self.backend.search('red').pks)
+
+        self.drinks.category_name = 'Beverages'
+        self.drinks.save()
+        self.assertEqual(self.backend.search('beverage').pks, [self.juice.pk])
+
+        self.pie.delete()
+        self.assertEqual(self.backend.search('banana').pks, [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {fulltext.FTS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_index_survives_renumbered_rows(self):
+        """Test the FTS table follows product uids when the product rowids change."""
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE products_product SET rowid = rowid + 100')
+        self.assertEqual(self.backend.search('red').pks, [self.apples.pk])
+        self.apples.product_name = 'Green Pears'
+        self.apples.save()
+        self.assertEqual(self.backend.search('pear').pks, [self.apples.pk])
+        self.assertEqual(self.backend.search('red').pks, [])
+
+    @override_settings(SEARCH_BACKEND='search.backends.fulltext_backend')
+    def test_search_page_uses_fulltext(self):
+        """Test the search page ranks through the configured full-text backend."""
+        reset_backend()
+        self.assertIsInstance(get_backend(), SQLiteFTSBackend)
+        response = Client().get(reverse('product_search'), {'q': 'apples'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [self.apples, self.juice, self.pie])
+
+
+class PrefixIndexTestCase(TestCase):
+    """Test the suggestion prefix index."""
+
+    def setUp(self):
+        """Load a few weighted suggestions."""
+        self.index = PrefixIndex()
+        self.index.load([
+            Suggestion(('product', 1), 'product', 'Red Apples', 5),
+            Suggestion(('product', 2), 'product', 'Apple Juice', 9),
+            Suggestion(('product', 2), 'keyword', 'apricot', 9),
+            Suggestion(('product', 3), 'keyword', 'Apricot', 4),
+            Suggestion(('category', 1), 'category', 'Bakery', 1),
+        ])
+
+    def texts(self, prefix, limit=10):
+        return [(hit['type'], hit['text']) for hit in self.index.lookup(prefix, limit)]
+
+    def test_prefixes_match_every_word(self):
+        """Test any word of a text can start a match, ranked by popularity."""
+        self.assertEqual(self.texts('ap'), [
+            ('keyword', 'apricot'), ('product', 'Apple Juice'), ('product', 'Red Apples'),
+        ])
+        self.assertEqual(self.texts('red a'), [('product', 'Red Apples')])
+        self.assertEqual(self.texts('APPLE '), [('product', 'Apple Juice')])
+        self.assertEqual(self.texts('ap', limit=1), [('keyword', 'apricot')])
+        self.assertEqual(self.texts('x'), [])
+
+    def test_shared_keywords_add_up(self):
+        """Test one keyword used by several products is suggested once."""
+        hits = self.index.lookup('apri')
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(self.index.lookup('apri')[0]['text'], 'apricot')
+
+    def test_writes_clear_the_hot_prefix_cache(self):
+        """Test replaced and removed owners stop showing up."""
+        self.assertEqual(self.texts('ba'), [('category', 'Bakery')])
+        self.index.replace(('category', 1), [Suggestion(('category', 1), 'category', 'Bread', 1)])
+        self.assertEqual(self.texts('ba'), [])
+        self.assertEqual(self.texts('br'), [('category', 'Bread')])
+        self.index.remove(('product', 2))
+        self.assertEqual(self.texts('ap'), [('product', 'Red Apples'), ('keyword', 'Apricot')])
+        self.assertEqual(len(self.index.keys), 4)
+
+
+class SuggestionServiceTestCase(TestCase):
+    """Test suggestions built from the catalog."""
+
+    def setUp(self):
+        """Create products with different sales and views."""
+        cache.clear()
+        reset_suggester()
+        self.addCleanup(reset_suggester)
+        self.user = User.objects.create_user(username='shopper', password='secret')
+        self.fruit = Category.objects.create(category_name='Fruit', category_image='')
+        self.apples = Product.objects.create(
+            product_name='Red Apples', category=self.fruit, price=3, product_desription='Crisp',
+            keywords='fresh, orchard',
+        )
+        self.juice = Product.objects.create(
+            product_name='Apple Juice', category=self.fruit, price=6, product_desription='Pressed',
+        )
+        order = Order.objects.create(
+            user=self.user, order_id='SUGGEST-1', payment_status='completed', payment_mode='COD',
+            order_total_price=9, grand_total=9,
+        )
+        OrderItem.objects.create(order=order, product=self.apples, quantity=3, product_price=3)
+        RecentlyViewed.objects.create(user=self.user, product=self.juice)
+
+    def test_popularity_ranks_suggestions(self):
+        """Test units sold and views decide the order."""
+        suggestions = get_suggester().suggest('ap')
+        self.assertEqual([hit['text'] for hit in suggestions], ['Red Apples', 'Apple Juice'])
+        self.assertEqual(suggestions[0]['slug'], self.apples.slug)
+        self.assertEqual(suggestions[0]['category'], 'Fruit')
+        self.assertEqual([hit['type'] for hit in get_suggester().suggest('fr')], ['category', 'keyword'])
+
+    def test_signals_update_suggestions(self):
+        """Test new, renamed and deleted products reach a built index."""
+        suggester = get_suggester()
+        suggester.suggest('ap')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(product_name='Apricots', category=self.fruit, price=5, product_desription='Dried')
+            self.juice.product_name = 'Pear Juice'
+            self.juice.save()
+            self.apples.delete()
+        self.assertEqual([hit['text'] for hit in suggester.suggest('ap')], ['Apricots'])
+        self.assertEqual([hit['text'] for hit in suggester.suggest('juice')], ['Pear Juice'])
+
+    def test_other_processes_catch_up_on_suggestions(self):
+        """Test a second service applies changed and deleted products it did not see."""
+        other = SuggestionService()
+        other.suggest('ap')
+        self.apples.delete()
+        self.juice.product_name = 'Pear Juice'
+        self.juice.save()
+        other._checked_at = 0.0
+        self.assertEqual([hit['text'] for hit in other.suggest('ap')], [])
+        self.assertEqual([hit['text'] for hit in other.suggest('pear')], ['Pear Juice'])
+
+    def test_other_processes_see_keyword_edits(self):
+        """Test a keyword-only edit reaches a second service's suggestions."""
+        other = SuggestionService()
+        self.assertEqual(other.suggest('spa'), [])
+        self.juice.keywords = 'sparkling'
+        self.juice.save()
+        other._checked_at = 0.0
+        self.assertEqual([hit['text'] for hit in other.suggest('spa')], ['sparkling'])
+
+    def test_published_popularity_reweights_without_queries(self):
+        """Test a built index takes new popularity from the cache, not the database."""
+        suggester = get_suggester()
+        suggester.suggest('ap')
+        order = Order.objects.create(
+            user=self.user, order_id='SUGGEST-2', payment_status='completed', payment_mode='COD',
+            order_total_price=60, grand_total=60,
+        )
+        OrderItem.objects.create(order=order, product=self.juice, quantity=10, product_price=6)
+        self.assertEqual([hit['text'] for hit in suggester.suggest('ap')], ['Red Apples', 'Apple Juice'])
+
+        call_command('refresh_suggestions', stdout=StringIO())
+        suggester._checked_at = 0.0
+        with self.assertNumQueries(0):
+            hits = suggester.suggest('ap')
+        self.assertEqual([hit['text'] for hit in hits], ['Apple Juice', 'Red Apples'])
+        self.assertEqual(suggester.index.lookup('fruit')[0]['text'], 'Fruit')
+
+    def test_suggestions_endpoint(self):
+        """Test the JSON endpoint answers from the prefix index."""
+        response = Client().get(reverse('search:search_suggestions'), {'q': 'red', 'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['suggestions'][0]['text'], 'Red Apples')
+        response = Client().get(reverse('search:search_suggestions'), {'q': 'r'})
+        self.assertEqual(response.json(), {'suggestions': []})
+
+
+class SearchIndexQueueTestCase(TestCase):
+    """Test deferred indexing through the queue."""
+
+    def setUp(self):
+        """Create a category with products and an offline indexer."""
+        self.indexer = LocalIndexer()
+        self.fruit = Category.objects.create(category_name='Fruit', category_image='')
+        self.products = [
+            Product.objects.create(
+                product_name=f'Fruit {i}', category=self.fruit, price=i, product_desription='Fresh',
+            )
+            for i in range(3)
+        ]
+
+    def test_saves_only_enqueue(self):
+        """Test repeated changes leave one queue row per object."""
+        for product in self.products:
+            product.save()
+        self.assertEqual(SearchIndexQueue.objects.filter(model_name='product').count(), 3)
+        self.assertEqual(SearchIndexQueue.objects.filter(model_name='category').count(), 1)
+        self.assertEqual(self.indexer.documents['product'], {})
+
+    def test_worker_indexes_in_batches(self):
+        """Test a batch costs one load query per model and one bulk call each."""
+        with self.assertNumQueries(11):
+            # claim, then a load and a delete per model, plus savepoints
+            self.assertEqual(process_batch(indexer=self.indexer), 4)
+        self.assertEqual(self.indexer.bulk_calls, 2)
+        self.assertEqual(self.indexer.documents['category'][str(self.fruit.pk)]['product_count'], 3)
+        self.assertEqual(
+            self.indexer.documents['product'][str(self.products[0].pk)]['category_name'], 'Fruit'
+        )
+        self.assertFalse(SearchIndexQueue.objects.exists())
+
+    def test_deleted_objects_leave_the_index(self):
+        """Test a queued object that no longer exists is deleted from the index."""
+        drain(indexer=self.indexer)
+        self.products[0].delete()
+        self.assertEqual(drain(batch_size=1, indexer=self.indexer), 1)
+        self.assertNotIn(str(self.products[0].pk), self.indexer.documents['product'])
+        self.assertEqual(len(self.indexer.documents['product']), 2)
+
+    def test_bulk_stock_and_rating_writes_enqueue(self):
+        """Test writes that skip the model signals still queue their products."""
+        first, second, third = self.products
+        for product in self.products:
+            Product.objects.filter(pk=product.pk).update(stock_quantity=5)
+        drain(indexer=self.indexer)
+
+        reserve_stock([(first.pk, 5)])
+        apply_stock_updates([{'product_id': str(second.pk), 'action': 'add', 'quantity': 2}])
+        apply_rating_delta(third.pk, 4, 1)
+        self.assertEqual(
+            set(SearchIndexQueue.objects.values_list('object_id', flat=True)),
+            {str(first.pk), str(second.pk), str(third.pk)},
+        )
+        drain(indexer=self.indexer)
+        documents = self.indexer.documents['product']
+        self.assertFalse(documents[str(first.pk)]['is_in_stock'])
+        self.assertEqual(documents[str(second.pk)]['stock_quantity'], 7)
+        self.assertEqual(documents[str(third.pk)]['rating_avg'], 4.0)
+
+    def test_failures_stay_queued(self):
+        """Test entries of a failed bulk call are kept with the error."""
+        class BrokenIndexer(LocalIndexer):
+            def index(self, model_name, objects):
+                raise ConnectionError('search server down')
+
+        process_batch(indexer=BrokenIndexer())
+        entry = SearchIndexQueue.objects.filter(model_name='product').first()
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.last_error, 'search server down')
+        self.assertEqual(drain(indexer=self.indexer), 4)
+
+    def test_full_reindex_streams_the_catalog(self):
+        """Test the reindex sends chunks and clears what it covered."""
+        self.assertEqual(reindex_all(chunk_size=2, indexer=self.indexer), {'product': 3, 'category': 1})
+        self.assertEqual(self.indexer.bulk_calls, 3)
+        self.assertFalse(SearchIndexQueue.objects.exists())